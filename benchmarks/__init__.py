@@ -0,0 +1,10 @@
+"""
+Throughput benchmarks for the simulator, the environments and training.
+
+Run from the root of the repository:
+
+python -m benchmarks run -o benchmarks/results.json
+python -m benchmarks compare benchmarks/baseline.json benchmarks/results.json
+
+See benchmarks/__main__.py for the options.
+"""
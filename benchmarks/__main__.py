@@ -0,0 +1,79 @@
+"""
+Command line interface of the benchmarks, run from the root of the repository.
+
+python -m benchmarks run [options]:  Runs the benchmarks and saves the results as JSON
+
+-o:  The output JSON file (default is benchmarks/results.json)
+-b:  Which benchmarks to run, any of single_step, energy, reset, env_step and ppo2 (default is all)
+--lattice-points, --force-points, --timepoints, --batch-sizes:  The values of num_lattice_points,
+    num_force_points, timepoints_per_step and the batch size to sweep over
+--min-time:  The minimum duration of each timed repeat in seconds (default is 0.2)
+--config:  The config the benchmarked systems are built from (default is configs/config.yml)
+
+python -m benchmarks compare <baseline> <current> [--tolerance t]:  Compares two runs and flags
+    every result whose rate dropped by more than the fraction t (default is 0.1) as a regression.
+    Exits with status 1 if there are regressions.
+"""
+import argparse
+import json
+import os
+import sys
+
+from .suite import BENCHMARKS, SWEEP_PARAMETERS, load_config, run_benchmarks, compare_results
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run',help='Run the benchmarks')
+    run_parser.add_argument('-o',dest='output_filename',
+        help='Where to save the results',default='benchmarks/results.json',type=str)
+    run_parser.add_argument('-b',dest='benchmarks',nargs='+',choices=list(BENCHMARKS),
+        help='Which benchmarks to run',default=list(BENCHMARKS))
+    run_parser.add_argument('--lattice-points',dest='num_lattice_points',nargs='+',type=int,
+        help='The numbers of lattice points to sweep over',default=SWEEP_PARAMETERS['num_lattice_points'])
+    run_parser.add_argument('--force-points',dest='num_force_points',nargs='+',type=int,
+        help='The numbers of force points to sweep over',default=SWEEP_PARAMETERS['num_force_points'])
+    run_parser.add_argument('--timepoints',dest='timepoints_per_step',nargs='+',type=int,
+        help='The timepoints per step to sweep over',default=SWEEP_PARAMETERS['timepoints_per_step'])
+    run_parser.add_argument('--batch-sizes',dest='batch_size',nargs='+',type=int,
+        help='The batch sizes to sweep over',default=SWEEP_PARAMETERS['batch_size'])
+    run_parser.add_argument('--min-time',dest='min_time',
+        help='The minimum duration of each timed repeat',default=0.2,type=float)
+    run_parser.add_argument('--config',dest='config_path',
+        help='The config to build the benchmarked systems from',default=None,type=str)
+
+    compare_parser = subparsers.add_parser('compare',help='Compare a run against a baseline')
+    compare_parser.add_argument('baseline',help='The baseline results',type=str)
+    compare_parser.add_argument('current',help='The results to check',type=str)
+    compare_parser.add_argument('--tolerance',dest='tolerance',
+        help='The relative slowdown that counts as a regression',default=0.1,type=float)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sweep = {key:getattr(args,key) for key in SWEEP_PARAMETERS}
+        results = run_benchmarks(args.benchmarks,sweep,load_config(args.config_path),args.min_time)
+        output_dir = os.path.dirname(args.output_filename)
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        with open(args.output_filename,'w') as output_file:
+            json.dump(results,output_file,indent=2)
+    elif args.command == 'compare':
+        with open(args.baseline,'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        with open(args.current,'r') as current_file:
+            current = json.load(current_file)
+        comparison = compare_results(baseline,current,args.tolerance)
+        for row in comparison:
+            flag = 'REGRESSION' if row['regression'] else ''
+            print('{:12s} {:60s} {:14.1f} {:14.1f} {:6.2f}x {}'.format(row['benchmark'],str(row['params']),
+                row['baseline'],row['current'],row['ratio'],flag))
+        num_regressions = sum(row['regression'] for row in comparison)
+        print('{} of {} results regressed by more than {:.0%}'.format(num_regressions,len(comparison),args.tolerance))
+        if num_regressions > 0:
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+The benchmarks and the machinery to time them.
+
+Every benchmark builds its system from configs/config.yml with the swept parameters overridden,
+and reports a rate (higher is better) measured as the best of several repeats, each of which
+runs the benchmarked call for at least min_time seconds.
+"""
+
+import datetime
+import itertools
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import scipy
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT,'src'))
+
+from environments.active_damping_env import VibratingBridge
+from environments.kernels import HAVE_NUMBA
+from environments.simulators import make_simulator
+
+# The parameters the benchmarks are swept over, and their default values
+SWEEP_PARAMETERS = {'num_lattice_points':[20,200],
+                    'num_force_points':[3],
+                    'timepoints_per_step':[1,10],
+                    'batch_size':[1,32]}
+
+def load_config(config_path=None):
+    """
+    Loads the config the benchmarked systems are built from, configs/config.yml by default
+    """
+    if config_path is None:
+        config_path = os.path.join(ROOT,'configs','config.yml')
+    with open(config_path,'r') as ymlfile:
+        return yaml.load(ymlfile,Loader=yaml.FullLoader)
+
+def benchmark_config(base_config,params):
+    """
+    Returns a copy of base_config with the swept parameters set.  Nothing is recorded, and for the
+    finite difference simulator the time interval is reduced if needed to keep the scheme stable
+    at the benchmarked lattice size
+    """
+    config = dict(base_config)
+    for key,value in params.items():
+        if key != 'batch_size':
+            config[key] = value
+    config['record_mode'] = 'none'
+    config['reset_bank_size'] = 0
+    if config.get('simulator','finite_difference') == 'finite_difference':
+        dx = config['system_length']/config['num_lattice_points']
+        config['time_interval'] = min(config['time_interval'],0.9*dx/config['wave_speed'])
+    return config
+
+def measure(function,num_calls=1,min_time=0.2,repeats=3):
+    """
+    Times function and returns its best rate over repeats
+
+    Inputs:
+        function: The function to time, called without arguments
+        num_calls: How many calls of the benchmarked operation one call of function makes
+        min_time: The minimum duration of each repeat, in seconds
+        repeats: How many repeats to take the best of
+    Outputs:
+        rate: Calls of the benchmarked operation per second
+    """
+    function()
+    # Find how many calls it takes to fill min_time
+    num_loops = 1
+    while True:
+        start = time.perf_counter()
+        for loop in range(num_loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        num_loops *= 2
+    best = elapsed
+    for repeat in range(repeats - 1):
+        start = time.perf_counter()
+        for loop in range(num_loops):
+            function()
+        best = min(best,time.perf_counter() - start)
+    return num_loops*num_calls/best
+
+def bench_single_step(config,batch_size,min_time):
+    """
+    Dynamics steps per second of the simulator, counting every bridge of the batch
+    """
+    simulator = make_simulator(config,None if batch_size == 1 else batch_size)
+    simulator.take_in_action(np.full(simulator.force_vals.shape,0.1))
+    return measure(simulator.single_step,batch_size,min_time),'steps/s'
+
+def bench_energy(config,batch_size,min_time):
+    """
+    Energy evaluations per second, counting every bridge of the batch
+    """
+    simulator = make_simulator(config,None if batch_size == 1 else batch_size)
+    return measure(simulator.energy,batch_size,min_time),'calls/s'
+
+def bench_reset(config,batch_size,min_time):
+    """
+    Resets per second of the environment, the inverse of the reset latency
+    """
+    if batch_size == 1:
+        env = VibratingBridge(config)
+        env.seed(0)
+        return measure(env.reset,1,min_time),'resets/s'
+    # The batched environment needs stable baselines, only import it when it is benchmarked
+    from environments.batched_damping_env import BatchedVibratingBridge
+    env = BatchedVibratingBridge(config,batch_size)
+    env.seed(0)
+    return measure(env.reset,batch_size,min_time),'resets/s'
+
+def bench_env_step(config,batch_size,min_time):
+    """
+    Environment steps per second, counting every bridge of the batch
+    """
+    if batch_size == 1:
+        env = VibratingBridge(config)
+        env.seed(0)
+        action = np.full(env.action_space.shape,0.1,dtype=np.float32)
+        step = lambda: env.step(action)
+    else:
+        from environments.batched_damping_env import BatchedVibratingBridge
+        env = BatchedVibratingBridge(config,batch_size)
+        env.seed(0)
+        actions = np.full((batch_size,) + env.action_space.shape,0.1,dtype=np.float32)
+        step = lambda: env.step(actions)
+    # Episodes end during the benchmark, so resets are part of the measured throughput
+    return measure(step,batch_size,min_time),'steps/s'
+
+def bench_ppo2(config,batch_size,min_time):
+    """
+    Environment samples per second of PPO2 training, including the policy updates
+    """
+    from stable_baselines.common.policies import MlpPolicy
+    from stable_baselines import PPO2
+    from environments.parallel_envs import make_vec_env
+
+    env = make_vec_env(config,batch_size,'dummy' if batch_size == 1 else 'batched',seed=0)
+    model = PPO2(MlpPolicy,env=env,verbose=0,n_steps=128)
+    num_samples = 128*batch_size
+    rate = measure(lambda: model.learn(total_timesteps=num_samples),num_samples,min_time,repeats=1)
+    env.close()
+    return rate,'samples/s'
+
+# Every benchmark by name
+BENCHMARKS = {'single_step':bench_single_step,
+              'energy':bench_energy,
+              'reset':bench_reset,
+              'env_step':bench_env_step,
+              'ppo2':bench_ppo2}
+
+# The swept parameters that don't change what a benchmark measures, which it is not repeated over
+IGNORED_PARAMETERS = {'single_step':['timepoints_per_step'],
+                      'energy':['timepoints_per_step','num_force_points'],
+                      'reset':['timepoints_per_step']}
+
+def machine_info():
+    """
+    Returns a dict describing the machine and software the benchmarks ran on
+    """
+    info = {'platform':platform.platform(),
+            'processor':platform.processor(),
+            'machine':platform.machine(),
+            'cpu_count':os.cpu_count(),
+            'python':platform.python_version(),
+            'numpy':np.__version__,
+            'scipy':scipy.__version__,
+            'numba':None}
+    if HAVE_NUMBA:
+        import numba
+        info['numba'] = numba.__version__
+    try:
+        import psutil
+        info['memory_gb'] = round(psutil.virtual_memory().total/2**30,1)
+    except ImportError:
+        pass
+    try:
+        commit = subprocess.check_output(['git','rev-parse','HEAD'],cwd=ROOT,stderr=subprocess.DEVNULL)
+        info['git_commit'] = commit.decode('utf-8').strip()
+    except (OSError,subprocess.CalledProcessError):
+        info['git_commit'] = None
+    return info
+
+def run_benchmarks(benchmarks,sweep,base_config,min_time=0.2,verbose=True):
+    """
+    Runs the benchmarks over every combination of the swept parameters
+
+    Inputs:
+        benchmarks: The names of the benchmarks to run, keys of BENCHMARKS
+        sweep: A dict mapping each parameter of SWEEP_PARAMETERS to the list of values to run
+        base_config: The config the swept parameters override
+        min_time: The minimum duration of each timed repeat, in seconds
+        verbose: Whether to print each result as it comes in
+    Outputs:
+        A dict with the machine info, the time of the run and the list of results
+    """
+    results = []
+    for name in benchmarks:
+        ignored = IGNORED_PARAMETERS.get(name,[])
+        keys = [key for key in SWEEP_PARAMETERS if key not in ignored]
+        for values in itertools.product(*[sweep[key] for key in keys]):
+            params = dict(zip(keys,values))
+            config = benchmark_config(base_config,params)
+            try:
+                rate,unit = BENCHMARKS[name](config,params['batch_size'],min_time)
+            except ImportError as error:
+                # PPO2 and the batched environments need stable baselines, only the combinations
+                # that use them are skipped
+                if verbose:
+                    print('{:12s} {:60s} skipped: {}'.format(name,str(params),error))
+                continue
+            results.append({'benchmark':name,'params':params,'rate':rate,'unit':unit})
+            if verbose:
+                print('{:12s} {:60s} {:14.1f} {}'.format(name,str(params),rate,unit))
+    return {'machine':machine_info(),
+            'timestamp':datetime.datetime.now().isoformat(),
+            'results':results}
+
+def result_key(result):
+    """
+    Identifies a result by its benchmark and parameters, for matching results across runs
+    """
+    return (result['benchmark'],tuple(sorted(result['params'].items())))
+
+def compare_results(baseline,current,tolerance=0.1):
+    """
+    Compares the rates of two benchmark runs
+
+    Inputs:
+        baseline, current: Benchmark runs as returned by run_benchmarks
+        tolerance: The relative slowdown beyond which a result counts as a regression
+    Outputs:
+        A list of dicts, one per result present in both runs, with the benchmark, params,
+            both rates, their ratio (current over baseline) and whether it regressed
+    """
+    baseline_rates = {result_key(result):result['rate'] for result in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        key = result_key(result)
+        if key not in baseline_rates:
+            continue
+        ratio = result['rate']/baseline_rates[key]
+        comparison.append({'benchmark':result['benchmark'],
+                           'params':result['params'],
+                           'baseline':baseline_rates[key],
+                           'current':result['rate'],
+                           'ratio':ratio,
+                           'regression':ratio < 1.0 - tolerance})
+    return comparison
@@ -0,0 +1,281 @@
+"""
+Callbacks for training with stable baselines.
+"""
+import io
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+
+import tensorflow as tf
+from stable_baselines.common.callbacks import BaseCallback
+
+from environments.profiling import merge_profiles
+
+def collect_profile(env):
+    """
+    Returns the profile of a vectorized environment, merged over its environments
+
+    Inputs:
+        env:  A vectorized environment of profiled VibratingBridge environments, or a
+            BatchedVibratingBridge, which profiles the whole batch at once
+    """
+    if hasattr(env,'get_profile'):
+        return env.get_profile()
+    return merge_profiles(env.env_method('get_profile'))
+
+class ProfileCallback(BaseCallback):
+    """
+    Writes the phase timings of environments built with the profile config key to tensorboard at
+    the end of every rollout.  For each phase it logs the seconds spent in it during the rollout,
+    summed over the environments, and its mean time per call so far.  It also logs the wall time of
+    each rollout and of each policy update between rollouts.
+    """
+
+    def __init__(self,log_dir,verbose=0):
+        """
+        Inputs:
+            log_dir:  The directory the tensorboard summaries are written to
+            verbose:  The verbosity of the callback
+        """
+        BaseCallback.__init__(self,verbose)
+        self.log_dir = log_dir
+        self.writer = None
+        self.rollout_start = None
+        self.update_start = None
+        # The total time of each phase at the end of the previous rollout
+        self.previous_total_time = {}
+
+    def write_scalars(self,scalars):
+        """
+        Writes a dict of scalar summaries at the current number of timesteps
+        """
+        summary = tf.Summary(value=[tf.Summary.Value(tag=tag,simple_value=value)
+                                    for tag,value in scalars.items()])
+        self.writer.add_summary(summary,self.num_timesteps)
+
+    def _on_training_start(self):
+        self.writer = tf.summary.FileWriter(self.log_dir)
+
+    def _on_rollout_start(self):
+        self.rollout_start = time.perf_counter()
+        if self.update_start is not None:
+            self.write_scalars({'profile/update_time':self.rollout_start - self.update_start})
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        self.update_start = time.perf_counter()
+        scalars = {'profile/rollout_time':self.update_start - self.rollout_start}
+        for name,stats in collect_profile(self.training_env).items():
+            previous_total_time = self.previous_total_time.get(name,0.0)
+            scalars['profile/{}/rollout_time'.format(name)] = stats['total_time'] - previous_total_time
+            scalars['profile/{}/mean_time'.format(name)] = stats['mean_time']
+            self.previous_total_time[name] = stats['total_time']
+        self.write_scalars(scalars)
+
+    def _on_training_end(self):
+        self.writer.flush()
+        self.writer.close()
+
+def make_profile_callback(config,tensorboard_log_dir):
+    """
+    Returns a ProfileCallback writing to the profile subdirectory of tensorboard_log_dir if the
+    profile key of config is set, and None otherwise
+    """
+    if not config.get('profile',False):
+        return None
+    return ProfileCallback(os.path.join(tensorboard_log_dir,'profile'))
+
+def get_rng_states(env):
+    """
+    Returns the states of the random number generators of the environments of a vectorized
+    environment, one per environment (or one for a BatchedVibratingBridge)
+    """
+    if hasattr(env,'get_rng_state'):
+        return [env.get_rng_state()]
+    return env.env_method('get_rng_state')
+
+def set_rng_states(env,states):
+    """
+    Restores the random number generator states returned by get_rng_states
+    """
+    if hasattr(env,'set_rng_state'):
+        env.set_rng_state(states[0])
+        return
+    for index,state in enumerate(states):
+        env.env_method('set_rng_state',state,indices=index)
+
+def write_atomic(path,data):
+    """
+    Writes bytes to path through a temporary file, so a killed run never leaves a partial file
+    """
+    with open(path + '.tmp','wb') as out_file:
+        out_file.write(data)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(path + '.tmp',path)
+
+def load_checkpoint_index(checkpoint_dir):
+    """
+    Returns the index of the checkpoints in checkpoint_dir, a dict with the list of kept
+    checkpoints (oldest first) and the best one, or None if there are no checkpoints yet.  Each
+    checkpoint is a dict with the file names of the model and of the rng states, its num_timesteps
+    and its score
+    """
+    index_path = os.path.join(checkpoint_dir,'checkpoints.json')
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path,'r') as index_file:
+        return json.load(index_file)
+
+def latest_checkpoint(checkpoint_dir):
+    """
+    Returns the newest checkpoint in checkpoint_dir as a dict with the path of the model, its
+    num_timesteps and the rng states of the environments, or None if there are no checkpoints
+    """
+    index = load_checkpoint_index(checkpoint_dir)
+    if index is None or len(index['checkpoints']) == 0:
+        return None
+    checkpoint = index['checkpoints'][-1]
+    with open(os.path.join(checkpoint_dir,checkpoint['rng_file']),'rb') as rng_file:
+        rng_states = pickle.load(rng_file)
+    return {'path':os.path.join(checkpoint_dir,checkpoint['model_file']),
+            'num_timesteps':checkpoint['num_timesteps'],
+            'rng_states':rng_states}
+
+class CheckpointCallback(BaseCallback):
+    """
+    Saves the agent every checkpoint_every timesteps, with the number of timesteps so far and the
+    rng states of the training environments so training can resume where it left off.  The agent
+    is serialized in memory on the training thread, and the files are written by a background
+    thread so training doesn't wait on the disk.  The last keep_checkpoints checkpoints are kept,
+    and if a score function is given the best scoring checkpoint is also kept as best.pkl.  A run
+    that doesn't resume starts a new index, so it never prunes or ranks against an earlier run's
+    checkpoints.
+    """
+
+    def __init__(self,checkpoint_dir,checkpoint_every,keep_checkpoints=3,score_function=None,resume=True,
+                 verbose=0):
+        """
+        Inputs:
+            checkpoint_dir:  The directory the checkpoints and their index are written to
+            checkpoint_every:  (int > 0) How many timesteps between checkpoints
+            keep_checkpoints:  (int > 0) How many of the newest checkpoints to keep
+            score_function:  Optionally, a function of the model returning its score, higher
+                is better, used to keep the best checkpoint
+            resume:  Whether the run resumes from the checkpoints in checkpoint_dir, and so carries on
+                their index
+            verbose:  The verbosity of the callback
+        """
+        BaseCallback.__init__(self,verbose)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.keep_checkpoints = keep_checkpoints
+        self.score_function = score_function
+        self.resume = resume
+        self.index = None
+        self.last_checkpoint = 0
+        self.write_queue = None
+        self.writer_thread = None
+        self.write_error = None
+
+    def _on_training_start(self):
+        if not os.path.isdir(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+        # Carry on the index of a resumed run, a new run replaces it right away so that the
+        # checkpoints of an earlier run are never resumed from again
+        self.index = None
+        if self.resume:
+            self.index = load_checkpoint_index(self.checkpoint_dir)
+        if self.index is None:
+            self.index = {'checkpoints':[],'best':None}
+            self.write_index()
+        self.last_checkpoint = self.num_timesteps
+        self.write_queue = queue.Queue()
+        self.writer_thread = threading.Thread(target=self.write_checkpoints,daemon=True)
+        self.writer_thread.start()
+
+    def _on_step(self):
+        if self.write_error is not None:
+            raise self.write_error
+        if self.num_timesteps - self.last_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+        return True
+
+    def _on_training_end(self):
+        self.write_queue.put(None)
+        self.writer_thread.join()
+        if self.write_error is not None:
+            raise self.write_error
+
+    def checkpoint(self):
+        """
+        Snapshots the agent, the timesteps and the rng states and queues them to be written
+        """
+        self.last_checkpoint = self.num_timesteps
+        model_bytes = io.BytesIO()
+        self.model.save(model_bytes)
+        rng_bytes = pickle.dumps(get_rng_states(self.training_env))
+        score = None if self.score_function is None else float(self.score_function(self.model))
+        self.write_queue.put((self.num_timesteps,score,model_bytes.getvalue(),rng_bytes))
+
+    def write_checkpoints(self):
+        """
+        Writes the queued checkpoints until training ends, runs on the writer thread
+        """
+        while True:
+            task = self.write_queue.get()
+            if task is None:
+                return
+            if self.write_error is None:
+                try:
+                    self.write_checkpoint(*task)
+                except Exception as error:
+                    self.write_error = error
+
+    def write_checkpoint(self,num_timesteps,score,model_bytes,rng_bytes):
+        """
+        Writes a checkpoint, drops the ones that are no longer kept and updates the index
+        """
+        checkpoint = {'model_file':'checkpoint_{}.pkl'.format(num_timesteps),
+                      'rng_file':'checkpoint_{}_rng.pkl'.format(num_timesteps),
+                      'num_timesteps':num_timesteps,'score':score}
+        write_atomic(os.path.join(self.checkpoint_dir,checkpoint['model_file']),model_bytes)
+        write_atomic(os.path.join(self.checkpoint_dir,checkpoint['rng_file']),rng_bytes)
+        best = self.index['best']
+        if score is not None and (best is None or score > best['score']):
+            write_atomic(os.path.join(self.checkpoint_dir,'best.pkl'),model_bytes)
+            self.index['best'] = {'model_file':'best.pkl','num_timesteps':num_timesteps,'score':score}
+        # The new checkpoint replaces any entry of the same file, which it has just overwritten
+        checkpoints = [old_checkpoint for old_checkpoint in self.index['checkpoints']
+                       if old_checkpoint['model_file'] != checkpoint['model_file']] + [checkpoint]
+        dropped = checkpoints[:-self.keep_checkpoints]
+        self.index['checkpoints'] = checkpoints[-self.keep_checkpoints:]
+        # Update the index before removing files, so it never points to a missing checkpoint
+        self.write_index()
+        for old_checkpoint in dropped:
+            for fname in [old_checkpoint['model_file'],old_checkpoint['rng_file']]:
+                if os.path.isfile(os.path.join(self.checkpoint_dir,fname)):
+                    os.remove(os.path.join(self.checkpoint_dir,fname))
+
+    def write_index(self):
+        """
+        Writes the index of the kept checkpoints to checkpoints.json
+        """
+        write_atomic(os.path.join(self.checkpoint_dir,'checkpoints.json'),
+                     json.dumps(self.index,indent=2).encode('utf-8'))
+
+def make_checkpoint_callback(config,score_function=None,resume=True):
+    """
+    Returns a CheckpointCallback writing to the checkpoint_dir key of config if its
+    checkpoint_every key is positive, and None otherwise.  resume says whether the run resumes
+    from the checkpoints already there
+    """
+    if config.get('checkpoint_every',0) <= 0:
+        return None
+    return CheckpointCallback(config.get('checkpoint_dir','checkpoints'),config['checkpoint_every'],
+                              config.get('keep_checkpoints',3),score_function,resume)
@@ -5,9 +5,12 @@ from __future__ import print_function
 import numpy as np
 import gym
 from gym.spaces import Box, Tuple, Discrete
-from gym.envs.classic_control import rendering
-from .finite_diff_wave import Wave1D
-import random
+from gym.utils import seeding
+from .finite_diff_wave import RECORDABLE
+from .simulators import make_simulator
+from .trajectory import make_recorder
+from .reset_bank import load_reset_bank
+from .profiling import make_profiler
 
 import pickle
 import os
@@ -48,6 +51,37 @@ class VibratingBridge(gym.Env):
                 the finite difference scheme
             drive_magnitude: The L2 magnitude of the drivinge force of the warmup period
 
+            and optionally the following keys:
+
+            record_mode: (none, ring, full or stream) how much of the trajectory to record for rendering,
+                defaults to full
+            record_buffer_size: (int > 0) how many dynamics steps the ring record_mode keeps
+            record_every: (int > 0) only every record_every-th dynamics step is recorded, defaults to 1
+            record_path: the directory the stream record_mode writes to
+            stream_chunk_size: (int > 0) how many dynamics steps the stream record_mode stores per file
+            stream_compress: (bool) whether the stream record_mode compresses its files
+            reset_bank_size: (int >= 0) if > 0, reset draws from a bank of this many pregenerated
+                post-equilibriation states instead of simulating the warmup and equilibriation phases
+            reset_bank_dir: the directory the reset bank is stored in
+            track_threshold: (bool) whether to count, in the info dict returned by step, how many damping
+                dynamics steps it takes for the relative energy to fall below threshold.  The info dict
+                then also holds the relative energy at the end of the step
+            threshold: (float between 0 and 1) the relative energy threshold for track_threshold
+            simulator: (finite_difference, modal or implicit) which simulator runs the dynamics, defaults to
+                finite_difference, see simulators.py
+            backend: (numpy or numba) how the finite_difference simulator runs the dynamics, see Wave1D
+            dtype: (float32 or float64) the precision of the simulation, see Wave1D
+            energy_dtype: (float32 or float64) the precision the energy and reward are evaluated in
+            observation_mode: (full or height_velocity) what the observations hold, see Wave1D
+            observation_encoder: (lattice, sensors, modal or pooled) what the observations cover, see
+                observation_encoders.py
+            num_sensors: (int >= 0) how many evenly spaced lattice points the sensors encoder covers
+            num_observed_modes: (int > 0) how many sine modes the modal encoder observes
+            pool_size: (int > 0) how many lattice points the pooled encoder averages over
+            profile: (bool) whether to time the phases of reset and step, see get_profile.  The info dict
+                returned by step then also holds the seconds spent in each phase since the last step
+            seed: (int or None) the seed of the random number generator that draws the warmup drives,
+                a random one if None, see seed
 
         """
 
@@ -63,22 +97,41 @@ class VibratingBridge(gym.Env):
         self.max_steps = config['max_steps']
         self.Nx = config['num_lattice_points']
         self.drive_magnitude = config['drive_magnitude']
-        # Load the simulator class, thi is the line to change if you
-        # use a different method for simulating the dynamics
-        self.simulator = Wave1D(config)
+        # Whether to track the time it takes to dissipate the energy below threshold
+        self.track_threshold = config.get('track_threshold',False)
+        self.threshold = config.get('threshold',0.0)
+        # Load the simulator selected by the simulator key of the config
+        self.simulator = make_simulator(config)
+        # Pregenerated post-equilibriation states, None if reset simulates them
+        self.reset_bank = load_reset_bank(config)
+        # Times the phases of reset and step if the profile key is set, otherwise does nothing
+        self.profiler = make_profiler(config)
 
         # Build up the action space
         self.action_space = Box(low=self.min_force,high=self.max_force,
                                 shape=(self.num_force_points,),dtype=np.float32)
-        # Build up the observation space
+        # Build up the observation space, its shape depends on the observation_mode and observation_encoder keys
         self.observation_space = Box(low=self.min_u,high=self.max_u,
-                                     shape=(1,self.Nx+1,3),dtype=np.float32)
+                                     shape=self.simulator.observation_shape,dtype=np.float32)
+        # Draws the warmup drives and the states of the reset bank, seeded before the first reset
+        self.np_random = None
+        self.seed(config.get('seed'))
 
         # Allocate for trajectories
-        self.height_traj = []
-        self.impulse_traj = []
-        self.energy_traj = []
-        self.code_traj = []
+        self.recorder = make_recorder(config,self.simulator.x_mesh)
+        self.record_every = self.recorder.record_every
+        # What the simulator records for the recorder (recorded), and for both the recorder and the
+        # damping step count or equilibriation energy (tracked), which need the energy of every step
+        self.recorded = RECORDABLE if self.recorder.active else ()
+        self.tracked = RECORDABLE if self.recorder.active else ('energy',)
+        # Output buffers for the simulator's advance, large enough for every phase of an episode
+        num_records = max(self.num_warmup_steps,self.num_equi_steps,self.timepoints_per_step)
+        self.records = self.simulator.allocate_records(num_records)
+        # Observations are written into two float32 buffers in turn, so an observation stays valid
+        # through the next call to step or reset, which the vectorized environments rely on to
+        # return the terminal observation of an episode
+        self.observation_buffers = np.zeros((2,) + self.observation_space.shape,dtype=np.float32)
+        self.observation_index = 0
         self.reset()
 
     def reset(self):
@@ -88,48 +141,45 @@ class VibratingBridge(gym.Env):
         """
         # Reset the step_number
         self.step_number = 0
+        # Reset the count of damping steps before the energy fell below threshold
+        self.damping_steps = 0
+        self.threshold_reached = False
         # Clear out cache of trajectories
-        self.height_traj = []
-        self.impulse_traj = []
-        self.energy_traj = []
-        self.code_traj = [] # For rendering functions to track stage of simulation
+        self.recorder.clear()
         # Use the simulator's reset method, note that this also
         self.simulator.reset()
 
-        # Random fixed action to warm up system
-        action = self.action_space.sample()
+        # Start from a pregenerated state, the warmup and equilibriation phases aren't recorded
+        if self.reset_bank is not None:
+            with self.profiler.phase('reset_bank'):
+                state, self.equi_energy = self.reset_bank.sample(self.np_random)
+                self.simulator.set_state(state)
+            with self.profiler.phase('observation'):
+                return self.get_observation()
+
+        # Random fixed action to warm up system, drawn like the warmup drives of the batched environment
+        action = self.np_random.uniform(low=self.min_force,high=self.max_force,size=self.num_force_points)
         # Normalize it to make it larger
         action_mag = np.sqrt(np.sum(action**2))
         action *= self.drive_magnitude/action_mag
         self.simulator.take_in_action(action)
         # Run some warmup steps
-        for t in range(self.num_warmup_steps):
-            self.height_traj.append(np.copy(self.simulator.height))
-            self.energy_traj.append(self.simulator.energy())
-            self.impulse_traj.append(np.copy(self.simulator.get_impulse_profile()))
-            self.simulator.single_step()
-            self.code_traj.append(0)
+        with self.profiler.phase('warmup'):
+            self.run_phase(self.num_warmup_steps,0)
 
         # Don't perturb system, let it equilibriate
-        empty_action = 0.0*self.action_space.sample()
+        empty_action = np.zeros(self.num_force_points)
         self.simulator.take_in_action(empty_action)
         # equi_energy will be used for instance normalization
-        self.equi_energy = 0
-        for t in range(self.num_equi_steps):
-            self.height_traj.append(np.copy(self.simulator.height))
-            self.energy_traj.append(self.simulator.energy())
-            self.equi_energy += self.simulator.energy()
-            self.impulse_traj.append(np.copy(self.simulator.get_impulse_profile()))
-            self.simulator.single_step()
-            self.code_traj.append(1)
+        with self.profiler.phase('equilibriation'):
+            self.equi_energy = self.run_phase(self.num_equi_steps,1)
         # Divide equi_energy by num_equi_steps
         self.equi_energy /= self.num_equi_steps
         # Normalize the current energy_trajectory
-        for i in range(len(self.energy_traj)):
-            self.energy_traj[i] /= self.equi_energy
-
+        self.recorder.normalize_energy(self.equi_energy)
 
-        observation = self.simulator.get_observation()
+        with self.profiler.phase('observation'):
+            observation = self.get_observation()
         return observation
 
     def step(self,action):
@@ -138,30 +188,38 @@ class VibratingBridge(gym.Env):
         we parameterize the impulse using parameters from action
         """
 
+        profiler = self.profiler
         # First we update the simulator's impulse profile using the action
-        self.simulator.take_in_action(action)
+        with profiler.phase('action'):
+            self.simulator.take_in_action(action)
 
         # Take in energy before running dynamics
-        starting_energy = self.simulator.energy()/self.equi_energy
+        with profiler.phase('energy'):
+            starting_energy = self.simulator.energy()/self.equi_energy
 
-        # Run the dynamics with the fixed impulse for a fixed number of timepoints
-        for t in range(self.timepoints_per_step):
-            self.simulator.single_step()
-            # Record things
-            self.energy_traj.append(self.simulator.energy()/self.equi_energy)
-            self.height_traj.append(np.copy(self.simulator.height))
-            self.impulse_traj.append(np.copy(self.simulator.get_impulse_profile()))
-            self.code_traj.append(2)
+        # Run the dynamics with the fixed impulse for a fixed number of timepoints, the energies of
+        # the dynamics steps needed for tracking or recording are part of this phase
+        with profiler.phase('dynamics'):
+            if self.track_threshold:
+                records = self.simulator.advance(self.timepoints_per_step,1,self.tracked,self.records)
+                self.count_damping_steps(records['energy']/self.equi_energy)
+            else:
+                records = self.simulator.advance(self.timepoints_per_step,self.record_every,self.recorded,self.records)
+        # Record things
+        if self.recorder.active:
+            with profiler.phase('recording'):
+                self.recorder.record_steps(records['step'],records['height'],records['impulse'],
+                                           records['energy']/self.equi_energy,2)
 
         # Take in energy after runing dynamics
-        ending_energy = self.simulator.energy()/self.equi_energy
+        with profiler.phase('energy'):
+            ending_energy = self.simulator.energy()/self.equi_energy
 
         # Reward is positive if energy is reduced
         reward = starting_energy - ending_energy
 
-        observation = self.simulator.get_observation()
-        # Properly bound the observation
-        clipped_observation = np.clip(observation,self.min_u,self.max_u)
+        with profiler.phase('observation'):
+            clipped_observation = self.get_observation()
 
         # Update step number and check to see if epoch is over
         self.step_number += 1
@@ -170,17 +228,108 @@ class VibratingBridge(gym.Env):
         else:
             done = False
 
-        return clipped_observation,reward,done,{}
+        info = {}
+        if self.track_threshold:
+            info['damping_steps'] = self.damping_steps
+            info['threshold_reached'] = self.threshold_reached
+            info['energy'] = ending_energy
+        if profiler.enabled:
+            # Includes the phases of the reset since the last step, if there was one
+            info['profile'] = profiler.pop_recent()
+
+        return clipped_observation,reward,done,info
+
+    def get_profile(self):
+        """
+        Returns the number of calls, total time and mean time in seconds of each phase of reset and
+        step timed so far, an empty dict unless the profile key of the config is set
+        """
+        return self.profiler.get_profile()
+
+    def get_observation(self):
+        """
+        Writes the properly bounded observation into the next observation buffer and returns it
+        """
+        self.observation_index = 1 - self.observation_index
+        observation = self.simulator.get_observation(self.observation_buffers[self.observation_index])
+        return np.clip(observation,self.min_u,self.max_u,out=observation)
+
+    def run_phase(self,num_steps,code):
+        """
+        Runs the warmup (code 0) or equilibriation (code 1) phase of an episode with the current
+        action, recording the state at the start of each of its dynamics steps
+
+        Inputs:
+            num_steps - (int > 0) how many dynamics steps the phase lasts
+            code - The phase, as passed to the recorder
+        Outputs:
+            The sum of the energies at the start of every step of the equilibriation phase, None for
+            the warmup phase
+        """
+        # The start of the first step is the current state, advance returns the starts of the others
+        energy = self.simulator.energy() if code == 1 or self.recorder.active else None
+        if self.recorder.active:
+            self.recorder.record_step(self.simulator.n,self.simulator.height,self.simulator.get_impulse_profile(),
+                                      energy,code)
+        if code == 1:
+            records = self.simulator.advance(num_steps - 1,1,self.tracked,self.records)
+        else:
+            records = self.simulator.advance(num_steps - 1,self.record_every,self.recorded,self.records)
+        if self.recorder.active:
+            self.recorder.record_steps(records['step'],records['height'],records['impulse'],records['energy'],code)
+        self.simulator.advance(1)
+        if code == 1:
+            return energy + np.sum(records['energy'])
+
+    def count_damping_steps(self,energies):
+        """
+        Counts the damping steps until the relative energy first falls below threshold
+
+        Inputs:
+            energies - An array of the relative energy after each dynamics step of an environment step
+        """
+        if self.threshold_reached:
+            return
+        below_threshold = np.flatnonzero(energies < self.threshold)
+        if len(below_threshold) > 0:
+            self.damping_steps += int(below_threshold[0])
+            self.threshold_reached = True
+        else:
+            self.damping_steps += len(energies)
+
+    def seed(self,seed=None):
+        """
+        Seeds the random number generator used to draw the warmup drives, so that environments
+        seeded alike run the same episodes for the same actions.  The action space, which only
+        serves random actions to callers, is seeded alike
+
+        Inputs:
+            seed - (int or None) the seed, a random one if None
+        Outputs:
+            A list holding the seed used
+        """
+        self.np_random, seed = seeding.np_random(seed)
+        self.action_space.seed(seed)
+        return [seed]
+
+    def get_rng_state(self):
+        """
+        Returns the state of the random number generator used to draw the warmup drives, so a
+        checkpointed training run can resume the same stream of drives
+        """
+        return self.np_random.get_state()
+
+    def set_rng_state(self,state):
+        """
+        Restores a state of the random number generator returned by get_rng_state
+        """
+        self.np_random.set_state(state)
 
     def render(self,fname='testout'):
         """
-        The render method just saves to file for later animation
+        The render method just saves to file for later animation, it saves whatever
+        part of the trajectory the recorder kept.  With the stream record_mode the trajectory
+        is already on disk, and fname must be the record_path
         """
 
-        height_array = np.stack(self.height_traj,axis=1)
-        impulse_array = np.stack(self.impulse_traj,axis=1)
-        energy_array = np.array(self.energy_traj)
-        code_array = np.array(self.code_traj,dtype=np.int32)
-        np.savez(fname,height_array=height_array,impulse_array=impulse_array,
-                 energy_array=energy_array,code_array=code_array,
-                 x_mesh=self.simulator.x_mesh)
+        self.recorder.save(fname,self.simulator.x_mesh)
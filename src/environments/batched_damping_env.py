@@ -0,0 +1,259 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from gym.spaces import Box
+from gym.utils import seeding
+from stable_baselines.common.vec_env import VecEnv
+from .simulators import make_simulator
+from .reset_bank import load_reset_bank, simulate_warmup
+from .profiling import make_profiler
+
+class BatchedVibratingBridge(VecEnv):
+    """
+    A vectorized version of the VibratingBridge environment that simulates many independent
+    bridges at once.  Instead of holding one VibratingBridge (and one simulator) per environment,
+    all bridges live in a single batched simulator, such as BatchedWave1D, so a step of every environment costs a handful
+    of NumPy calls regardless of how many bridges there are.
+
+    The episode logic (warmup, equilibriation, reward and episode length) matches VibratingBridge.
+    Environments that finish their episode are reset individually and, as with the stable
+    baselines vectorized environments, the last observation of the finished episode is returned
+    in info['terminal_observation'].  Trajectories are not recorded, so there is no render method,
+    but with the track_threshold config key set the info dicts carry the same damping_steps,
+    threshold_reached and energy entries as VibratingBridge.  Likewise with the profile key set,
+    every info dict holds the seconds the whole batch spent in each phase since the last step.
+    """
+
+    def __init__(self,config,num_envs):
+        """
+        Constructor for the BatchedVibratingBridge vectorized environment
+
+        Inputs:
+            config:  A dict containing parameters for the system, with the same keys as VibratingBridge
+            num_envs: (int > 0) how many bridges to simulate in parallel
+        """
+        self.config = config
+        self.num_warmup_steps = config['num_warmup_steps']
+        self.num_equi_steps = config['num_equi_steps']
+        self.num_force_points = config['num_force_points']
+        self.min_force = config['min_force']
+        self.max_force = config['max_force']
+        self.min_u = config['min_u']
+        self.max_u = config['max_u']
+        # How many steps of the dynamics to run in one step of the environment
+        self.timepoints_per_step = config['timepoints_per_step']
+        self.max_steps = config['max_steps']
+        self.Nx = config['num_lattice_points']
+        self.drive_magnitude = config['drive_magnitude']
+        # Whether to track the time it takes to dissipate the energy below threshold
+        self.track_threshold = config.get('track_threshold',False)
+        self.threshold = config.get('threshold',0.0)
+        self.simulator = make_simulator(config,num_envs)
+        # Pregenerated post-equilibriation states, None if resets simulate them
+        self.reset_bank = load_reset_bank(config)
+        # Times the phases of resets and steps if the profile key is set, see VibratingBridge
+        self.profiler = make_profiler(config)
+        # The energy of each bridge after each dynamics step of an environment step
+        self.substep_energies = np.zeros((self.timepoints_per_step,num_envs),dtype=self.simulator.energy_dtype)
+
+        # Build up the action space
+        action_space = Box(low=self.min_force,high=self.max_force,
+                           shape=(self.num_force_points,),dtype=np.float32)
+        # Build up the observation space
+        observation_space = Box(low=self.min_u,high=self.max_u,
+                                shape=self.simulator.observation_shape,dtype=np.float32)
+        VecEnv.__init__(self,num_envs,observation_space,action_space)
+        # Draws the warmup drives of every bridge, seeded before the first reset, see VibratingBridge
+        self.np_random = None
+        self.seed(config.get('seed'))
+
+        self.step_number = np.zeros(num_envs,dtype=np.int64)
+        self.equi_energy = np.ones(num_envs)
+        self.damping_steps = np.zeros(num_envs,dtype=np.int64)
+        self.threshold_reached = np.zeros(num_envs,dtype=bool)
+        self.actions = None
+        # Observations are written into two float32 buffers in turn, see VibratingBridge
+        self.observation_buffers = np.zeros((2,num_envs) + observation_space.shape,dtype=np.float32)
+        self.observation_index = 0
+        self.reset()
+
+    def reset(self):
+        """
+        This resets the state of every bridge in the batch
+        """
+        self.reset_envs(np.arange(self.num_envs))
+        return self.get_observation()
+
+    def reset_envs(self,indices):
+        """
+        Resets a subset of the bridges, either by running the warmup and equilibriation phases
+        for just those bridges or by drawing from the reset bank, and copies the resulting state
+        into the batch
+
+        Inputs:
+            indices - An array of the environment indices to reset
+        """
+        np_random = self.np_random
+        if self.reset_bank is not None:
+            with self.profiler.phase('reset_bank'):
+                state, equi_energy = self.reset_bank.sample(np_random,len(indices))
+        else:
+            # The warmup and equilibriation phases are simulated together
+            with self.profiler.phase('warmup'):
+                state, equi_energy = simulate_warmup(self.config,len(indices),np_random)
+
+        self.simulator.set_state(state,indices)
+        # equi_energy will be used for instance normalization
+        self.equi_energy[indices] = equi_energy
+        self.step_number[indices] = 0
+        self.damping_steps[indices] = 0
+        self.threshold_reached[indices] = False
+
+    def get_observation(self):
+        """
+        Returns the properly bounded observations of every bridge, of shape
+        (self.num_envs,)+self.observation_space.shape, written into the next observation buffer
+        """
+        self.observation_index = 1 - self.observation_index
+        return self.write_observation(self.observation_buffers[self.observation_index])
+
+    def write_observation(self,observation):
+        """
+        Writes the properly bounded observations of every bridge into observation
+        """
+        self.simulator.get_observation(observation)
+        return np.clip(observation,self.min_u,self.max_u,out=observation)
+
+    def step_async(self,actions):
+        """
+        Stores the actions, of shape (self.num_envs,self.num_force_points), for the next step_wait
+        """
+        self.actions = actions
+
+    def step_wait(self):
+        """
+        Runs a step of every bridge in the batch with the actions passed to step_async
+        """
+        profiler = self.profiler
+        with profiler.phase('action'):
+            self.simulator.take_in_action(self.actions)
+
+        # Take in energy before running dynamics
+        with profiler.phase('energy'):
+            starting_energy = self.simulator.energy()/self.equi_energy
+
+        # Run the dynamics with the fixed impulse for a fixed number of timepoints
+        with profiler.phase('dynamics'):
+            self.simulator.run_substeps(self.timepoints_per_step,
+                                        self.substep_energies if self.track_threshold else None)
+            # Count the damping steps until the energy first falls below threshold
+            if self.track_threshold:
+                below_threshold = self.substep_energies/self.equi_energy < self.threshold
+                reached = np.logical_or.accumulate(below_threshold,axis=0) | self.threshold_reached
+                self.damping_steps += np.sum(~reached,axis=0)
+                self.threshold_reached = reached[-1]
+
+        # Take in energy after runing dynamics
+        with profiler.phase('energy'):
+            ending_energy = self.simulator.energy()/self.equi_energy
+
+        # Reward is positive if energy is reduced
+        rewards = (starting_energy - ending_energy).astype(np.float32)
+        with profiler.phase('observation'):
+            observation = self.get_observation()
+
+        # Update step numbers and reset the environments whose episode is over
+        self.step_number += 1
+        dones = self.step_number >= self.max_steps
+        infos = [{} for _ in range(self.num_envs)]
+        if self.track_threshold:
+            for i,info in enumerate(infos):
+                info['damping_steps'] = int(self.damping_steps[i])
+                info['threshold_reached'] = bool(self.threshold_reached[i])
+                info['energy'] = float(ending_energy[i])
+        done_indices = np.flatnonzero(dones)
+        if len(done_indices) > 0:
+            for i in done_indices:
+                infos[i]['terminal_observation'] = np.copy(observation[i])
+            self.reset_envs(done_indices)
+            with profiler.phase('observation'):
+                self.write_observation(observation)
+        if profiler.enabled:
+            profile = profiler.pop_recent()
+            for info in infos:
+                info['profile'] = profile
+
+        return observation,rewards,dones,infos
+
+    def get_profile(self):
+        """
+        Returns the number of calls, total time and mean time in seconds of each phase timed so far,
+        for the whole batch, see VibratingBridge.get_profile
+        """
+        return self.profiler.get_profile()
+
+    def close(self):
+        """
+        There are no external resources to release
+        """
+        pass
+
+    def seed(self,seed=None):
+        """
+        Seeds the random number generator used for the warmup drives of every bridge.  A batch of
+        one bridge runs the same episodes as a VibratingBridge seeded alike
+
+        Inputs:
+            seed - (int or None) the seed, a random one if None
+        Outputs:
+            A list holding the seed used for every environment, since they share the generator
+        """
+        self.np_random, seed = seeding.np_random(seed)
+        self.action_space.seed(seed)
+        return [seed for _ in range(self.num_envs)]
+
+    def get_rng_state(self):
+        """
+        Returns the state of the random number generator used to draw the warmup drives, so a
+        checkpointed training run can resume the same stream of drives
+        """
+        return self.np_random.get_state()
+
+    def set_rng_state(self,state):
+        """
+        Restores a state of the random number generator returned by get_rng_state
+        """
+        self.np_random.set_state(state)
+
+    def _get_indices(self,indices):
+        """
+        Converts an indices argument into a list of environment indices
+        """
+        if indices is None:
+            return range(self.num_envs)
+        elif isinstance(indices,int):
+            return [indices]
+        return indices
+
+    def get_attr(self,attr_name,indices=None):
+        """
+        Returns an attribute of the environment.  All bridges share one object, so every
+        requested index receives the same value
+        """
+        return [getattr(self,attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self,attr_name,value,indices=None):
+        """
+        Sets an attribute of the environment, which is shared by all bridges
+        """
+        setattr(self,attr_name,value)
+
+    def env_method(self,method_name,*method_args,indices=None,**method_kwargs):
+        """
+        Calls a method of the environment once, since all bridges share one object, and
+        returns the result for every requested index
+        """
+        result = getattr(self,method_name)(*method_args,**method_kwargs)
+        return [result for _ in self._get_indices(indices)]
@@ -4,13 +4,54 @@ Some elements of the finite difference routines were adapted from HP Langtangen'
 https://hplgit.github.io/fdm-book/doc/pub/book/html/._fdm-book-solarized001.html
 """
 
+import warnings
 import numpy as np
 from scipy.integrate import simps
+from .kernels import advance, resolve_backend
+from .observation_encoders import make_observation_encoder
+
+def simpson_weights(x,chunk_size=256):
+    """
+    Returns the weights w such that np.dot(w,y) equals simps(y,x) for any y sampled on x.  Simpson's
+    rule is linear in the integrand, so the weights are the integrals of the unit vectors, which are
+    computed in chunks to bound memory.  Going through simps keeps its handling of an even number
+    of points.
+    """
+    num_points = len(x)
+    weights = np.zeros(num_points)
+    for start in range(0,num_points,chunk_size):
+        stop = min(start + chunk_size,num_points)
+        unit_vectors = np.zeros((stop - start,num_points))
+        unit_vectors[np.arange(stop - start),np.arange(start,stop)] = 1.0
+        weights[start:stop] = simps(unit_vectors,x,axis=-1)
+    return weights
+
+def gradient_coefficients(x):
+    """
+    Returns the coefficients a, b and c of the second order finite difference
+    a*f[:-2] + b*f[1:-1] + c*f[2:] that np.gradient(f,x) uses for the interior points of f,
+    and the spacings used for the first order one sided differences at the two ends
+    """
+    dx = np.diff(x)
+    dx1 = dx[:-1]
+    dx2 = dx[1:]
+    a = -(dx2)/(dx1 * (dx1 + dx2))
+    b = (dx2 - dx1) / (dx1 * dx2)
+    c = dx1 / (dx2 * (dx1 + dx2))
+    return a, b, c, dx[0], dx[-1]
+
+# The quantities that Wave1D.advance can record
+RECORDABLE = ('height','impulse','energy')
 
 class Wave1D:
     """
     A utility class for simulating the wave equation in 1 dimension using a finite difference
     """
+    # Leading dimensions of every state array, empty for a single system
+    batch_shape = ()
+    # Whether the scheme is only stable for courant numbers up to 1
+    courant_limited = True
+
     def __init__(self,config):
         """
         Constructor 1 dimensional wave system
@@ -26,9 +67,28 @@ class Wave1D:
             num_force_points: (int > 0) how many pistons the system has
             force_width: (int > 0) how wide the gaussian spread of each piston is
 
+            and optionally the following keys:
+
+            backend: (numpy or numba) how run_substeps advances the dynamics, defaults to numpy.
+                numba falls back to numpy if numba isn't installed
+            dtype: (float32 or float64) the precision of the simulation, defaults to float64
+            energy_dtype: (float32 or float64) the precision the energy is evaluated in, defaults to
+                float64 so that the energy differences that make up the reward stay accurate
+            observation_mode: (full or height_velocity) full observations hold the current time level
+                twice and the previous one, height_velocity observations the current time level and
+                the velocity (height_n - height_nm1)/time_interval.  Defaults to full
+            observation_encoder: (lattice, sensors, modal or pooled) what the observations cover, see
+                observation_encoders.py.  Defaults to sensors if num_sensors > 0 and lattice otherwise
+            num_sensors: (int >= 0) how many evenly spaced interior lattice points the sensors encoder covers
+            num_observed_modes: (int > 0) how many sine modes the modal encoder observes
+            pool_size: (int > 0) how many lattice points the pooled encoder averages over
+
         """
 
         self.dt = config['time_interval']
+        # The precision of the state of the system and of its energy
+        self.dtype = np.dtype(config.get('dtype','float64'))
+        self.energy_dtype = np.dtype(config.get('energy_dtype','float64'))
         self.c_speed = config['wave_speed']
         self.L = config['system_length']
         self.Nx = config['num_lattice_points']
@@ -50,10 +110,21 @@ class Wave1D:
         # The courant number
         self.C = self.c_speed *self.dt/self.dx
         self.C2 = self.C**2 #helper number
+        if self.courant_limited and self.C > 1:
+            warnings.warn('The courant number wave_speed*time_interval/dx is {:.3g} > 1, so the explicit finite '
+                          'difference scheme is unstable.  Reduce time_interval, or use the implicit or modal '
+                          'simulator'.format(self.C))
 
         # Recalibrate the resolutions to account for rounding
         self.dx = self.x_mesh[1] - self.x_mesh[0]
 
+        # The gaussian profile of every piston evaluated on the mesh, shape (self.Nx+1,self.num_force_points).
+        # The mesh and the pistons never move, so an impulse profile is a single product with this basis
+        self.force_basis = np.exp(-0.5*((self.x_mesh[:,np.newaxis]-self.force_locations)**2)/self.force_width)
+        self.force_basis = self.force_basis.astype(self.dtype)
+        # Cached impulse profile for the current force_vals
+        self.impulse_profile = np.zeros(self.batch_shape + (self.Nx + 1,),dtype=self.dtype)
+
         # We set up the conditions of the system before warmup period
 
         # The system is always initially at rest
@@ -63,10 +134,40 @@ class Wave1D:
         self.Initial_Height = lambda x: 0
 
 
-        # Allocate memory for the recursive solution arrays
-        self.height     = np.zeros(self.Nx + 1)   # Solution array at new time level
-        self.height_n   = np.zeros(self.Nx + 1)   # Solution at 1 time level back
-        self.height_nm1 = np.zeros(self.Nx + 1)   # Solution at 2 time levels back
+        # Helper constant for the forcing term
+        self.dt2 = self.dt**2
+
+        # Allocate memory for the recursive solution arrays.  The three time levels are views of
+        # a single backing array that they rotate through as a ring, self.head being the index of
+        # the current level.  After every step the newest time level is both self.height and
+        # self.height_n, so only two levels are live and the third is scratch space that the next
+        # step writes into before the levels rotate
+        state_shape = self.batch_shape + (self.Nx + 1,)
+        self.time_levels = np.zeros((3,) + state_shape,dtype=self.dtype)
+        self.head = 1
+        self.height_nm1 = self.time_levels[0]   # Solution at 1 time level back
+        self.height_n   = self.time_levels[1]   # Solution at the current time level
+        self.height_new = self.time_levels[2]   # Scratch buffer for the next time level
+        self.height     = self.height_n
+        # Work buffer for the interior of the stencil
+        self.stencil_work = np.zeros(self.batch_shape + (self.Nx - 1,),dtype=self.dtype)
+
+        # Precomputed pieces of the energy functional: the Simpson weights over the mesh, the
+        # coefficients of the spatial derivative and work buffers for the energy density
+        self.energy_weights = simpson_weights(self.x_mesh).astype(self.energy_dtype)
+        self.grad_coefficients = tuple(self.energy_dtype.type(coefficient) if np.ndim(coefficient) == 0
+                                       else coefficient.astype(self.energy_dtype)
+                                       for coefficient in gradient_coefficients(self.x_mesh))
+        self.energy_work = np.zeros((3,) + state_shape,dtype=self.energy_dtype)
+
+        # How run_substeps advances the dynamics
+        self.backend = resolve_backend(config.get('backend','numpy'))
+        # Passed to the compiled kernel when no energies are wanted
+        self.no_energies = np.zeros((0,int(np.prod(self.batch_shape))),dtype=self.energy_dtype)
+
+        # What the observations hold
+        self.observation_encoder = make_observation_encoder(config,self)
+        self.observation_shape = self.observation_encoder.observation_shape
 
 
         self.height_traj=[]
@@ -82,24 +183,27 @@ class Wave1D:
         self.n = 0
 
         # We set the force vals to zero
-        self.force_vals = np.zeros(self.num_force_points)
-
+        self.force_vals = np.zeros(self.batch_shape + (self.num_force_points,))
+        self.impulse_profile[...] = 0
 
         # We set the initial condition of the solution 1 time level back
-        for i in range(0,self.Nx+1):
-            self.height_n[i]=self.Initial_Height(self.x_mesh[i])
+        self.height_n[...] = self.Initial_Height(self.x_mesh)
 
         # We do a special first step for the finite difference scheme
-        for i in range(1,self.Nx):
-            self.height[i] =self.height_n[i] + self.dt*self.Velocity_0(self.x_mesh[i])
-            self.height[i]+=0.5*self.C2*(self.height_n[i-1] - 2*self.height_n[i] + self.height_n[i+1])
-            self.height[i]+=0.5*(self.dt**2)*self.impulse_term(self.x_mesh[i])
+        u = self.height_new
+        u[...,1:-1] = self.Velocity_0(self.x_mesh[1:-1])
+        u[...,1:-1] *= self.dt
+        u[...,1:-1] += self.height_n[...,1:-1]
+        self.laplacian(self.height_n,out=self.stencil_work)
+        self.stencil_work *= 0.5*self.C2
+        u[...,1:-1] += self.stencil_work
+        np.multiply(self.impulse_profile[...,1:-1],0.5*self.dt2,out=self.stencil_work)
+        u[...,1:-1] += self.stencil_work
         # Force boundary conditions
-        self.height[0]=0
-        self.height[self.Nx]=0
+        u[...,0] = 0
+        u[...,self.Nx] = 0
         # Switch solution steps
-        self.height_nm1[:] = self.height_n
-        self.height_n[:] = self.height
+        self.rotate_time_levels()
 
     def single_step(self):
         """
@@ -108,81 +212,284 @@ class Wave1D:
 
         self.t += self.dt
         self.n += 1
-        for i in range(1,self.Nx):
-            self.height[i] = -self.height_nm1[i] + 2*self.height_n[i]
-            self.height[i] += self.C2*(self.height_n[i-1] - 2*self.height_n[i] + self.height_n[i+1])
-            self.height[i] += (self.dt**2)*self.impulse_term(self.x_mesh[i])
+        # The new time level is written into the scratch buffer
+        u = self.height_new
+        np.multiply(self.height_n[...,1:-1],2.0,out=u[...,1:-1])
+        u[...,1:-1] -= self.height_nm1[...,1:-1]
+        self.laplacian(self.height_n,out=self.stencil_work)
+        self.stencil_work *= self.C2
+        u[...,1:-1] += self.stencil_work
+        np.multiply(self.impulse_profile[...,1:-1],self.dt2,out=self.stencil_work)
+        u[...,1:-1] += self.stencil_work
         # Force boundary conditions
-        self.height[0] = 0
-        self.height[self.Nx] = 0
+        u[...,0] = 0
+        u[...,self.Nx] = 0
 
         # Switch solution steps
-        self.height_nm1[:] = self.height_n
-        self.height_n[:] = self.height
+        self.rotate_time_levels()
+
+    def run_substeps(self,num_steps,energies=None):
+        """
+        Runs num_steps steps of the dynamics with the current impulse profile
+
+        Inputs:
+            num_steps - (int >= 0) how many steps to run
+            energies - Optional C contiguous array of shape (num_steps,)+self.batch_shape that the
+                energy after every step is written into
+        Outputs:
+            energies - The array that was passed in
+        """
+        if self.backend == 'numpy':
+            for step in range(num_steps):
+                self.single_step()
+                if energies is not None:
+                    energies[step] = self.energy()
+            return energies
+
+        num_points = self.Nx + 1
+        energy_out = self.no_energies if energies is None else energies.reshape(num_steps,int(np.prod(self.batch_shape)))
+        a, b, c, dx_start, dx_end = self.grad_coefficients
+        advance(self.height_n.reshape(-1,num_points),self.height_nm1.reshape(-1,num_points),
+                self.height_new.reshape(-1,num_points),self.impulse_profile.reshape(-1,num_points),
+                self.C2,self.dt,num_steps,self.energy_weights,a,b,c,dx_start,dx_end,energy_out)
+        # The kernel rotated the time levels through the buffers num_steps times
+        for rotation in range(num_steps % 3):
+            self.rotate_time_levels()
+        self.t += num_steps*self.dt
+        self.n += num_steps
+        return energies
+
+    def allocate_records(self,num_records,record=RECORDABLE):
+        """
+        Allocates output buffers for advance
+
+        Inputs:
+            num_records - (int >= 0) how many recorded steps the buffers hold
+            record - Which of the quantities in RECORDABLE to allocate for
+        Outputs:
+            out - A dict of arrays keyed by the quantities, with the recorded step as the first axis,
+                and by step for the index of each recorded step
+        """
+        state_shape = self.batch_shape + (self.Nx + 1,)
+        shapes = {'height':state_shape,'impulse':state_shape,'energy':self.batch_shape}
+        dtypes = {'height':self.dtype,'impulse':self.dtype,'energy':self.energy_dtype}
+        out = {name:np.zeros((num_records,) + shapes[name],dtype=dtypes[name]) for name in record}
+        out['step'] = np.zeros(num_records,dtype=np.int64)
+        return out
+
+    def advance(self,num_steps,record_every=1,record=(),out=None):
+        """
+        Runs num_steps steps of the dynamics with the current impulse profile, recording the
+        requested quantities after every step whose index self.n is a multiple of record_every.
+        Between recorded steps the dynamics run through run_substeps, so the fewer steps are
+        recorded the less is spent outside the dynamics.
+
+        Inputs:
+            num_steps - (int >= 0) how many steps to run
+            record_every - (int > 0) the stride of the recorded steps
+            record - Which of the quantities in RECORDABLE to record
+            out - Optional output buffers as returned by allocate_records, with room for at least
+                as many records as there are recorded steps.  They are allocated if None
+        Outputs:
+            records - A dict of views of the filled part of the output buffers, keyed by the recorded
+                quantities and by step, the index self.n of each recorded step
+        """
+        first_step = self.n + 1
+        last_step = self.n + num_steps
+        steps = np.arange(first_step + (-first_step) % record_every,last_step + 1,record_every)
+        if out is None:
+            out = self.allocate_records(len(steps),record)
+        records = {name:out[name][:len(steps)] for name in tuple(record) + ('step',)}
+        records['step'][:] = steps
+        if 'impulse' in record:
+            # The impulse profile is fixed for the whole advance
+            records['impulse'][...] = self.impulse_profile
+
+        if len(record) == 0 or (record_every == 1 and 'height' not in record):
+            # Nothing but the energy is needed, which run_substeps computes itself
+            self.run_substeps(num_steps,records['energy'] if 'energy' in record else None)
+            return records
+        for index,step in enumerate(steps):
+            self.run_substeps(int(step - self.n))
+            if 'height' in record:
+                records['height'][index] = self.height
+            if 'energy' in record:
+                records['energy'][index] = self.energy()
+        self.run_substeps(last_step - self.n)
+        return records
+
+    def laplacian(self,u,out):
+        """
+        Writes the undivided second difference u[i-1] - 2*u[i] + u[i+1] of the interior
+        lattice points into out, which must have shape self.batch_shape+(self.Nx-1,)
+        """
+        np.multiply(u[...,1:-1],-2.0,out=out)
+        out += u[...,:-2]
+        out += u[...,2:]
+        return out
+
+    def rotate_time_levels(self):
+        """
+        Makes the freshly computed scratch buffer the current time level by moving the head
+        of the ring of time levels, so no data is copied between the time levels
+        """
+        self.head = (self.head + 1) % 3
+        self.height_nm1, self.height_n, self.height_new = self.height_n, self.height_new, self.height_nm1
+        self.height = self.height_n
+
+    def get_state(self):
+        """
+        Returns a copy of the dynamical state of the system, the current and previous time levels
+        stacked into an array of shape (2,)+self.batch_shape+(self.Nx+1,)
+        """
+        return np.take(self.time_levels,[self.head,(self.head - 1) % 3],axis=0)
+
+    def set_state(self,state):
+        """
+        Overwrites the dynamical state of the system with one produced by get_state
+        """
+        self.height_n[...] = state[0]
+        self.height_nm1[...] = state[1]
 
     def take_in_action(self,action):
         """
         This method acts as the interface where the agent applies an action to environment.
         For this simulator, it's simply a setter method for the force_vals attribute that
-        determine the profile of the impulse term.
+        determine the profile of the impulse term.  The impulse profile is only recomputed
+        when the force values actually change.
         """
-        self.force_vals = np.copy(action)
+        if np.array_equal(action,self.force_vals):
+            return
+        self.force_vals = np.array(action,dtype=self.force_basis.dtype)
+        np.dot(self.force_vals,self.force_basis.T,out=self.impulse_profile)
 
     def impulse_term(self,x):
         """
         The function definition for the active damping terms
 
         Inputs:
-            x - a scalar, position in the domain
+            x - a scalar or an array of positions in the domain
             force_vals - A vector of shape (self.num_force_points),
                 the (signed) values of the force at each piston point
+        Outputs:
+            The impulse at each position, with the same shape as x
         """
-        return np.sum(self.force_vals*np.exp(-0.5* ((x-self.force_locations)**2 )/self.force_width))
+        x = np.expand_dims(x,-1)
+        return np.sum(self.force_vals*np.exp(-0.5* ((x-self.force_locations)**2 )/self.force_width),axis=-1)
 
     def get_impulse_profile(self):
         """
         A utility function for returning an array representing the shape of the resulting impulse
         force, this is used for rendering the history of actions taken by the agent.
 
-        Inputs:
-            force_vals - A vector of shape (self.num_force_points),
-                the (signed) values of the force at each piston point
+        Outputs:
+            The cached impulse profile of shape self.batch_shape+(self.Nx+1,), which is overwritten by take_in_action,
+                so callers that keep it around must copy it
         """
-        profile = []
-        for i in range(self.Nx+1):
-            profile.append(self.impulse_term(self.x_mesh[i]))
-        return np.array(profile)
+        return self.impulse_profile
 
-    def get_observation(self):
+    def get_observation(self,out=None):
         """
         This is an interface that returns the observation of the system, which is modeled
         as the state of the wave system for the current timestep, previous timestep, and
         twice previous timestep.
 
+        With the height_velocity observation_mode the observation holds the current timestep and
+        the velocity instead, and with an observation_encoder other than lattice it holds features
+        of the lattice (sensor heights, mode amplitudes or pooled heights) instead of every point.
+
+        Inputs:
+            out - Optional array of shape self.batch_shape+self.observation_shape to write the observation into,
+                for instance a reused float32 buffer.  A new array of the simulation dtype is allocated if None
         Outputs:
-            observation - An array of shape (1,self.Nx+1,3).  observation[0,:,0]= self.height,
-                observation[0,:,1]=self.height_n, and observation[0,:,2]=self.height_nm1
+            observation - An array of shape self.batch_shape+self.observation_shape, which is (1,self.Nx+1,3)
+                for full observations of the whole lattice.  observation[...,0,:,0]= self.height,
+                observation[...,0,:,1]=self.height_n, and observation[...,0,:,2]=self.height_nm1
         """
-
-        observation = np.zeros((1,self.Nx+1,3))
-        observation[0,:,0]= self.height
-        observation[0,:,1]=self.height_n
-        observation[0,:,2]=self.height_nm1
-        return observation
+        return self.observation_encoder.encode(self,out)
 
     def energy(self):
         """
         Computes the internal energy of the system based upon the integral functional for
-        the 1-D wave equation.  Additionally we add an L2 norm regularizer
+        the 1-D wave equation.  Additionally we add an L2 norm regularizer.  For a batch of
+        systems this returns an array of shape self.batch_shape
 
         See http://web.math.ucsb.edu/~grigoryan/124A/lecs/lec7.pdf for details
         """
+        return self.energy_functional(self.height,self.height_nm1,self.energy_work)
 
-        dudt = (self.height-self.height_nm1)/self.dt # Time derivative
-        dudx = np.gradient(self.height,self.x_mesh) # Space derivative
+    def batch_energy(self,height,height_nm1):
+        """
+        Computes the energy of arbitrary states of the system, see energy
 
-        space_term = -self.height*np.gradient(dudx,self.x_mesh) # Alternative tension energy
-        energy_density = dudt**2 + (self.C**2)*(dudx**2)
-        energy_density += self.height**2 # Regularize with L2 norm
-        # Energy_density = dudt**2 + (self.c_speed**2)*space_term
-        return 0.5*simps(energy_density,self.x_mesh)
+        Inputs:
+            height - An array of current time levels of shape (...,self.Nx+1)
+            height_nm1 - An array of the matching previous time levels, of the same shape
+        Outputs:
+            energy - An array of the energies, of shape height.shape[:-1]
+        """
+        height = np.asarray(height,dtype=float)
+        return self.energy_functional(height,height_nm1,np.zeros((3,) + height.shape))
+
+    def energy_functional(self,height,height_nm1,work):
+        """
+        Evaluates the energy functional without allocating, using work (an array of shape
+        (3,)+height.shape) for the intermediate results
+        """
+        energy_density, dudx, scratch = work
+
+        np.subtract(height,height_nm1,out=energy_density)
+        energy_density /= self.dt # Time derivative
+        energy_density *= energy_density
+
+        # Space derivative, the same finite differences as np.gradient(height,self.x_mesh)
+        a, b, c, dx_start, dx_end = self.grad_coefficients
+        np.multiply(height[...,:-2],a,out=dudx[...,1:-1])
+        np.multiply(height[...,1:-1],b,out=scratch[...,1:-1])
+        dudx[...,1:-1] += scratch[...,1:-1]
+        np.multiply(height[...,2:],c,out=scratch[...,1:-1])
+        dudx[...,1:-1] += scratch[...,1:-1]
+        np.subtract(height[...,1],height[...,0],out=dudx[...,0])
+        dudx[...,0] /= dx_start
+        np.subtract(height[...,-1],height[...,-2],out=dudx[...,-1])
+        dudx[...,-1] /= dx_end
+
+        dudx *= dudx
+        dudx *= self.C**2
+        energy_density += dudx
+        np.multiply(height,height,out=scratch) # Regularize with L2 norm
+        energy_density += scratch
+        return 0.5*np.dot(energy_density,self.energy_weights)
+
+
+class BatchedWave1D(Wave1D):
+    """
+    A batch of independent 1 dimensional wave systems that share the same physical parameters.
+    Every state array carries a leading batch dimension, so the whole batch is advanced with
+    one vectorized stencil and one batched impulse product per step.
+    """
+    def __init__(self,config,batch_size):
+        """
+        Constructor for a batch of 1 dimensional wave systems
+
+        Inputs:
+            config:  A dict containing parameters for the system, with the same keys as Wave1D
+            batch_size: (int > 0) how many independent systems to simulate
+        """
+        self.batch_size = batch_size
+        self.batch_shape = (batch_size,)
+        Wave1D.__init__(self,config)
+
+    def set_state(self,state,indices=None):
+        """
+        Overwrites the dynamical state of some of the systems in the batch
+
+        Inputs:
+            state - An array of shape (2,len(indices),self.Nx+1) as produced by get_state
+            indices - The batch indices to overwrite, all systems if None
+        """
+        if indices is None:
+            Wave1D.set_state(self,state)
+        else:
+            self.height_n[indices] = state[0]
+            self.height_nm1[indices] = state[1]
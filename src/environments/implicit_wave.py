@@ -0,0 +1,103 @@
+"""
+An implicit finite difference simulator of the bridge that is stable for any time interval.
+
+The lattice equations of motion u'' = (c/dx)**2 * (u[i-1] - 2*u[i] + u[i+1]) + impulse are
+stepped with the Newmark average acceleration scheme (beta = 1/4), which in terms of the time
+levels is the leapfrog scheme with the second difference averaged over the three time levels:
+
+    u_new - 2*u_n + u_nm1 = C**2 * L(u_new/4 + u_n/2 + u_nm1/4) + dt**2 * impulse
+
+where L is the undivided second difference of the interior lattice points and C the courant
+number.  The scheme conserves a discrete energy for every C, so unlike Wave1D it has no courant
+limit, at the cost of the phase accuracy of the modes that the time step doesn't resolve.  Each
+step solves the symmetric positive definite tridiagonal system (I - C**2/4 * L)(u_new + u_nm1) =
+(2 + C**2/2 * L) u_n + dt**2 * impulse, whose banded Cholesky factorization is computed once at
+construction.
+"""
+
+import numpy as np
+from scipy.linalg import cholesky_banded, cho_solve_banded
+from .finite_diff_wave import Wave1D, BatchedWave1D
+
+# The weight of the new and previous time levels in the averaged second difference
+BETA = 0.25
+
+class ImplicitWave1D(Wave1D):
+    """
+    Simulates the same lattice as Wave1D with the implicit Newmark scheme, so the time interval
+    can be as long as an environment step at any resolution.  The state is the same pair of time
+    levels, so the observation, energy and get_state/set_state interface are those of Wave1D.
+    """
+    # The implicit scheme has no courant limit
+    courant_limited = False
+
+    def __init__(self,config):
+        """
+        Constructor for the implicit 1 dimensional wave system
+
+        Inputs:
+            config:  A dict containing parameters for the system, with the same keys as Wave1D.  The
+                backend key is ignored, and time_interval is not limited by the courant condition
+        """
+        Wave1D.__init__(self,config)
+        # The upper banded form of I - BETA*C**2*L over the interior lattice points, and its
+        # Cholesky factor, which every step reuses
+        num_interior = self.Nx - 1
+        banded = np.zeros((2,num_interior))
+        banded[0,1:] = -BETA*self.C2
+        banded[1,:] = 1.0 + 2.0*BETA*self.C2
+        self.factor = cholesky_banded(banded)
+        # Work buffer for the right hand side of the solve
+        self.rhs_work = np.zeros(self.batch_shape + (num_interior,),dtype=self.dtype)
+
+    def single_step(self):
+        """
+        Run a single step of the implicit finite difference dynamics
+        """
+        self.t += self.dt
+        self.n += 1
+        rhs = self.rhs_work
+        self.laplacian(self.height_n,out=self.stencil_work)
+        np.multiply(self.stencil_work,(1.0 - 2.0*BETA)*self.C2,out=rhs)
+        rhs += self.height_n[...,1:-1]
+        rhs += self.height_n[...,1:-1]
+        np.multiply(self.impulse_profile[...,1:-1],self.dt2,out=self.stencil_work)
+        rhs += self.stencil_work
+        # Solve for the sum of the new and previous time levels, batches solve every system at once
+        u = self.height_new
+        u[...,1:-1] = cho_solve_banded((self.factor,False),rhs.T,check_finite=False).T
+        u[...,1:-1] -= self.height_nm1[...,1:-1]
+        # Force boundary conditions
+        u[...,0] = 0
+        u[...,self.Nx] = 0
+
+        # Switch solution steps
+        self.rotate_time_levels()
+
+    def run_substeps(self,num_steps,energies=None):
+        """
+        Runs num_steps steps of the dynamics with the current impulse profile, see Wave1D.run_substeps
+        """
+        for step in range(num_steps):
+            self.single_step()
+            if energies is not None:
+                energies[step] = self.energy()
+        return energies
+
+
+class BatchedImplicitWave1D(ImplicitWave1D,BatchedWave1D):
+    """
+    A batch of independent implicit wave systems that share the same physical parameters, see
+    BatchedWave1D
+    """
+    def __init__(self,config,batch_size):
+        """
+        Constructor for a batch of implicit 1 dimensional wave systems
+
+        Inputs:
+            config:  A dict containing parameters for the system, with the same keys as Wave1D
+            batch_size: (int > 0) how many independent systems to simulate
+        """
+        self.batch_size = batch_size
+        self.batch_shape = (batch_size,)
+        ImplicitWave1D.__init__(self,config)
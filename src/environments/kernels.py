@@ -0,0 +1,88 @@
+"""
+Compiled kernels for the finite difference dynamics of Wave1D.
+
+The numba backend fuses the stencil update, the impulse force, the boundary conditions and the
+energy functional into a single compiled loop that runs many steps of the dynamics per call, so
+the interpreter is only entered once per environment step.  Numba is optional: if it isn't
+installed, asking for the numba backend falls back to the NumPy implementation in Wave1D with
+a warning.
+"""
+
+import warnings
+import numpy as np
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# The backends Wave1D can advance the dynamics with
+BACKENDS = ['numpy','numba']
+
+def resolve_backend(backend):
+    """
+    Returns the backend to use for the requested one, which is numpy if numba was requested
+    but isn't installed
+    """
+    if backend not in BACKENDS:
+        raise ValueError('backend must be one of {}, got {}'.format(BACKENDS,backend))
+    if backend == 'numba' and not HAVE_NUMBA:
+        warnings.warn('numba is not installed, falling back to the numpy backend')
+        return 'numpy'
+    return backend
+
+def _advance(height_n,height_nm1,height_new,impulse,C2,dt,num_steps,
+             energy_weights,grad_a,grad_b,grad_c,dx_start,dx_end,energies):
+    """
+    Runs num_steps steps of the leapfrog scheme for a batch of systems
+
+    Inputs:
+        height_n, height_nm1, height_new - The current, previous and scratch time levels, of shape
+            (batch_size,Nx+1).  The time levels rotate through the three buffers exactly as in
+            Wave1D.rotate_time_levels, so the caller has to rotate its references num_steps % 3 times
+        impulse - The impulse profile of each system, of shape (batch_size,Nx+1)
+        C2 - The squared courant number
+        dt - The time interval
+        num_steps - How many steps to run
+        energy_weights, grad_a, grad_b, grad_c, dx_start, dx_end - The precomputed pieces of
+            the energy functional, see Wave1D.energy_functional
+        energies - An array of shape (num_steps,batch_size) that the energy after every step is
+            written into, or an empty array to skip computing the energy
+    """
+    batch_size, num_points = height_n.shape
+    dt2 = dt*dt
+    compute_energy = energies.shape[0] > 0
+    for b in range(batch_size):
+        u_nm1 = height_nm1[b]
+        u_n = height_n[b]
+        u_new = height_new[b]
+        for step in range(num_steps):
+            # The operations are ordered as in Wave1D.single_step so the results agree to the bit
+            for i in range(1,num_points - 1):
+                stencil = (-2.0*u_n[i] + u_n[i - 1]) + u_n[i + 1]
+                u_new[i] = ((2.0*u_n[i] - u_nm1[i]) + stencil*C2) + impulse[b,i]*dt2
+            # Force boundary conditions
+            u_new[0] = 0.0
+            u_new[num_points - 1] = 0.0
+            # Switch solution steps
+            u_nm1, u_n, u_new = u_n, u_new, u_nm1
+
+            if compute_energy:
+                energy = 0.0
+                for i in range(num_points):
+                    if i == 0:
+                        dudx = (u_n[1] - u_n[0])/dx_start
+                    elif i == num_points - 1:
+                        dudx = (u_n[i] - u_n[i - 1])/dx_end
+                    else:
+                        dudx = (u_n[i - 1]*grad_a[i - 1] + u_n[i]*grad_b[i - 1]) + u_n[i + 1]*grad_c[i - 1]
+                    velocity = (u_n[i] - u_nm1[i])/dt
+                    density = (velocity*velocity + dudx*dudx*C2) + u_n[i]*u_n[i]
+                    energy += energy_weights[i]*density
+                energies[step,b] = 0.5*energy
+
+if HAVE_NUMBA:
+    advance = numba.njit(cache=True)(_advance)
+else:
+    advance = _advance
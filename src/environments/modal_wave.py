@@ -0,0 +1,161 @@
+"""
+A spectral simulator of the bridge that steps the dynamics exactly in time.
+
+The bridge has fixed endpoints and a constant wave speed, so the lattice equations of motion
+u'' = (c/dx)**2 * (u[i-1] - 2*u[i] + u[i+1]) + impulse decouple into the discrete sine modes
+sin(k*pi*i/Nx) of the interior lattice points, with angular frequencies
+omega_k = (2*c/dx)*sin(k*pi/(2*Nx)).  While the impulse is held fixed each mode is a driven
+harmonic oscillator with a closed form solution, so any number of time steps is advanced in
+O(modes) with no Courant limit on the time interval.
+"""
+
+import numpy as np
+from scipy.fft import dst, idst
+from .finite_diff_wave import Wave1D
+
+class ModalWave1D(Wave1D):
+    """
+    Simulates the same lattice as Wave1D, but in the basis of its sine modes.  The state is the
+    displacement and velocity of every mode, from which the current and previous time levels
+    (height_n and height_nm1) are synthesized, so the observation, energy and get_state/set_state
+    interface are those of Wave1D.
+    """
+    # Each mode is stepped exactly, so there is no courant limit
+    courant_limited = False
+
+    def __init__(self,config):
+        """
+        Constructor for the modal 1 dimensional wave system
+
+        Inputs:
+            config:  A dict containing parameters for the system, with the same keys as Wave1D.  The
+                backend key is ignored, and time_interval is not limited by the courant condition
+        """
+        Wave1D.__init__(self,config)
+        modes = np.arange(1,self.Nx)
+        # Angular frequencies of the sine modes of the interior lattice points, the phases of long
+        # steps are computed from the float64 frequencies whatever the simulation dtype
+        self.frequencies = (2.0*self.c_speed/self.dx)*np.sin(0.5*np.pi*modes/self.Nx)
+        self.omega = self.frequencies.astype(self.dtype)
+        # Rotation of every mode over one time step
+        self.cos_dt = np.cos(self.frequencies*self.dt).astype(self.dtype)
+        self.sin_dt = np.sin(self.frequencies*self.dt).astype(self.dtype)
+
+    def reset(self):
+        """
+        Resets the state of the wave system to rest
+        """
+        Wave1D.reset(self)
+        modal_shape = self.batch_shape + (self.Nx - 1,)
+        self.modal_disp = np.zeros(modal_shape,dtype=self.dtype)  # Displacement of each mode
+        self.modal_vel = np.zeros(modal_shape,dtype=self.dtype)   # Velocity of each mode
+        # Displacement at which each mode is in equilibrium with the impulse
+        self.static_disp = np.zeros(modal_shape,dtype=self.dtype)
+
+    def to_modes(self,u):
+        """
+        Returns the sine mode coefficients of the interior lattice points of u
+        """
+        return dst(u[...,1:-1],type=1,norm='ortho',axis=-1)
+
+    def from_modes(self,coefficients,out):
+        """
+        Writes the lattice values of the sine mode coefficients into out, endpoints included
+        """
+        out[...,1:-1] = idst(coefficients,type=1,norm='ortho',axis=-1)
+        out[...,0] = 0
+        out[...,self.Nx] = 0
+        return out
+
+    def take_in_action(self,action):
+        """
+        Sets the force values like Wave1D.take_in_action, and projects the resulting impulse
+        profile onto the sine modes
+        """
+        if np.array_equal(action,self.force_vals):
+            return
+        Wave1D.take_in_action(self,action)
+        self.static_disp = self.to_modes(self.impulse_profile)/self.omega**2
+
+    def rotate_modes(self,cos_wt,sin_wt):
+        """
+        Advances the displacement and velocity of every mode by the time t for which
+        cos_wt = cos(omega*t) and sin_wt = sin(omega*t)
+        """
+        offset = self.modal_disp - self.static_disp
+        self.modal_disp = self.static_disp + offset*cos_wt + (self.modal_vel/self.omega)*sin_wt
+        self.modal_vel = self.modal_vel*cos_wt - offset*self.omega*sin_wt
+
+    def synchronize_levels(self):
+        """
+        Synthesizes the current time level and the one a time step before it from the modes
+        """
+        self.from_modes(self.modal_disp,self.height_n)
+        # Run the current impulse backwards in time for one step
+        previous_disp = (self.static_disp + (self.modal_disp - self.static_disp)*self.cos_dt
+                         - (self.modal_vel/self.omega)*self.sin_dt)
+        self.from_modes(previous_disp,self.height_nm1)
+
+    def single_step(self):
+        """
+        Advances the system by one time step
+        """
+        self.run_substeps(1)
+
+    def run_substeps(self,num_steps,energies=None):
+        """
+        Advances the system by num_steps time steps with the current impulse profile, see
+        Wave1D.run_substeps.  If no energies are requested all the steps are taken at once
+        """
+        if energies is None:
+            phase = self.frequencies*(self.dt*num_steps)
+            self.rotate_modes(np.cos(phase).astype(self.dtype),np.sin(phase).astype(self.dtype))
+            self.synchronize_levels()
+        else:
+            for step in range(num_steps):
+                self.rotate_modes(self.cos_dt,self.sin_dt)
+                self.synchronize_levels()
+                energies[step] = self.energy()
+        self.t += num_steps*self.dt
+        self.n += num_steps
+        return energies
+
+    def set_state(self,state,indices=None):
+        """
+        Overwrites the dynamical state of the system, or of the systems in indices for a batch,
+        with one produced by get_state.  The velocity of each mode is recovered from the two time
+        levels with no impulse, as the states are stored after the equilibriation phase, whatever
+        impulse the systems (or the rest of a batch) currently have.
+        """
+        if indices is None:
+            indices = Ellipsis
+        self.height_n[indices] = state[0]
+        self.height_nm1[indices] = state[1]
+        disp = self.to_modes(self.height_n[indices])
+        previous_disp = self.to_modes(self.height_nm1[indices])
+        # Invert the backwards step of synchronize_levels without impulse, modes for which it is
+        # singular fall back to a finite difference
+        singular = np.abs(self.sin_dt) < 1e-12
+        sin_dt = np.where(singular,1.0,self.sin_dt)
+        velocity = self.omega*(disp*self.cos_dt - previous_disp)/sin_dt
+        velocity = np.where(singular,(disp - previous_disp)/self.dt,velocity)
+        self.modal_disp[indices] = disp
+        self.modal_vel[indices] = velocity
+
+
+class BatchedModalWave1D(ModalWave1D):
+    """
+    A batch of independent modal wave systems that share the same physical parameters, see
+    BatchedWave1D
+    """
+    def __init__(self,config,batch_size):
+        """
+        Constructor for a batch of modal 1 dimensional wave systems
+
+        Inputs:
+            config:  A dict containing parameters for the system, with the same keys as Wave1D
+            batch_size: (int > 0) how many independent systems to simulate
+        """
+        self.batch_size = batch_size
+        self.batch_shape = (batch_size,)
+        ModalWave1D.__init__(self,config)
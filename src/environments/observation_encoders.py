@@ -0,0 +1,217 @@
+"""
+Encoders that turn the state of a Wave1D simulator into the observations of the environments.
+
+An observation has shape (1,num_features,num_channels).  The encoder, selected by the
+observation_encoder key of the config, maps the lattice (num_lattice_points + 1 heights) to the
+num_features features:
+
+    lattice:  every lattice point
+    sensors:  num_sensors evenly spaced interior lattice points
+    modal:  the amplitudes of the first num_observed_modes sine modes of the bridge, computed with a
+        precomputed projection matrix
+    pooled:  the mean height over consecutive windows of pool_size lattice points
+    resampled:  the heights at num_observed_points evenly spaced points of the bridge, endpoints
+        included, linearly interpolated from the lattice
+
+and the observation_mode key sets the channels: full observations hold the encoded current time
+level twice and the previous one, height_velocity observations the encoded current time level and
+its velocity.  Every encoder is linear, so the velocity of the features is the encoded velocity.
+The sensors, modal and pooled encoders keep the size of the observations, and so of the policy,
+independent of num_lattice_points.  The modal and resampled encoders also keep their meaning, so a
+policy trained on one lattice can be trained further on a finer one, see the curriculum of train.py.
+"""
+
+import numpy as np
+
+# What the channels of an observation can hold
+OBSERVATION_MODES = ['full','height_velocity']
+
+class ObservationEncoder:
+    """
+    Encodes the whole lattice, the base class of the encoders.  Subclasses override
+    num_features and project
+    """
+
+    def __init__(self,config,simulator):
+        """
+        Inputs:
+            config:  A dict containing parameters for the system, see Wave1D
+            simulator:  The Wave1D whose state is encoded
+        """
+        self.observation_mode = config.get('observation_mode','full')
+        if self.observation_mode not in OBSERVATION_MODES:
+            raise ValueError('observation_mode must be one of {}, got {}'.format(OBSERVATION_MODES,
+                                                                                self.observation_mode))
+        self.Nx = simulator.Nx
+        self.dt = simulator.dt
+        self.dtype = simulator.dtype
+        num_channels = 3 if self.observation_mode == 'full' else 2
+        self.observation_shape = (1,self.num_features(config),num_channels)
+        # Holds the change of the heights over a step, which is projected for the velocity
+        self.work = np.zeros(simulator.batch_shape + (self.Nx + 1,),dtype=self.dtype)
+
+    def num_features(self,config):
+        """
+        Returns how many features each channel of an observation has
+        """
+        return self.Nx + 1
+
+    def project(self,u,out):
+        """
+        Writes the features of the lattice values u into out
+        """
+        out[...] = u
+
+    def project_difference(self,u,v,out):
+        """
+        Writes the features of u - v into out, the difference is taken in the simulation dtype
+        """
+        np.subtract(u,v,out=self.work)
+        self.project(self.work,out)
+
+    def encode(self,simulator,out=None):
+        """
+        Returns the observation of the state of simulator
+
+        Inputs:
+            simulator - The Wave1D to observe
+            out - Optional array of shape simulator.batch_shape+self.observation_shape to write the observation into,
+                for instance a reused float32 buffer.  A new array of the simulation dtype is allocated if None
+        Outputs:
+            observation - An array of shape simulator.batch_shape+self.observation_shape
+        """
+        if out is None:
+            out = np.zeros(simulator.batch_shape + self.observation_shape,dtype=self.dtype)
+        observation = out
+        current = observation[...,0,:,0]
+        self.project(simulator.height_n,current)
+        if self.observation_mode == 'full':
+            observation[...,0,:,1] = current
+            self.project(simulator.height_nm1,observation[...,0,:,2])
+        else:
+            velocity = observation[...,0,:,1]
+            self.project_difference(simulator.height_n,simulator.height_nm1,velocity)
+            velocity /= self.dt
+        return observation
+
+class SensorEncoder(ObservationEncoder):
+    """
+    Encodes the heights at num_sensors evenly spaced interior lattice points
+    """
+
+    def __init__(self,config,simulator):
+        num_sensors = config['num_sensors']
+        if not 0 < num_sensors < simulator.Nx:
+            raise ValueError('The sensors encoder needs 0 < num_sensors < num_lattice_points, got {}'.format(num_sensors))
+        # Spread the sensors like the pistons, over the interior of the bridge
+        sensor_locations = np.linspace(0,simulator.Nx,num_sensors + 2)[1:num_sensors + 1]
+        self.sensor_points = np.round(sensor_locations).astype(int)
+        ObservationEncoder.__init__(self,config,simulator)
+
+    def num_features(self,config):
+        return len(self.sensor_points)
+
+    def project(self,u,out):
+        out[...] = u[...,self.sensor_points]
+
+class ModalEncoder(ObservationEncoder):
+    """
+    Encodes the amplitudes of the first num_observed_modes sine modes sin(k*pi*x/L) of the bridge,
+    so a height profile that is a single mode of amplitude a has the feature a for that mode
+    """
+
+    def __init__(self,config,simulator):
+        num_modes = config['num_observed_modes']
+        if not 0 < num_modes < simulator.Nx:
+            raise ValueError('The modal encoder needs 0 < num_observed_modes < num_lattice_points, got {}'.format(num_modes))
+        # The discrete sine transform of the lattice, restricted to the first modes and transposed
+        # so that encoding is a single product of the heights with it
+        modes = np.arange(1,num_modes + 1)
+        points = np.arange(simulator.Nx + 1)
+        projection = (2.0/simulator.Nx)*np.sin(np.pi*np.outer(points,modes)/simulator.Nx)
+        self.projection = projection.astype(simulator.dtype)
+        ObservationEncoder.__init__(self,config,simulator)
+
+    def num_features(self,config):
+        return self.projection.shape[1]
+
+    def project(self,u,out):
+        out[...] = np.dot(u,self.projection)
+
+class PooledEncoder(ObservationEncoder):
+    """
+    Encodes the mean height over consecutive windows of pool_size lattice points, the last window
+    holding whatever points are left over
+    """
+
+    def __init__(self,config,simulator):
+        self.pool_size = config['pool_size']
+        if not 0 < self.pool_size <= simulator.Nx:
+            raise ValueError('The pooled encoder needs 0 < pool_size <= num_lattice_points, got {}'.format(self.pool_size))
+        # The first lattice point of every window, and how many points each window holds
+        self.window_starts = np.arange(0,simulator.Nx + 1,self.pool_size)
+        window_sizes = np.diff(np.append(self.window_starts,simulator.Nx + 1))
+        self.inverse_window_sizes = (1.0/window_sizes).astype(simulator.dtype)
+        ObservationEncoder.__init__(self,config,simulator)
+
+    def num_features(self,config):
+        return len(self.window_starts)
+
+    def project(self,u,out):
+        out[...] = np.add.reduceat(u,self.window_starts,axis=-1)*self.inverse_window_sizes
+
+class ResampledEncoder(ObservationEncoder):
+    """
+    Encodes the heights at num_observed_points evenly spaced points of the bridge, endpoints
+    included, linearly interpolated between the lattice points around them.  The observations
+    are the same profile sampled the same way for every num_lattice_points
+    """
+
+    def __init__(self,config,simulator):
+        num_points = config['num_observed_points']
+        if num_points < 2:
+            raise ValueError('The resampled encoder needs num_observed_points >= 2, got {}'.format(num_points))
+        # The position of every observed point in units of the lattice spacing, the lattice
+        # point to its left and the interpolation weights of that point and the next one
+        positions = np.linspace(0,simulator.Nx,num_points)
+        self.left_points = np.minimum(np.floor(positions).astype(int),simulator.Nx - 1)
+        self.right_points = self.left_points + 1
+        self.right_weights = (positions - self.left_points).astype(simulator.dtype)
+        self.left_weights = (1.0 - self.right_weights).astype(simulator.dtype)
+        ObservationEncoder.__init__(self,config,simulator)
+
+    def num_features(self,config):
+        return len(self.left_points)
+
+    def project(self,u,out):
+        np.multiply(u[...,self.left_points],self.left_weights,out=out)
+        out += u[...,self.right_points]*self.right_weights
+
+# Every encoder by name, selected by the observation_encoder key of the config
+OBSERVATION_ENCODERS = {'lattice':ObservationEncoder,
+                        'sensors':SensorEncoder,
+                        'modal':ModalEncoder,
+                        'pooled':PooledEncoder,
+                        'resampled':ResampledEncoder}
+
+def register_observation_encoder(name,encoder_class):
+    """
+    Makes a new encoder available to the observation_encoder key of the config
+
+    Inputs:
+        name:  The value of the observation_encoder key that selects the encoder
+        encoder_class:  A subclass of ObservationEncoder, built with (config,simulator)
+    """
+    OBSERVATION_ENCODERS[name] = encoder_class
+
+def make_observation_encoder(config,simulator):
+    """
+    Builds the encoder selected by the observation_encoder key of config for simulator.  Without
+    the key, configs with num_sensors > 0 get the sensors encoder and others the lattice encoder
+    """
+    name = config.get('observation_encoder')
+    if name is None:
+        name = 'sensors' if config.get('num_sensors',0) > 0 else 'lattice'
+    if name not in OBSERVATION_ENCODERS:
+        raise ValueError('observation_encoder must be one of {}, got {}'.format(sorted(OBSERVATION_ENCODERS),name))
+    return OBSERVATION_ENCODERS[name](config,simulator)
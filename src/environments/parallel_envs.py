@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import numpy as np
+from stable_baselines.common.vec_env import VecEnv, DummyVecEnv
+from stable_baselines.common.vec_env.base_vec_env import CloudpickleWrapper
+from .active_damping_env import VibratingBridge
+from .batched_damping_env import BatchedVibratingBridge
+from .reset_bank import load_reset_bank
+
+# The kinds of vectorized environments make_vec_env can build
+VEC_ENV_TYPES = ['dummy','subproc','batched']
+
+def _shared_memory_worker(remote,parent_remote,env_fn_wrapper,shared_obs,obs_shape,index):
+    """
+    The loop run by each worker process of a SharedMemoryVecEnv.  Observations are written
+    straight into the shared observation buffer, only rewards, dones and infos go through the pipe.
+    """
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    obs_buffer = np.frombuffer(shared_obs,dtype=np.float32).reshape(obs_shape)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                observation, reward, done, info = env.step(data)
+                if done:
+                    # Save the final observation of the episode before resetting
+                    info['terminal_observation'] = observation
+                    observation = env.reset()
+                obs_buffer[index] = observation
+                remote.send((reward,done,info))
+            elif cmd == 'reset':
+                obs_buffer[index] = env.reset()
+                remote.send(None)
+            elif cmd == 'seed':
+                remote.send(env.seed(data))
+            elif cmd == 'env_method':
+                method_name, method_args, method_kwargs = data
+                remote.send(getattr(env,method_name)(*method_args,**method_kwargs))
+            elif cmd == 'get_attr':
+                remote.send(getattr(env,data))
+            elif cmd == 'set_attr':
+                remote.send(setattr(env,data[0],data[1]))
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError('Unknown command {}'.format(cmd))
+    except KeyboardInterrupt:
+        pass
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    A vectorized environment that runs each environment in its own worker process, like the
+    stable baselines SubprocVecEnv.  The difference is that observations are transferred through
+    a block of shared memory that every worker writes its slot of, so the (1,Nx+1,3) observations
+    are never pickled on a step.
+    """
+
+    def __init__(self,env_fns,start_method=None):
+        """
+        Constructor for the SharedMemoryVecEnv
+
+        Inputs:
+            env_fns: A list of functions that each build one environment
+            start_method: The multiprocessing start method, defaults to forkserver if it's
+                available and spawn otherwise
+        """
+        self.waiting = False
+        self.closed = False
+        num_envs = len(env_fns)
+
+        if start_method is None:
+            forkserver_available = 'forkserver' in multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if forkserver_available else 'spawn'
+        ctx = multiprocessing.get_context(start_method)
+
+        # Build one environment in the main process to find the spaces
+        probe_env = env_fns[0]()
+        observation_space = probe_env.observation_space
+        action_space = probe_env.action_space
+        probe_env.close()
+
+        self.obs_shape = (num_envs,) + observation_space.shape
+        self.shared_obs = ctx.RawArray('f',int(np.prod(self.obs_shape)))
+        self.obs_buffer = np.frombuffer(self.shared_obs,dtype=np.float32).reshape(self.obs_shape)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe(duplex=True) for _ in range(num_envs)])
+        self.processes = []
+        for index,(work_remote,remote,env_fn) in enumerate(zip(self.work_remotes,self.remotes,env_fns)):
+            args = (work_remote,remote,CloudpickleWrapper(env_fn),self.shared_obs,self.obs_shape,index)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_shared_memory_worker,args=args,daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        VecEnv.__init__(self,num_envs,observation_space,action_space)
+
+    def step_async(self,actions):
+        for remote,action in zip(self.remotes,actions):
+            remote.send(('step',action))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rewards, dones, infos = zip(*results)
+        return np.copy(self.obs_buffer),np.array(rewards,dtype=np.float32),np.array(dones),infos
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset',None))
+        for remote in self.remotes:
+            remote.recv()
+        return np.copy(self.obs_buffer)
+
+    def seed(self,seed=None):
+        """
+        Seeds every environment, the i-th environment receives seed + i
+        """
+        for index,remote in enumerate(self.remotes):
+            remote.send(('seed',None if seed is None else seed + index))
+        return [remote.recv() for remote in self.remotes]
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close',None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _get_target_remotes(self,indices):
+        """
+        Returns the pipes of the workers running the environments in indices
+        """
+        if indices is None:
+            indices = range(self.num_envs)
+        elif isinstance(indices,int):
+            indices = [indices]
+        return [self.remotes[i] for i in indices]
+
+    def get_attr(self,attr_name,indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('get_attr',attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self,attr_name,value,indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('set_attr',(attr_name,value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self,method_name,*method_args,indices=None,**method_kwargs):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('env_method',(method_name,method_args,method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+def make_env(config,seed):
+    """
+    Returns a function that builds a seeded VibratingBridge, for use in a vectorized environment
+    """
+    def _init():
+        # Seeded through the config, so even the reset of the constructor is reproducible
+        return VibratingBridge(dict(config,seed=seed))
+    return _init
+
+def make_vec_env(config,num_envs=None,vec_env=None,seed=None):
+    """
+    Builds a vectorized VibratingBridge environment
+
+    Inputs:
+        config: A dict containing parameters for the system, the num_envs and vec_env keys are used
+            as defaults for the arguments below
+        num_envs: (int > 0) how many environments to run in parallel
+        vec_env: One of 'dummy' (all environments in this process), 'subproc' (one worker process
+            per environment), or 'batched' (all environments in a single batched simulator)
+        seed: The seed of the first environment, the i-th environment is seeded with seed + i.
+            Defaults to the seed key of config, and a random base seed is drawn if that is None too.
+            The batched environment draws the warmup drives of all its bridges from one generator
+            seeded with seed
+    Outputs:
+        A stable baselines VecEnv
+    """
+    if num_envs is None:
+        num_envs = config.get('num_envs',1)
+    if vec_env is None:
+        vec_env = config.get('vec_env','dummy')
+    if seed is None:
+        seed = config.get('seed')
+    if seed is None:
+        seed = np.random.randint(0,2**31 - num_envs)
+    # Make sure the reset bank exists before the environments load it
+    load_reset_bank(config)
+
+    if vec_env == 'batched':
+        return BatchedVibratingBridge(dict(config,seed=seed),num_envs)
+    env_fns = [make_env(config,seed + rank) for rank in range(num_envs)]
+    if vec_env == 'dummy':
+        return DummyVecEnv(env_fns)
+    elif vec_env == 'subproc':
+        return SharedMemoryVecEnv(env_fns)
+    raise ValueError('vec_env must be one of {}, got {}'.format(VEC_ENV_TYPES,vec_env))
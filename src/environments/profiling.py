@@ -0,0 +1,124 @@
+"""
+Timers for the phases of the VibratingBridge environments, switched on by the profile key of the config.
+
+An environment wraps each phase of reset and step in `with self.profiler.phase(name):`.  The
+PhaseProfiler accumulates the time and number of calls of every phase, while the NullProfiler
+used when profiling is off hands out a shared do-nothing context manager, so disabled profiling
+costs a method call per phase.
+"""
+
+import contextlib
+import time
+
+class PhaseTimer:
+    """
+    Context manager that adds the time spent inside it to one phase of a PhaseProfiler
+    """
+    __slots__ = ('profiler','name','start')
+
+    def __init__(self,profiler,name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.profiler.add(self.name,time.perf_counter() - self.start)
+        return False
+
+class PhaseProfiler:
+    """
+    Accumulates the time spent in, and the number of calls of, every phase of an environment
+    """
+    enabled = True
+
+    def __init__(self):
+        self.timers = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets everything timed so far
+        """
+        self.total_time = {}
+        self.num_calls = {}
+        self.recent_time = {}
+
+    def phase(self,name):
+        """
+        Returns the context manager that times the phase name
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = PhaseTimer(self,name)
+        return timer
+
+    def add(self,name,elapsed):
+        """
+        Adds elapsed seconds spent in the phase name
+        """
+        self.total_time[name] = self.total_time.get(name,0.0) + elapsed
+        self.num_calls[name] = self.num_calls.get(name,0) + 1
+        self.recent_time[name] = self.recent_time.get(name,0.0) + elapsed
+
+    def pop_recent(self):
+        """
+        Returns the seconds spent in each phase since the last call, for the info dict of a step
+        """
+        recent_time = self.recent_time
+        self.recent_time = {}
+        return recent_time
+
+    def get_profile(self):
+        """
+        Returns a dict mapping each phase to its number of calls, total time and mean time in seconds
+        """
+        return {name:{'calls':self.num_calls[name],
+                      'total_time':self.total_time[name],
+                      'mean_time':self.total_time[name]/self.num_calls[name]}
+                for name in self.total_time}
+
+class NullProfiler:
+    """
+    The profiler of environments that aren't profiled, it times nothing
+    """
+    enabled = False
+    null_timer = contextlib.nullcontext()
+
+    def reset(self):
+        pass
+
+    def phase(self,name):
+        return self.null_timer
+
+    def pop_recent(self):
+        return {}
+
+    def get_profile(self):
+        return {}
+
+def make_profiler(config):
+    """
+    Returns a PhaseProfiler if the profile key of config is set, and a NullProfiler otherwise
+    """
+    if config.get('profile',False):
+        return PhaseProfiler()
+    return NullProfiler()
+
+def merge_profiles(profiles):
+    """
+    Combines the profiles of several environments, as returned by get_profile, into one
+    """
+    merged = {}
+    for profile in profiles:
+        for name,stats in profile.items():
+            if name not in merged:
+                merged[name] = {'calls':0,'total_time':0.0}
+            merged[name]['calls'] += stats['calls']
+            merged[name]['total_time'] += stats['total_time']
+    for stats in merged.values():
+        stats['mean_time'] = stats['total_time']/stats['calls']
+    return merged
@@ -0,0 +1,166 @@
+"""
+A bank of pregenerated post-equilibriation states that VibratingBridge environments can sample
+from on reset instead of simulating the warmup and equilibriation phases every episode.
+
+The bank is stored as one .npy file of records holding each state and its equilibriation energy, in
+the directory given by the reset_bank_dir key of the config and named after a hash of the parameters
+that determine the distribution of the states.  The warmup drives are seeded from the same hash, so
+every machine generates the same bank for the same physics.  The file is published with a single
+atomic rename, so processes generating the same bank at once never mix their results, and it is
+memory-mapped read-only, so every worker process that loads the same bank shares it.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from .simulators import make_simulator
+
+# The config keys that determine the distribution of the post-equilibriation states, and the
+# precision of their equilibriation energies
+PHYSICS_KEYS = ['simulator','dtype','energy_dtype','time_interval','wave_speed','system_length',
+                'num_lattice_points','num_force_points','force_width','min_force','max_force',
+                'drive_magnitude','num_warmup_steps','num_equi_steps']
+
+# How many states to simulate at once when generating a bank
+GENERATION_BATCH_SIZE = 256
+
+def physics_hash(config):
+    """
+    Returns a short hash of the config values in PHYSICS_KEYS
+    """
+    physics = {key:config.get(key) for key in PHYSICS_KEYS}
+    return hashlib.sha1(json.dumps(physics,sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def bank_seed(config):
+    """
+    Returns the seed of the warmup drives of the bank for config, derived from its physics hash
+    """
+    return int(physics_hash(config),16) % 2**32
+
+def simulate_warmup(config,num_states,np_random):
+    """
+    Runs the warmup and equilibriation phases of a VibratingBridge episode for many bridges at once
+
+    Inputs:
+        config: A dict containing parameters for the system, see VibratingBridge
+        num_states: (int > 0) how many bridges to simulate
+        np_random: The numpy RandomState to draw the warmup drives from
+    Outputs:
+        state - An array of shape (2,num_states,num_lattice_points+1) with the current and previous
+            time levels of each bridge, as returned by Wave1D.get_state
+        equi_energy - An array of shape (num_states) with the average energy of each bridge during
+            the equilibriation phase
+    """
+    simulator = make_simulator(config,num_states)
+    num_force_points = config['num_force_points']
+
+    # Random fixed action to warm up each system, normalized to make it larger
+    action = np_random.uniform(low=config['min_force'],high=config['max_force'],
+                               size=(num_states,num_force_points))
+    action_mag = np.sqrt(np.sum(action**2,axis=1,keepdims=True))
+    action *= config['drive_magnitude']/action_mag
+    simulator.take_in_action(action)
+    simulator.advance(config['num_warmup_steps'])
+
+    # Don't perturb system, let it equilibriate.  The energy is averaged over the start of every step
+    simulator.take_in_action(np.zeros((num_states,num_force_points)))
+    equi_energy = simulator.energy()
+    records = simulator.advance(config['num_equi_steps'] - 1,record=('energy',))
+    equi_energy += np.sum(records['energy'],axis=0)
+    simulator.advance(1)
+    equi_energy /= config['num_equi_steps']
+    return simulator.get_state(),equi_energy
+
+class ResetBank:
+    """
+    A collection of post-equilibriation states and their equilibriation energies
+    """
+
+    def __init__(self,states,equi_energy):
+        """
+        Inputs:
+            states: An array of shape (num_states,2,num_lattice_points+1)
+            equi_energy: An array of shape (num_states)
+        """
+        self.states = states
+        self.equi_energy = equi_energy
+
+    def __len__(self):
+        return len(self.equi_energy)
+
+    def sample(self,np_random,num_samples=None):
+        """
+        Draws states from the bank uniformly at random
+
+        Inputs:
+            np_random: The numpy RandomState to draw with
+            num_samples: How many states to draw, a single state if None
+        Outputs:
+            state - A copy of the drawn state(s) in the layout of Wave1D.get_state, of shape
+                (2,num_lattice_points+1) or (2,num_samples,num_lattice_points+1)
+            equi_energy - The equilibriation energy of the drawn state(s)
+        """
+        if num_samples is None:
+            index = np_random.randint(len(self))
+            return np.array(self.states[index]),float(self.equi_energy[index])
+        indices = np_random.randint(len(self),size=num_samples)
+        return np.swapaxes(self.states[indices],0,1),np.array(self.equi_energy[indices])
+
+def bank_path(config):
+    """
+    Returns the path of the bank file for config
+    """
+    return os.path.join(config['reset_bank_dir'],'reset_bank_{}_{}.npy'.format(physics_hash(config),
+                                                                             config['reset_bank_size']))
+
+def bank_dtype(num_points):
+    """
+    Returns the dtype of the records of a bank file, a state of shape (2,num_points) and its energy
+    """
+    return np.dtype([('state',np.float64,(2,num_points)),('equi_energy',np.float64)])
+
+def generate_reset_bank(config,seed=None):
+    """
+    Simulates config['reset_bank_size'] post-equilibriation states and saves them to the bank file
+
+    Inputs:
+        config: A dict containing parameters for the system, see VibratingBridge
+        seed: The seed for the warmup drives, derived from the physics hash of config if None
+    """
+    path = bank_path(config)
+    bank_size = config['reset_bank_size']
+    num_points = config['num_lattice_points'] + 1
+    if not os.path.isdir(config['reset_bank_dir']):
+        os.makedirs(config['reset_bank_dir'])
+
+    np_random = np.random.RandomState(bank_seed(config) if seed is None else seed)
+    # Write to a temporary file first so other processes never see a partial bank
+    tmp_path = '{}.{}.tmp'.format(path,os.getpid())
+    records = np.lib.format.open_memmap(tmp_path,mode='w+',dtype=bank_dtype(num_points),shape=(bank_size,))
+    for start in range(0,bank_size,GENERATION_BATCH_SIZE):
+        stop = min(start + GENERATION_BATCH_SIZE,bank_size)
+        state, energy = simulate_warmup(config,stop - start,np_random)
+        records['state'][start:stop] = np.swapaxes(state,0,1)
+        records['equi_energy'][start:stop] = energy
+    records.flush()
+    del records
+    os.replace(tmp_path,path)
+
+def load_reset_bank(config):
+    """
+    Loads the reset bank for config, generating it first if it doesn't exist yet
+
+    Inputs:
+        config: A dict containing parameters for the system, the bank is used if the
+            reset_bank_size key is > 0
+    Outputs:
+        A ResetBank backed by read-only memory maps, or None if the bank is disabled
+    """
+    if config.get('reset_bank_size',0) <= 0:
+        return None
+    path = bank_path(config)
+    if not os.path.isfile(path):
+        generate_reset_bank(config)
+    records = np.load(path,mmap_mode='r')
+    return ResetBank(records['state'],records['equi_energy'])
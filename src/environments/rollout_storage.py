@@ -0,0 +1,284 @@
+"""
+Chunked on-disk storage for rollouts that are too long to hold in memory.
+
+A streamed rollout is a directory holding a manifest.json, the x_mesh.npy of the bridge and one
+file per field per chunk of chunk_size dynamics steps (height_000000.npy, energy_000000.npy, ...).
+Uncompressed chunks are .npy files that are memory-mapped on read, compressed chunks are .npz
+files that are decompressed one chunk at a time.  RolloutReader reads these directories as well
+as the .npz files written by VibratingBridge.render, with the same keys.
+"""
+
+import collections
+import json
+import os
+import numpy as np
+
+# The per-step fields of a rollout, and the keys they are exposed under by RolloutReader
+FIELDS = ['height','impulse','energy','code']
+ARRAY_KEYS = {'height_array':'height','impulse_array':'impulse','energy_array':'energy','code_array':'code'}
+MANIFEST_NAME = 'manifest.json'
+
+class RolloutWriter:
+    """
+    Appends the dynamics steps of a rollout to a chunked directory as they are produced, so
+    only one chunk is ever held in memory.  Nothing is written, or removed, until open starts
+    a rollout
+    """
+
+    def __init__(self,path,num_points,chunk_size=1024,compress=False):
+        """
+        Inputs:
+            path: The directory to write the rollout to
+            num_points: (int > 0) how many lattice points the bridge has
+            chunk_size: (int > 0) how many dynamics steps to store per chunk
+            compress: Whether to compress the chunks
+        """
+        self.path = path
+        self.num_points = num_points
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.buffers = {'height':np.zeros((chunk_size,num_points)),
+                        'impulse':np.zeros((chunk_size,num_points)),
+                        'energy':np.zeros(chunk_size),
+                        'code':np.zeros(chunk_size,dtype=np.int32)}
+        self.opened = False
+        self.num_chunks = 0
+        self.buffer_size = 0
+
+    def open(self,x_mesh=None):
+        """
+        Starts a new rollout, removing the chunks of any previous rollout at the same path
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for fname in os.listdir(self.path):
+            if fname == MANIFEST_NAME or fname.split('_')[0] in FIELDS:
+                os.remove(os.path.join(self.path,fname))
+        if x_mesh is not None:
+            np.save(os.path.join(self.path,'x_mesh.npy'),x_mesh)
+        self.num_chunks = 0
+        self.buffer_size = 0
+        self.opened = True
+
+    @property
+    def num_frames(self):
+        """
+        How many dynamics steps have been appended
+        """
+        return self.num_chunks*self.chunk_size + self.buffer_size
+
+    def chunk_path(self,field,chunk_index):
+        extension = '.npz' if self.compress else '.npy'
+        return os.path.join(self.path,'{}_{:06d}{}'.format(field,chunk_index,extension))
+
+    def write_chunk(self,field,chunk_index,data):
+        if self.compress:
+            np.savez_compressed(self.chunk_path(field,chunk_index),data=data)
+        else:
+            np.save(self.chunk_path(field,chunk_index),data)
+
+    def append(self,height,impulse,energy,code):
+        """
+        Appends one dynamics step, the arguments are the same as TrajectoryRecorder.record
+        """
+        if not self.opened:
+            raise ValueError('Call open to start a rollout before appending to it')
+        self.buffers['height'][self.buffer_size] = height
+        self.buffers['impulse'][self.buffer_size] = impulse
+        self.buffers['energy'][self.buffer_size] = energy
+        self.buffers['code'][self.buffer_size] = code
+        self.buffer_size += 1
+        if self.buffer_size == self.chunk_size:
+            for field in FIELDS:
+                self.write_chunk(field,self.num_chunks,self.buffers[field])
+            self.num_chunks += 1
+            self.buffer_size = 0
+
+    def normalize_energy(self,equi_energy):
+        """
+        Divides every energy appended so far by equi_energy, rewriting the (small) energy
+        chunks that are already on disk
+        """
+        for chunk_index in range(self.num_chunks):
+            energy = load_chunk(self.chunk_path('energy',chunk_index),self.compress,mmap=False)
+            self.write_chunk('energy',chunk_index,energy/equi_energy)
+        self.buffers['energy'][:self.buffer_size] /= equi_energy
+
+    def flush(self):
+        """
+        Writes the partially filled chunk and the manifest, after which the directory
+        holds a complete rollout that RolloutReader can open
+        """
+        if self.buffer_size > 0:
+            for field in FIELDS:
+                self.write_chunk(field,self.num_chunks,self.buffers[field][:self.buffer_size])
+        manifest = {'num_frames':self.num_frames,
+                    'num_points':self.num_points,
+                    'chunk_size':self.chunk_size,
+                    'num_chunks':self.num_chunks + (1 if self.buffer_size > 0 else 0),
+                    'compressed':self.compress}
+        with open(os.path.join(self.path,MANIFEST_NAME),'w') as manifest_file:
+            json.dump(manifest,manifest_file)
+
+def load_chunk(fname,compressed,mmap=True):
+    """
+    Loads one chunk file, memory-mapped if it is uncompressed and mmap is set
+    """
+    if compressed:
+        with np.load(fname) as data:
+            return data['data']
+    return np.load(fname,mmap_mode='r' if mmap else None)
+
+class ChunkedArray:
+    """
+    A lazy, read-only view of one field of a streamed rollout.  The dynamics step is the last
+    axis, as in the arrays saved by VibratingBridge.render, and indexing only loads the chunks
+    that overlap the requested steps.
+    """
+
+    def __init__(self,reader,field):
+        self.reader = reader
+        self.field = field
+        num_frames = reader.manifest['num_frames']
+        if field in ['height','impulse']:
+            self.shape = (reader.manifest['num_points'],num_frames)
+        else:
+            self.shape = (num_frames,)
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def frames(self,start,stop):
+        """
+        Returns the steps start to stop (exclusive) as an array with the step as the first axis
+        """
+        chunk_size = self.reader.manifest['chunk_size']
+        if stop <= start:
+            return np.zeros((0,) + self.shape[:-1])
+        pieces = []
+        for chunk_index in range(start//chunk_size,(stop - 1)//chunk_size + 1):
+            chunk = self.reader.get_chunk(self.field,chunk_index)
+            offset = chunk_index*chunk_size
+            pieces.append(chunk[max(start - offset,0):stop - offset])
+        if len(pieces) == 1:
+            return pieces[0]
+        return np.concatenate(pieces)
+
+    def __getitem__(self,key):
+        if not isinstance(key,tuple):
+            key = (key,)
+        # The step index is the last axis
+        if len(key) < self.ndim:
+            key = key + (slice(None),)*(self.ndim - len(key))
+        step_key = key[-1]
+        num_frames = self.shape[-1]
+        if isinstance(step_key,slice):
+            start, stop, stride = step_key.indices(num_frames)
+            if stride < 0:
+                raise IndexError('Negative strides are not supported')
+            data = np.moveaxis(self.frames(start,stop)[::stride],0,-1)
+        else:
+            step = int(step_key)
+            if step < 0:
+                step += num_frames
+            if not 0 <= step < num_frames:
+                raise IndexError('Step {} is out of range for {} steps'.format(step_key,num_frames))
+            data = self.frames(step,step + 1)[0]
+        return data[key[:-1]] if len(key) > 1 else data
+
+    def __array__(self,dtype=None):
+        return np.asarray(self[:],dtype=dtype)
+
+    def reduce(self,function,axis=None):
+        """
+        Applies a reduction such as np.min to the field one chunk at a time, over the whole field
+        if axis is None and otherwise along the (int) axis, as the reduction of the full array would
+        """
+        num_chunks = self.reader.manifest['num_chunks']
+        chunks = [self.reader.get_chunk(self.field,i) for i in range(num_chunks)]
+        if axis is None:
+            return function([function(chunk) for chunk in chunks])
+        if not -self.ndim <= axis < self.ndim:
+            raise ValueError('axis {} is out of range for an array of {} dimensions'.format(axis,self.ndim))
+        axis = axis % self.ndim
+        # The chunks hold the steps on their first axis, while the array has them on its last
+        if axis == self.ndim - 1:
+            return function([function(chunk,axis=0) for chunk in chunks],axis=0)
+        return np.moveaxis(np.concatenate([function(chunk,axis=axis + 1) for chunk in chunks]),0,-1)
+
+    def min(self,axis=None,out=None,**kwargs):
+        if out is not None or kwargs:
+            raise ValueError('ChunkedArray.min only supports the axis argument')
+        return self.reduce(np.min,axis)
+
+    def max(self,axis=None,out=None,**kwargs):
+        if out is not None or kwargs:
+            raise ValueError('ChunkedArray.max only supports the axis argument')
+        return self.reduce(np.max,axis)
+
+class RolloutReader:
+    """
+    Opens a rollout for reading, either a streamed rollout directory or an .npz file saved by
+    VibratingBridge.render.  Indexing with height_array, impulse_array, energy_array, code_array
+    or x_mesh gives the same data as np.load of the .npz file would, but for streamed rollouts the
+    height_array and impulse_array are ChunkedArrays that load chunks on demand.
+    """
+
+    def __init__(self,path,cache_size=4):
+        """
+        Inputs:
+            path: The rollout directory or .npz file
+            cache_size: How many chunks to keep loaded
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        if os.path.isdir(path):
+            with open(os.path.join(path,MANIFEST_NAME),'r') as manifest_file:
+                self.manifest = json.load(manifest_file)
+            self.archive = None
+        else:
+            self.manifest = None
+            self.archive = np.load(path)
+
+    @property
+    def num_frames(self):
+        if self.archive is not None:
+            return len(self.archive['code_array'])
+        return self.manifest['num_frames']
+
+    def get_chunk(self,field,chunk_index):
+        """
+        Returns one chunk of a field of a streamed rollout, with the step as the first axis
+        """
+        cache_key = (field,chunk_index)
+        if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
+            return self.cache[cache_key]
+        compressed = self.manifest['compressed']
+        extension = '.npz' if compressed else '.npy'
+        fname = os.path.join(self.path,'{}_{:06d}{}'.format(field,chunk_index,extension))
+        chunk = load_chunk(fname,compressed)
+        self.cache[cache_key] = chunk
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return chunk
+
+    def __getitem__(self,key):
+        if self.archive is not None:
+            return self.archive[key]
+        if key == 'x_mesh':
+            return np.load(os.path.join(self.path,'x_mesh.npy'))
+        if key not in ARRAY_KEYS:
+            raise KeyError(key)
+        field = ARRAY_KEYS[key]
+        if field in ['energy','code']:
+            # The scalar fields are small, so they are loaded in full
+            return np.asarray(ChunkedArray(self,field))
+        return ChunkedArray(self,field)
+
+    def close(self):
+        self.cache.clear()
+        if self.archive is not None:
+            self.archive.close()
@@ -0,0 +1,49 @@
+"""
+A registry of the simulators that the environments can run the bridge dynamics with, selected
+by the simulator key of the config.
+
+Every simulator exposes the interface of Wave1D (reset, single_step, run_substeps, take_in_action,
+get_observation, energy, get_state and set_state) and is registered together with a batched
+version that takes a batch_size and simulates that many independent bridges.
+"""
+
+from .finite_diff_wave import Wave1D, BatchedWave1D
+from .modal_wave import ModalWave1D, BatchedModalWave1D
+from .implicit_wave import ImplicitWave1D, BatchedImplicitWave1D
+
+# The simulator used when the config has no simulator key
+DEFAULT_SIMULATOR = 'finite_difference'
+
+# Maps the name of each simulator to its class and the class of its batched version
+SIMULATORS = {'finite_difference':(Wave1D,BatchedWave1D),
+              'modal':(ModalWave1D,BatchedModalWave1D),
+              'implicit':(ImplicitWave1D,BatchedImplicitWave1D)}
+
+def register_simulator(name,simulator_class,batched_class):
+    """
+    Registers a simulator under name, so configs can select it with simulator: name
+
+    Inputs:
+        name: The name of the simulator
+        simulator_class: A class with the interface of Wave1D, built from a config
+        batched_class: A class with the interface of BatchedWave1D, built from a config and a batch size
+    """
+    SIMULATORS[name] = (simulator_class,batched_class)
+
+def make_simulator(config,batch_size=None):
+    """
+    Builds the simulator selected by the simulator key of config
+
+    Inputs:
+        config: A dict containing parameters for the system, see Wave1D
+        batch_size: If not None, builds the batched version of the simulator for this many bridges
+    Outputs:
+        The simulator
+    """
+    name = config.get('simulator',DEFAULT_SIMULATOR)
+    if name not in SIMULATORS:
+        raise ValueError('simulator must be one of {}, got {}'.format(sorted(SIMULATORS),name))
+    simulator_class, batched_class = SIMULATORS[name]
+    if batch_size is None:
+        return simulator_class(config)
+    return batched_class(config,batch_size)
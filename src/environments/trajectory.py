@@ -0,0 +1,232 @@
+"""
+Recorders that keep the trajectory of a VibratingBridge episode for rendering.  Which one an
+environment uses is set by the record_mode key of the config:
+
+none:  Nothing is recorded, this is the mode to use for training
+ring:  Only the most recent record_buffer_size dynamics steps are kept, for monitoring
+full:  Every dynamics step of the episode is kept in preallocated arrays
+stream:  Every dynamics step is appended to a chunked rollout directory at record_path as the
+    episode runs, so arbitrarily long episodes use bounded memory
+
+With the record_every key of the config set to k > 1, the recorders only keep every k-th
+dynamics step of the episode.
+"""
+
+import os
+import numpy as np
+from .rollout_storage import RolloutWriter
+
+RECORD_MODES = ['none','ring','full','stream']
+
+class TrajectoryRecorder:
+    """
+    A recorder that records nothing, the base class of the other recorders
+    """
+    # Whether the recorder keeps anything, the environment skips computing what it would record if not
+    active = False
+    # Only the dynamics steps whose index is a multiple of record_every are kept by record_step(s)
+    record_every = 1
+
+    def clear(self):
+        """
+        Forgets the recorded trajectory at the start of an episode
+        """
+        pass
+
+    def record(self,height,impulse,energy,code):
+        """
+        Records one dynamics step
+
+        Inputs:
+            height - The height of the bridge, shape (num_points)
+            impulse - The impulse profile applied to the bridge, shape (num_points)
+            energy - The energy of the bridge
+            code - The phase of the episode, 0 for warmup, 1 for equilibriation and 2 for damping
+        """
+        pass
+
+    def record_step(self,step,height,impulse,energy,code):
+        """
+        Records one dynamics step if its index step within the episode is a multiple of record_every,
+        the other arguments are the same as record
+        """
+        if step % self.record_every == 0:
+            self.record(height,impulse,energy,code)
+
+    def record_steps(self,steps,height,impulse,energy,code):
+        """
+        Records the dynamics steps whose index is a multiple of record_every from arrays with the
+        step as the first axis, such as those returned by Wave1D.advance
+
+        Inputs:
+            steps - The index of each step within the episode
+            height, impulse, energy - Arrays of the quantities of record for each step
+            code - The phase of the episode, see record
+        """
+        for index in np.flatnonzero(steps % self.record_every == 0):
+            self.record(height[index],impulse[index],energy[index],code)
+
+    def normalize_energy(self,equi_energy):
+        """
+        Divides every energy recorded so far by equi_energy
+        """
+        pass
+
+    def get_arrays(self):
+        """
+        Returns the recorded trajectory in chronological order as a dict with the height_array and
+        impulse_array (both of shape (num_points,num_steps)), energy_array and code_array keys
+        """
+        raise ValueError('Trajectories are not recorded with record_mode none, use ring or full to render')
+
+    def save(self,fname,x_mesh):
+        """
+        Saves the recorded trajectory as an .npz file for later animation
+        """
+        np.savez(fname,x_mesh=x_mesh,**self.get_arrays())
+
+class FullTrajectoryRecorder(TrajectoryRecorder):
+    """
+    Records every dynamics step of an episode into preallocated arrays, which grow if an
+    episode runs longer than the expected capacity
+    """
+    active = True
+
+    def __init__(self,num_points,capacity):
+        """
+        Inputs:
+            num_points: (int > 0) how many lattice points the bridge has
+            capacity: (int > 0) how many dynamics steps to preallocate for
+        """
+        self.height = np.zeros((capacity,num_points))
+        self.impulse = np.zeros((capacity,num_points))
+        self.energy = np.zeros(capacity)
+        self.code = np.zeros(capacity,dtype=np.int32)
+        self.size = 0
+
+    def clear(self):
+        self.size = 0
+
+    def grow(self):
+        """
+        Doubles the capacity of the recorder
+        """
+        self.height = np.concatenate([self.height,np.zeros_like(self.height)])
+        self.impulse = np.concatenate([self.impulse,np.zeros_like(self.impulse)])
+        self.energy = np.concatenate([self.energy,np.zeros_like(self.energy)])
+        self.code = np.concatenate([self.code,np.zeros_like(self.code)])
+
+    def record(self,height,impulse,energy,code):
+        if self.size == len(self.energy):
+            self.grow()
+        self.height[self.size] = height
+        self.impulse[self.size] = impulse
+        self.energy[self.size] = energy
+        self.code[self.size] = code
+        self.size += 1
+
+    def normalize_energy(self,equi_energy):
+        self.energy[:self.size] /= equi_energy
+
+    def get_arrays(self):
+        return {'height_array':self.height[:self.size].T,
+                'impulse_array':self.impulse[:self.size].T,
+                'energy_array':self.energy[:self.size],
+                'code_array':self.code[:self.size]}
+
+class RingTrajectoryRecorder(FullTrajectoryRecorder):
+    """
+    Records only the most recent dynamics steps of an episode in a fixed size ring buffer
+    """
+
+    def record(self,height,impulse,energy,code):
+        # For the ring buffer size counts every step recorded in the episode
+        index = self.size % len(self.energy)
+        self.height[index] = height
+        self.impulse[index] = impulse
+        self.energy[index] = energy
+        self.code[index] = code
+        self.size += 1
+
+    def normalize_energy(self,equi_energy):
+        self.energy[:min(self.size,len(self.energy))] /= equi_energy
+
+    def get_arrays(self):
+        capacity = len(self.energy)
+        if self.size <= capacity:
+            return FullTrajectoryRecorder.get_arrays(self)
+        # Unroll the ring so the oldest step comes first
+        order = np.arange(self.size - capacity,self.size) % capacity
+        return {'height_array':self.height[order].T,
+                'impulse_array':self.impulse[order].T,
+                'energy_array':self.energy[order],
+                'code_array':self.code[order]}
+
+class StreamingTrajectoryRecorder(TrajectoryRecorder):
+    """
+    Streams every dynamics step of an episode to disk through a RolloutWriter
+    """
+    active = True
+
+    def __init__(self,path,num_points,chunk_size,compress,x_mesh=None):
+        """
+        Inputs:
+            path: The directory the rollout is streamed to, each episode overwrites it
+            num_points: (int > 0) how many lattice points the bridge has
+            chunk_size: (int > 0) how many dynamics steps to store per chunk
+            compress: Whether to compress the chunks
+            x_mesh: The mesh of the bridge, saved alongside the rollout
+        """
+        self.x_mesh = x_mesh
+        self.writer = RolloutWriter(path,num_points,chunk_size,compress)
+
+    def clear(self):
+        self.writer.open(self.x_mesh)
+
+    def record(self,height,impulse,energy,code):
+        self.writer.append(height,impulse,energy,code)
+
+    def normalize_energy(self,equi_energy):
+        self.writer.normalize_energy(equi_energy)
+
+    def get_arrays(self):
+        raise ValueError('Streamed trajectories are on disk, read them with RolloutReader')
+
+    def save(self,fname,x_mesh):
+        """
+        The trajectory is already on disk at the writer's path, so this writes the last
+        chunk and the manifest.  fname must be the record_path the stream was opened with
+        """
+        if os.path.abspath(fname) != os.path.abspath(self.writer.path):
+            raise ValueError('Streamed trajectories are written to record_path ({}), not {}'.format(
+                self.writer.path,fname))
+        self.writer.flush()
+
+def make_recorder(config,x_mesh=None):
+    """
+    Builds the trajectory recorder selected by the record_mode key of config (full if absent)
+
+    Inputs:
+        config:  A dict containing parameters for the system, see VibratingBridge
+        x_mesh: The mesh of the bridge, needed by the stream record_mode
+    Outputs:
+        A TrajectoryRecorder
+    """
+    record_mode = config.get('record_mode','full')
+    record_every = config.get('record_every',1)
+    num_points = config['num_lattice_points'] + 1
+    if record_mode == 'none':
+        return TrajectoryRecorder()
+    elif record_mode == 'ring':
+        recorder = RingTrajectoryRecorder(num_points,config['record_buffer_size'])
+    elif record_mode == 'full':
+        capacity = config['num_warmup_steps'] + config['num_equi_steps']
+        capacity += config['max_steps']*config['timepoints_per_step']
+        recorder = FullTrajectoryRecorder(num_points,capacity//record_every + 2)
+    elif record_mode == 'stream':
+        recorder = StreamingTrajectoryRecorder(config['record_path'],num_points,config['stream_chunk_size'],
+                                               config['stream_compress'],x_mesh)
+    else:
+        raise ValueError('record_mode must be one of {}, got {}'.format(RECORD_MODES,record_mode))
+    recorder.record_every = record_every
+    return recorder
@@ -10,7 +10,18 @@ Currently it takes in several command line arguments:
 -t:  The energy threshold, 0.1 means a threshold of 10% the average energy during
     the equilibriation phase
 -r: The number of evaluation repeats to perform (default is set in config.yml)
-
+--num-envs:  How many evaluation repeats to run in parallel (default is set in config.yml)
+--vec-env:  How to run the parallel environments, either dummy, subproc or batched (default is set in config.yml)
+--batched:  Run every evaluation repeat at once in a single batched environment, this is the same as
+    --vec-env batched with --num-envs set to the number of repeats
+--early-stop:  Stop each round of rollouts as soon as every repeat has crossed the threshold
+--confidence:  The confidence level of the intervals in the summary (default is 0.95)
+
+The number of steps to the threshold is tracked by the environments as they run, nothing is written
+to disk besides the results.  The steps of each repeat are saved with np.save to the output file as
+before, and a summary of the steps to threshold, final relative energy and cumulative reward of
+the repeats (mean, standard deviation, confidence interval of the mean and percentiles) is saved
+to <output file>.json, with the per-repeat values in <output file>_episodes.npz
 """
 import sys
 sys.path.append('..')
@@ -18,10 +29,10 @@ import gym
 
 # Load the stable_baselines functions
 from stable_baselines.common.policies import MlpPolicy
-from stable_baselines.common.vec_env import DummyVecEnv
 from stable_baselines import PPO2
 
-from environments.active_damping_env import VibratingBridge
+from environments.parallel_envs import make_vec_env, VEC_ENV_TYPES
+from evaluation_report import build_report, save_report
 
 # Other utilities
 import yaml
@@ -43,17 +54,68 @@ def steps_to_threshold(data,threshold):
         damping_steps:  How many steps it took the agent to get energy below
             threshold 
     """
-    energy_array = data['energy_array']
-    code_array = data['code_array']
-    total_steps = np.size(energy_array)
-    damping_steps = 0
-    for i in range(total_steps):
-        if code_array[i]==2:
-            if energy_array[i] < threshold:
-                return damping_steps
-            else:
-                damping_steps += 1
-    return damping_steps
+    damping_energy = data['energy_array'][data['code_array']==2]
+    below_threshold = np.flatnonzero(damping_energy < threshold)
+    if len(below_threshold) > 0:
+        return int(below_threshold[0])
+    return len(damping_energy)
+
+def evaluate_agent(model,cfg,evaluation_repeats,rollout_steps,threshold,num_envs,vec_env,early_stop=False):
+    """
+    Rolls out an agent for a number of evaluation repeats, tracking how many damping steps it takes
+    each repeat to get the relative energy under threshold
+
+    Inputs:
+        model:  The trained agent
+        cfg:  A dict containing the parameters of the environment
+        evaluation_repeats:  How many repeats to roll out
+        rollout_steps:  The number of rollout steps of each repeat
+        threshold:  Float between 0 and 1, the relative energy threshold
+        num_envs:  How many repeats to roll out in parallel
+        vec_env:  How to run the parallel environments, one of VEC_ENV_TYPES
+        early_stop:  Whether to stop each round of rollouts once every repeat has crossed the threshold
+    Outputs:
+        episodes:  A dict of arrays with the damping_steps, threshold_reached, final_energy and
+            cumulative_reward of every repeat
+    """
+    # The environments count the steps to the threshold themselves, so nothing needs recording
+    cfg = dict(cfg)
+    cfg['record_mode'] = 'none'
+    cfg['track_threshold'] = True
+    cfg['threshold'] = threshold
+
+    # Setup the environments, the evaluation repeats are split among them
+    env=make_vec_env(cfg,num_envs,vec_env)
+
+    episodes = {key:[] for key in ['damping_steps','threshold_reached','final_energy','cumulative_reward']}
+    while len(episodes['damping_steps']) < evaluation_repeats:
+        # Each round evaluates one repeat per environment
+        round_size = min(num_envs,evaluation_repeats-len(episodes['damping_steps']))
+        damping_steps = np.zeros(num_envs,dtype=np.int64)
+        final_energy = np.zeros(num_envs)
+        cumulative_reward = np.zeros(num_envs)
+        # An environment is finished once it crosses the threshold or its episode ends
+        reached = np.zeros(num_envs,dtype=bool)
+        finished = np.zeros(num_envs,dtype=bool)
+        obs = env.reset()
+        for i in range(rollout_steps):
+            action, _states = model.predict(obs)
+            obs, rewards, done, info = env.step(action)
+            running = np.flatnonzero(~finished)
+            cumulative_reward[running] += rewards[running]
+            for env_index in running:
+                damping_steps[env_index] = info[env_index]['damping_steps']
+                reached[env_index] = info[env_index]['threshold_reached']
+                final_energy[env_index] = info[env_index]['energy']
+            finished |= done
+            if early_stop and np.all((reached | finished)[:round_size]):
+                break
+        episodes['damping_steps'].extend(damping_steps[:round_size])
+        episodes['threshold_reached'].extend(reached[:round_size])
+        episodes['final_energy'].extend(final_energy[:round_size])
+        episodes['cumulative_reward'].extend(cumulative_reward[:round_size])
+    env.close()
+    return {key:np.array(values) for key,values in episodes.items()}
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -67,6 +129,16 @@ if __name__ == '__main__':
 		help='The energy threshold',default=-1.0,type=float)
     parser.add_argument('-r',dest='evaluation_reps',
 		help='How many evaluation repeats to do',default=-1,type=int)
+    parser.add_argument('--num-envs',dest='num_envs',
+        help='Overwrite the number of parallel environments',default=-1,type=int)
+    parser.add_argument('--vec-env',dest='vec_env',choices=VEC_ENV_TYPES,
+        help='Overwrite how the parallel environments are run',default=None,type=str)
+    parser.add_argument('--early-stop',dest='early_stop',action='store_true',
+        help='Stop rolling out once every repeat has crossed the threshold')
+    parser.add_argument('--batched',dest='batched',action='store_true',
+        help='Run all the evaluation repeats at once in a batched environment')
+    parser.add_argument('--confidence',dest='confidence',
+        help='The confidence level of the intervals in the summary',default=0.95,type=float)
     args = parser.parse_args()
 
     # Make sure we find where the config file is
@@ -93,23 +165,26 @@ if __name__ == '__main__':
     else:
         threshold = cfg['threshold']
 
-    # Setup the environment
-    env=DummyVecEnv([lambda: VibratingBridge(cfg)])
+    # Do we overwrite the number of parallel environments
+    if args.batched:
+        num_envs = evaluation_repeats
+        vec_env = 'batched'
+    else:
+        num_envs = args.num_envs if args.num_envs >0 else cfg['num_envs']
+        vec_env = args.vec_env if args.vec_env is not None else cfg['vec_env']
+
     # Make sure a proper pretrained agent file was passed
     assert args.pretrained.endswith('.pkl') and os.path.isfile(args.pretrained), "The pretrained agent must be a valid path to a .pkl file"
 
     # Load our trained agent
-    model = PPO2.load(args.pretrained,env=env)
+    model = PPO2.load(args.pretrained)
 
-    steps_list = []
-    for rep in range(evaluation_repeats):
-        obs = env.reset()
-        for i in range(rollout_steps):
-            action, _states = model.predict(obs)
-            obs, rewards, done, info = env.step(action)
-        env.render(fname='eval_temp')
-        data = np.load('eval_temp.npz')
-        steps_result = steps_to_threshold(data,threshold)
-        steps_list.append(steps_result)
-    os.remove('eval_temp.npz')
-    np.save(args.output_filename,steps_list)
+    episodes = evaluate_agent(model,cfg,evaluation_repeats,rollout_steps,threshold,num_envs,vec_env,args.early_stop)
+    np.save(args.output_filename,episodes['damping_steps'])
+
+    report = build_report(episodes,threshold,args.confidence)
+    save_report(report,episodes,args.output_filename)
+    steps_summary = report['damping_steps']
+    print('Reached the threshold in {:.1%} of {} repeats'.format(report['fraction_reached'],report['num_episodes']))
+    print('Damping steps to threshold: {:.1f} ({:.1f} to {:.1f}), median {:.1f}'.format(steps_summary['mean'],
+        steps_summary['ci_low'],steps_summary['ci_high'],steps_summary['p50']))
@@ -0,0 +1,67 @@
+"""
+Utilities for summarizing the evaluation of a trained agent over many episodes.
+"""
+import json
+import numpy as np
+from scipy import stats
+
+# The percentiles reported for every per-episode metric
+PERCENTILES = [5,25,50,75,95]
+
+def summarize(values,confidence=0.95):
+    """
+    Summary statistics of one per-episode metric
+
+    Inputs:
+        values:  An array of the metric for each episode
+        confidence:  Float between 0 and 1, the confidence level of the interval for the mean
+    Outputs:
+        summary:  A dict with the mean, standard deviation, a Student t confidence interval
+            for the mean, and the percentiles in PERCENTILES
+    """
+    values = np.asarray(values,dtype=float)
+    num_episodes = len(values)
+    mean = float(np.mean(values))
+    std = float(np.std(values,ddof=1)) if num_episodes > 1 else 0.0
+    if num_episodes > 1:
+        half_width = stats.t.ppf(0.5 + confidence/2,num_episodes - 1)*std/np.sqrt(num_episodes)
+    else:
+        half_width = float('nan')
+    summary = {'mean':mean,
+               'std':std,
+               'ci_low':float(mean - half_width),
+               'ci_high':float(mean + half_width),
+               'min':float(np.min(values)),
+               'max':float(np.max(values))}
+    for percentile,value in zip(PERCENTILES,np.percentile(values,PERCENTILES)):
+        summary['p{}'.format(percentile)] = float(value)
+    return summary
+
+def build_report(episodes,threshold,confidence=0.95):
+    """
+    Builds the evaluation report
+
+    Inputs:
+        episodes:  A dict of per-episode arrays with the damping_steps, threshold_reached,
+            final_energy and cumulative_reward keys
+        threshold:  The relative energy threshold the damping steps were measured against
+        confidence:  The confidence level of the intervals
+    Outputs:
+        report:  A dict with the evaluation settings, the fraction of episodes that crossed
+            the threshold and a summary of every per-episode metric
+    """
+    report = {'num_episodes':len(episodes['damping_steps']),
+              'threshold':threshold,
+              'confidence':confidence,
+              'fraction_reached':float(np.mean(episodes['threshold_reached']))}
+    for key in ['damping_steps','final_energy','cumulative_reward']:
+        report[key] = summarize(episodes[key],confidence)
+    return report
+
+def save_report(report,episodes,output_prefix):
+    """
+    Saves the summary as <output_prefix>.json and the per-episode arrays as <output_prefix>_episodes.npz
+    """
+    with open(output_prefix + '.json','w') as report_file:
+        json.dump(report,report_file,indent=2)
+    np.savez(output_prefix + '_episodes',**episodes)
@@ -0,0 +1,212 @@
+"""
+This script checks that the alternative simulators, backends and precisions reproduce the
+trajectories of the reference simulation, the NumPy finite difference Wave1D in float64
+
+Currently it takes in several command line arguments:
+
+-v:  Which variants to check, any of the keys of VARIANTS (default is all of them)
+-s:  The seeds of the checked episodes (default is 0 1 2)
+-n:  How many steps of each episode to run (default is 50, and at most max_steps - 1)
+--save:  Saves the reference trajectories of the seeds to this npz file
+--golden:  Checks the reference itself against trajectories saved with --save, to catch changes to it
+
+Every trajectory starts from an environment seeded with the episode's seed, which sets its warmup
+drive, and steps it with actions drawn from a generator seeded alike.  The heights after the reset
+and after every step, the relative energies and the rewards of each variant are then compared with
+those of the reference.  The errors are relative to the largest value of the reference, and each
+variant has its own tolerances.  The script exits with status 1 if any variant is out of tolerance.
+
+The modal and implicit simulators discretise time differently from the reference, so at the time
+interval of the config they differ from it by more than any useful tolerance.  These variants and
+their reference both run with a time interval refined by the variant's refinement factor, with as
+many more dynamics steps per environment step, warmup and equilibriation, so the episodes last as
+long.  The implicit simulator then matches the reference to second order in the time interval and
+the modal simulator, which integrates the piecewise constant drive exactly, to first order.
+"""
+import sys
+sys.path.append('..')
+
+# Other utilities
+import argparse
+import os
+import numpy as np
+import yaml
+
+from environments.active_damping_env import VibratingBridge
+
+# The keys of the config that select the reference simulation
+REFERENCE = {'simulator':'finite_difference','backend':'numpy','dtype':'float64','energy_dtype':'float64'}
+
+# The quantities compared between trajectories
+QUANTITIES = ['heights','energies','rewards']
+
+# Every variant by name: the config keys it overrides, its tolerances for each quantity and the factor
+# by which it and its reference refine the time interval.  The batched variant runs a
+# BatchedVibratingBridge of a single bridge instead of a VibratingBridge, which returns its rewards in
+# float32.  The tolerances of the modal and implicit simulators are their discretisation errors
+VARIANTS = {'numba':({'backend':'numba'},{'heights':1e-9,'energies':1e-9,'rewards':1e-9},1),
+            'float32':({'dtype':'float32','energy_dtype':'float32'},{'heights':1e-3,'energies':1e-3,'rewards':1e-3},1),
+            'batched':({'vec_env':'batched'},{'heights':1e-9,'energies':1e-9,'rewards':1e-6},1),
+            'modal':({'simulator':'modal'},{'heights':0.05,'energies':0.05,'rewards':0.2},8),
+            'implicit':({'simulator':'implicit'},{'heights':0.02,'energies':0.02,'rewards':0.05},8)}
+
+def variant_config(config,overrides=None,refinement=1):
+    """
+    Returns a copy of config set to the reference simulation, with the keys of a variant overridden
+    and the time interval refined by refinement
+    """
+    config = dict(config)
+    config.update(REFERENCE)
+    config.update(overrides or {})
+    if refinement != 1:
+        # Refine the time interval, keeping the durations of the phases of the episode
+        config['time_interval'] = config['time_interval']/refinement
+        for key in ['timepoints_per_step','num_warmup_steps','num_equi_steps']:
+            config[key] = config[key]*refinement
+    return config
+
+def run_trajectory(config,seed,num_steps):
+    """
+    Runs an episode from a seeded environment with seeded random actions
+
+    Inputs:
+        config:  A dict containing the parameters of the environment, vec_env batched runs a
+            BatchedVibratingBridge of one bridge
+        seed:  The seed of the environment and of the actions
+        num_steps:  (0 < int < max_steps) how many steps to run
+    Outputs:
+        trajectory:  A dict with the heights of shape (num_steps+1,num_lattice_points+1) after the
+            reset and every step, the relative energies of shape (num_steps+1) and the rewards of
+            shape (num_steps)
+    """
+    config = dict(config,seed=seed,record_mode='none',reset_bank_size=0)
+    if not 0 < num_steps < config['max_steps']:
+        raise ValueError('num_steps must be between 0 and max_steps, got {}'.format(num_steps))
+    if config.get('vec_env') == 'batched':
+        # Only the batched variant needs stable baselines
+        from environments.batched_damping_env import BatchedVibratingBridge
+        env = BatchedVibratingBridge(config,1)
+    else:
+        env = VibratingBridge(config)
+    env.reset()
+    actions = np.random.RandomState(seed).uniform(low=config['min_force'],high=config['max_force'],
+                                                  size=(num_steps,config['num_force_points']))
+    heights = np.zeros((num_steps + 1,config['num_lattice_points'] + 1))
+    energies = np.zeros(num_steps + 1)
+    rewards = np.zeros(num_steps)
+    heights[0] = env.simulator.height_n.reshape(-1)
+    energies[0] = np.sum(env.simulator.energy()/env.equi_energy)
+    for step,action in enumerate(actions):
+        if config.get('vec_env') == 'batched':
+            observation,reward,done,info = env.step(action[np.newaxis].astype(np.float32))
+        else:
+            observation,reward,done,info = env.step(action.astype(np.float32))
+        heights[step + 1] = env.simulator.height_n.reshape(-1)
+        energies[step + 1] = np.sum(env.simulator.energy()/env.equi_energy)
+        rewards[step] = np.sum(reward)
+    env.close()
+    return {'heights':heights,'energies':energies,'rewards':rewards}
+
+def compare_trajectories(reference,trajectory):
+    """
+    Returns the error of each quantity of trajectory, the largest absolute difference from the
+    reference relative to the largest absolute value of the reference
+    """
+    errors = {}
+    for quantity in QUANTITIES:
+        scale = max(np.max(np.abs(reference[quantity])),np.finfo(np.float64).tiny)
+        errors[quantity] = float(np.max(np.abs(trajectory[quantity] - reference[quantity]))/scale)
+    return errors
+
+def check_variant(config,overrides,tolerances,seeds,num_steps,references=None,refinement=1):
+    """
+    Checks a variant against the reference over episodes of several seeds
+
+    Inputs:
+        config:  A dict containing the parameters of the environment
+        overrides:  The config keys of the variant
+        tolerances:  A dict of the largest error allowed for each quantity
+        seeds:  The seeds of the episodes
+        num_steps:  How many steps of each episode to run
+        references:  Optionally, the reference trajectory of each seed at the same refinement, run
+            here if None
+        refinement:  The factor by which the variant and its reference refine the time interval
+    Outputs:
+        errors:  A dict with the largest error of each quantity over the episodes
+        passed:  Whether every error is within its tolerance
+    """
+    errors = {quantity:0.0 for quantity in QUANTITIES}
+    for index,seed in enumerate(seeds):
+        if references is None:
+            reference = run_trajectory(variant_config(config,refinement=refinement),seed,num_steps)
+        else:
+            reference = references[index]
+        trajectory = run_trajectory(variant_config(config,overrides,refinement),seed,num_steps)
+        for quantity,error in compare_trajectories(reference,trajectory).items():
+            errors[quantity] = max(errors[quantity],error)
+    passed = all(errors[quantity] <= tolerances[quantity] for quantity in QUANTITIES)
+    return errors,passed
+
+def save_golden(filename,trajectories,seeds):
+    """
+    Saves the reference trajectories of seeds to an npz file
+    """
+    arrays = {'seeds':np.array(seeds)}
+    for quantity in QUANTITIES:
+        arrays[quantity] = np.stack([trajectory[quantity] for trajectory in trajectories])
+    np.savez(filename,**arrays)
+
+def load_golden(filename):
+    """
+    Loads trajectories saved with save_golden, returns the list of trajectories and their seeds
+    """
+    data = np.load(filename)
+    seeds = [int(seed) for seed in data['seeds']]
+    trajectories = [{quantity:data[quantity][index] for quantity in QUANTITIES} for index in range(len(seeds))]
+    return trajectories,seeds
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v',dest='variants',nargs='+',choices=sorted(VARIANTS),
+        help='Which variants to check',default=sorted(VARIANTS))
+    parser.add_argument('-s',dest='seeds',nargs='+',
+        help='Seeds of the checked episodes',default=[0,1,2],type=int)
+    parser.add_argument('-n',dest='num_steps',
+        help='How many steps of each episode to run',default=50,type=int)
+    parser.add_argument('--save',dest='save_filename',
+        help='Save the reference trajectories to this npz file',default=None,type=str)
+    parser.add_argument('--golden',dest='golden_filename',
+        help='Check the reference against trajectories saved with --save',default=None,type=str)
+    args = parser.parse_args()
+
+    # Make sure we find where the config file is
+    CWD_PATH = os.getcwd()
+    config_path = os.path.join(CWD_PATH,'configs/config.yml')
+    with open(config_path, 'r') as ymlfile:
+        cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+    num_steps = min(args.num_steps,cfg['max_steps'] - 1)
+
+    seeds = args.seeds
+    failed = False
+    if args.golden_filename is not None:
+        golden,seeds = load_golden(args.golden_filename)
+        num_steps = len(golden[0]['rewards'])
+    references = [run_trajectory(variant_config(cfg),seed,num_steps) for seed in seeds]
+    if args.golden_filename is not None:
+        errors = {quantity:max(compare_trajectories(expected,reference)[quantity]
+                               for expected,reference in zip(golden,references)) for quantity in QUANTITIES}
+        # The reference should match its saved trajectories up to rounding
+        passed = all(error <= 1e-9 for error in errors.values())
+        failed = failed or not passed
+        print('reference vs {}: {} {}'.format(args.golden_filename,errors,'ok' if passed else 'FAILED'))
+    if args.save_filename is not None:
+        save_golden(args.save_filename,references,seeds)
+
+    for name in args.variants:
+        overrides,tolerances,refinement = VARIANTS[name]
+        # The references above are at the time interval of the config
+        errors,passed = check_variant(cfg,overrides,tolerances,seeds,num_steps,
+                                      references if refinement == 1 else None,refinement)
+        failed = failed or not passed
+        print('{}: {} {}'.format(name,errors,'ok' if passed else 'FAILED'))
+    sys.exit(1 if failed else 0)
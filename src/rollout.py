@@ -6,6 +6,13 @@ Currently it takes in several command line arguments:
 -n:  The number of timesteps to rollout for (default is set in config.yml)
 -i:  A path specifying a pretrained agent .pkl file to load and rollout
 -f:  A  path specifying the name of the output file to record the rollout
+--num-envs:  How many rollouts to run in parallel (default is set in config.yml), with more than one
+    the i-th rollout is recorded to <output file>_<i>
+--vec-env:  How to run the parallel environments, either dummy or subproc (default is set in config.yml)
+--stream:  Stream the rollout to disk as it runs, into a chunked directory at the output path instead
+    of an npz file, so long rollouts use bounded memory
+--record-every:  Only record every k-th step of the dynamics, which makes long rollouts faster and
+    smaller (default is set in config.yml)
 
 It then builds the environment, policy network, rolls out the agent and records the rollout in npz file.
 """
@@ -15,10 +22,9 @@ import gym
 
 # Load the stable_baselines functions
 from stable_baselines.common.policies import MlpPolicy
-from stable_baselines.common.vec_env import DummyVecEnv
 from stable_baselines import PPO2
 
-from environments.active_damping_env import VibratingBridge
+from environments.parallel_envs import make_vec_env
 
 # Other utilities
 import yaml
@@ -33,6 +39,14 @@ if __name__ == '__main__':
         help='Path to a pretrained agent to rollout',default='', type=str)
     parser.add_argument('-f',dest='output_filename',
         help='Name of output file',default='rollouts/output',type=str)
+    parser.add_argument('--num-envs',dest='num_envs',
+        help='Overwrite the number of parallel environments',default=-1,type=int)
+    parser.add_argument('--vec-env',dest='vec_env',choices=['dummy','subproc'],
+        help='Overwrite how the parallel environments are run',default=None,type=str)
+    parser.add_argument('--stream',dest='stream',action='store_true',
+        help='Stream the rollout to a chunked directory at the output path')
+    parser.add_argument('--record-every',dest='record_every',
+        help='Overwrite the stride of the recorded dynamics steps',default=-1,type=int)
     args = parser.parse_args()
 
     # Make sure we find where the config file is
@@ -40,6 +54,15 @@ if __name__ == '__main__':
     config_path = os.path.join(CWD_PATH,'configs/config.yml')
     with open(config_path, 'r') as ymlfile:
         cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+    # The whole episode is needed for rendering
+    if args.stream:
+        cfg['record_mode'] = 'stream'
+        cfg['record_path'] = args.output_filename
+    else:
+        cfg['record_mode'] = 'full'
+    # Do we overwrite the recording resolution
+    if args.record_every >0:
+        cfg['record_every'] = args.record_every
 
     # Check if we override the number of rollout steps
     if args.num_rollout_steps >0:
@@ -47,8 +70,23 @@ if __name__ == '__main__':
     else:
         rollout_steps = cfg['num_rollout_steps']
 
+    # Do we overwrite the number of parallel environments
+    if args.num_envs >0:
+        num_envs = args.num_envs
+    else:
+        num_envs = cfg['num_envs']
+    if args.stream and num_envs > 1:
+        parser.error('--stream records a single rollout, use --num-envs 1')
+    # The batched environment can't render, so it isn't an option here
+    if args.vec_env is not None:
+        vec_env = args.vec_env
+    elif cfg['vec_env'] == 'batched':
+        vec_env = 'dummy'
+    else:
+        vec_env = cfg['vec_env']
+
     # Setup the environment
-    env=DummyVecEnv([lambda: VibratingBridge(cfg)])
+    env=make_vec_env(cfg,num_envs,vec_env)
     # Make sure a proper pretrained agent file was passed
     assert args.pretrained.endswith('.pkl') and os.path.isfile(args.pretrained), "The pretrained agent must be a valid path to a .pkl file"
 
@@ -59,4 +97,9 @@ if __name__ == '__main__':
     for i in range(rollout_steps):
         action, _states = model.predict(obs)
         obs, rewards, done, info = env.step(action)
-    env.render(fname=args.output_filename)
+    if num_envs == 1:
+        env.env_method('render',fname=args.output_filename,indices=0)
+    else:
+        for env_index in range(num_envs):
+            env.env_method('render',fname='{}_{}'.format(args.output_filename,env_index),indices=env_index)
+    env.close()
@@ -0,0 +1,397 @@
+"""
+A long-lived rollout service for a trained agent.  The server loads the agent once, accepts rollout
+jobs over a local socket and runs all the jobs it has at once, stepping one VibratingBridge per job
+and computing the actions of every running job with a single batched predict call.  Each finished
+rollout is saved like rollout.py saves it (the npz file of VibratingBridge.render, or a streamed
+rollout directory) and the client that submitted it is told where.
+
+The server is started with:
+
+python src/rollout_server.py serve -i trained_agents/damping_agent.pkl
+
+-i:  A path specifying a pretrained agent .pkl file to serve
+--port:  The local port to listen on (default is 6000)
+--max-envs:  How many rollouts to run at once (default is 64)
+--deterministic:  Take the most likely action instead of sampling it
+
+and jobs are submitted with:
+
+python src/rollout_server.py submit -f rollouts/output -n 100 --jobs 8
+
+-f:  A path specifying the name of the output file, with more than one job the i-th rollout
+    is recorded to <output file>_<i>
+-n:  The number of timesteps to rollout for (default is set in config.yml)
+--jobs:  How many rollouts to submit (default is 1)
+--seed:  Seed of the first rollout, the i-th rollout is seeded with seed + i
+--stream:  Stream the rollouts to chunked directories instead of npz files, see rollout.py
+--record-every:  Only record every k-th step of the dynamics (default is set in config.yml)
+--port:  The port of the server (default is 6000)
+
+python src/rollout_server.py shutdown stops the server once its running jobs are done.
+
+Clients authenticate with a key shared with the server, which every command reads from the
+WAVERL_AUTHKEY environment variable, so set it to the same secret wherever the server and its
+clients run.
+
+From Python, run_rollouts submits a list of jobs and waits for them.  A job is a dict with the
+keys output_filename and num_steps, and optionally seed, stream and config (a dict of config keys
+that override the server's config for that rollout, these must not change the observation or action
+spaces of the agent).
+"""
+import sys
+sys.path.append('..')
+
+from environments.active_damping_env import VibratingBridge
+
+# Other utilities
+from multiprocessing.connection import Listener, Client
+import argparse
+import collections
+import json
+import os
+import queue
+import threading
+import numpy as np
+import yaml
+
+# The default port the server listens on, and the environment variable holding the key clients
+# authenticate with
+DEFAULT_PORT = 6000
+AUTHKEY_VARIABLE = 'WAVERL_AUTHKEY'
+
+def get_authkey():
+    """
+    Returns the authentication key of the server and its clients from the WAVERL_AUTHKEY environment variable
+    """
+    authkey = os.environ.get(AUTHKEY_VARIABLE,'')
+    if authkey == '':
+        raise ValueError('Set the {} environment variable to the key the rollout server and its clients '
+                         'share'.format(AUTHKEY_VARIABLE))
+    return authkey.encode('utf-8')
+
+class RolloutJob:
+    """
+    A rollout in progress on the server: the request, the connection it came from and its environment
+    """
+
+    def __init__(self,request,connection,env,env_key):
+        self.request = request
+        self.connection = connection
+        self.env = env
+        self.env_key = env_key
+        self.steps_taken = 0
+        self.cumulative_reward = 0.0
+        self.observation = env.reset()
+
+    def step(self,action):
+        """
+        Steps the environment with action, the environment resets when its episode ends like in
+        the vectorized environments that rollout.py uses
+        """
+        self.observation, reward, done, info = self.env.step(action)
+        self.cumulative_reward += float(reward)
+        if done:
+            self.observation = self.env.reset()
+        self.steps_taken += 1
+
+    @property
+    def finished(self):
+        return self.steps_taken >= self.request['num_steps']
+
+class RolloutServer:
+    """
+    Runs rollout jobs sent over a multiprocessing Listener, batching the predict calls of the agent
+    across every running job
+    """
+
+    def __init__(self,model,config,address=('localhost',DEFAULT_PORT),authkey=None,max_envs=64,
+                 deterministic=False):
+        """
+        Inputs:
+            model:  The trained agent, anything with a stable baselines predict method
+            config:  The config the environments are built from
+            address:  The (host,port) to listen on
+            authkey:  The key clients authenticate with, read from WAVERL_AUTHKEY if None
+            max_envs:  (int > 0) how many jobs to run at once, later jobs wait for a free slot
+            deterministic:  Whether the agent takes its most likely actions
+        """
+        self.model = model
+        self.config = config
+        self.max_envs = max_envs
+        self.deterministic = deterministic
+        if authkey is None:
+            authkey = get_authkey()
+        self.listener = Listener(address,authkey=authkey)
+        # Jobs received but not started, as (request,connection) pairs
+        self.pending = queue.Queue()
+        self.active = []
+        # Environments of finished jobs, by their config overrides, which later jobs reuse
+        self.free_envs = collections.defaultdict(list)
+        self.send_locks = {}
+        self.shutdown_requested = threading.Event()
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def accept_connections(self):
+        """
+        Accepts clients until the listener is closed, reading the jobs of each in its own thread
+        """
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                return
+            self.send_locks[connection] = threading.Lock()
+            threading.Thread(target=self.read_requests,args=(connection,),daemon=True).start()
+
+    def read_requests(self,connection):
+        """
+        Queues every job sent over connection until the client disconnects
+        """
+        while True:
+            try:
+                request = connection.recv()
+            except (EOFError,OSError):
+                return
+            if request.get('command') == 'shutdown':
+                self.shutdown_requested.set()
+                # Wake up the main loop if it is waiting for jobs
+                self.pending.put(None)
+            else:
+                self.pending.put((request,connection))
+
+    def send(self,connection,message):
+        """
+        Sends a reply to a client, clients that have gone away are ignored
+        """
+        try:
+            with self.send_locks[connection]:
+                connection.send(message)
+        except (OSError,EOFError):
+            pass
+
+    def make_env(self,request):
+        """
+        Returns an environment for a job and its key in free_envs, reusing the environment of a
+        finished job with the same config overrides when there is one
+        """
+        overrides = request.get('config',{})
+        env_key = json.dumps(overrides,sort_keys=True)
+        config = dict(self.config)
+        config.update(overrides)
+        if request.get('stream',False):
+            config['record_mode'] = 'stream'
+            config['record_path'] = request['output_filename']
+            # Streamed environments write to their own directory, so they aren't reused
+            env_key = None
+        else:
+            config['record_mode'] = 'full'
+            if env_key in self.free_envs and len(self.free_envs[env_key]) > 0:
+                env = self.free_envs[env_key].pop()
+                env.seed(request.get('seed'))
+                return env, env_key
+        env = VibratingBridge(config)
+        env.seed(request.get('seed'))
+        return env, env_key
+
+    def start_job(self,request,connection):
+        """
+        Starts a job, or tells the client why it can't
+        """
+        try:
+            env, env_key = self.make_env(request)
+            self.active.append(RolloutJob(request,connection,env,env_key))
+        except Exception as error:
+            self.send(connection,{'job_id':request.get('job_id'),'status':'error','error':repr(error)})
+
+    def finish_job(self,job):
+        """
+        Saves the rollout of a finished job and tells its client where it is
+        """
+        request = job.request
+        reply = {'job_id':request.get('job_id'),'num_steps':job.steps_taken,
+                 'cumulative_reward':job.cumulative_reward}
+        try:
+            job.env.render(fname=request['output_filename'])
+            if request.get('stream',False):
+                reply['output_filename'] = request['output_filename']
+            else:
+                reply['output_filename'] = request['output_filename'] + '.npz'
+            reply['status'] = 'done'
+        except Exception as error:
+            reply['status'] = 'error'
+            reply['error'] = repr(error)
+        if job.env_key is not None:
+            self.free_envs[job.env_key].append(job.env)
+        self.send(job.connection,reply)
+
+    def fail_job(self,job,error):
+        """
+        Tells the client of a job that failed while running why.  Its environment may be left in a
+        bad state, so it isn't reused
+        """
+        self.send(job.connection,{'job_id':job.request.get('job_id'),'num_steps':job.steps_taken,
+                                  'status':'error','error':repr(error)})
+
+    def admit_jobs(self):
+        """
+        Starts waiting jobs while there are free slots, waiting for one if nothing is running
+        """
+        while len(self.active) < self.max_envs:
+            try:
+                item = self.pending.get(block=len(self.active) == 0 and not self.shutdown_requested.is_set())
+            except queue.Empty:
+                return
+            if item is not None:
+                self.start_job(*item)
+
+    def step_jobs(self):
+        """
+        Steps every running job with actions from one batched predict call, then finishes the
+        jobs that have taken all their steps
+        """
+        try:
+            observations = np.stack([job.observation for job in self.active])
+            actions, _states = self.model.predict(observations,deterministic=self.deterministic)
+        except Exception as error:
+            # Without actions none of the running jobs can go on
+            for job in self.active:
+                self.fail_job(job,error)
+            self.active = []
+            return
+        still_running = []
+        for job,action in zip(self.active,actions):
+            # A job that fails only stops itself, the server and the other jobs keep running
+            try:
+                job.step(action)
+            except Exception as error:
+                self.fail_job(job,error)
+                continue
+            if job.finished:
+                self.finish_job(job)
+            else:
+                still_running.append(job)
+        self.active = still_running
+
+    def serve_forever(self):
+        """
+        Runs jobs until a shutdown is requested and the running and waiting jobs are done
+        """
+        threading.Thread(target=self.accept_connections,daemon=True).start()
+        try:
+            while True:
+                self.admit_jobs()
+                if len(self.active) > 0:
+                    self.step_jobs()
+                elif self.shutdown_requested.is_set() and self.pending.empty():
+                    break
+        finally:
+            self.listener.close()
+
+def run_rollouts(requests,address=('localhost',DEFAULT_PORT),authkey=None):
+    """
+    Submits rollout jobs to a RolloutServer and waits for them to finish
+
+    Inputs:
+        requests:  A list of job dicts, see the module docstring
+        address:  The (host,port) of the server
+        authkey:  The key the server was started with, read from WAVERL_AUTHKEY if None
+    Outputs:
+        replies:  The reply to each job, in the order of requests.  Each is a dict with the status
+            (done or error), the output_filename of the rollout (or the error), the number of steps
+            taken and the cumulative reward
+    """
+    if authkey is None:
+        authkey = get_authkey()
+    replies = [None]*len(requests)
+    with Client(address,authkey=authkey) as connection:
+        for job_id,request in enumerate(requests):
+            connection.send(dict(request,job_id=job_id))
+        for _ in requests:
+            reply = connection.recv()
+            replies[reply['job_id']] = reply
+    return replies
+
+def shutdown_server(address=('localhost',DEFAULT_PORT),authkey=None):
+    """
+    Asks a RolloutServer to stop once its jobs are done, authkey is read from WAVERL_AUTHKEY if None
+    """
+    if authkey is None:
+        authkey = get_authkey()
+    with Client(address,authkey=authkey) as connection:
+        connection.send({'command':'shutdown'})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve',help='Serve a trained agent')
+    serve_parser.add_argument('-i', dest='pretrained',
+        help='Path to a pretrained agent to rollout',default='', type=str)
+    serve_parser.add_argument('--max-envs',dest='max_envs',
+        help='How many rollouts to run at once',default=64,type=int)
+    serve_parser.add_argument('--deterministic',dest='deterministic',action='store_true',
+        help='Take the most likely actions')
+    submit_parser = subparsers.add_parser('submit',help='Submit rollouts to the server')
+    submit_parser.add_argument('-n',dest='num_rollout_steps',
+        help='The number of rollout steps', default=-1,type=int)
+    submit_parser.add_argument('-f',dest='output_filename',
+        help='Name of output file',default='rollouts/output',type=str)
+    submit_parser.add_argument('--jobs',dest='num_jobs',
+        help='How many rollouts to submit',default=1,type=int)
+    submit_parser.add_argument('--seed',dest='seed',
+        help='Seed of the first rollout',default=None,type=int)
+    submit_parser.add_argument('--stream',dest='stream',action='store_true',
+        help='Stream the rollouts to chunked directories at the output paths')
+    submit_parser.add_argument('--record-every',dest='record_every',
+        help='Overwrite the stride of the recorded dynamics steps',default=-1,type=int)
+    subparsers.add_parser('shutdown',help='Stop the server once its jobs are done')
+    for subparser in subparsers.choices.values():
+        subparser.add_argument('--port',dest='port',
+            help='The local port of the server',default=DEFAULT_PORT,type=int)
+    args = parser.parse_args()
+
+    # Make sure we find where the config file is
+    CWD_PATH = os.getcwd()
+    config_path = os.path.join(CWD_PATH,'configs/config.yml')
+    with open(config_path, 'r') as ymlfile:
+        cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+    address = ('localhost',args.port)
+
+    if args.command == 'serve':
+        # Only the server needs stable baselines and tensorflow
+        from stable_baselines import PPO2
+        # Make sure a proper pretrained agent file was passed
+        assert args.pretrained.endswith('.pkl') and os.path.isfile(args.pretrained), "The pretrained agent must be a valid path to a .pkl file"
+        model = PPO2.load(args.pretrained)
+        server = RolloutServer(model,cfg,address,max_envs=args.max_envs,deterministic=args.deterministic)
+        server.serve_forever()
+    elif args.command == 'submit':
+        # Check if we override the number of rollout steps
+        if args.num_rollout_steps >0:
+            rollout_steps = args.num_rollout_steps
+        else:
+            rollout_steps = cfg['num_rollout_steps']
+        requests = []
+        for job_index in range(args.num_jobs):
+            request = {'num_steps':rollout_steps,'stream':args.stream,'config':{}}
+            if args.num_jobs == 1:
+                request['output_filename'] = args.output_filename
+            else:
+                request['output_filename'] = '{}_{}'.format(args.output_filename,job_index)
+            if args.seed is not None:
+                request['seed'] = args.seed + job_index
+            if args.record_every >0:
+                request['config']['record_every'] = args.record_every
+            requests.append(request)
+        for reply in run_rollouts(requests,address):
+            if reply['status'] == 'done':
+                print('Saved {} ({} steps, cumulative reward {:.4f})'.format(reply['output_filename'],
+                    reply['num_steps'],reply['cumulative_reward']))
+            else:
+                print('Job {} failed: {}'.format(reply['job_id'],reply['error']))
+    elif args.command == 'shutdown':
+        shutdown_server(address)
+    else:
+        parser.print_help()
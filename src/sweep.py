@@ -0,0 +1,260 @@
+"""
+This script sweeps over values of config keys, training and evaluating an agent for every
+combination (a cell of the sweep)
+
+Currently it takes in several command line arguments:
+
+-s:  A path to the sweep spec (default is configs/sweep.yml)
+-f:  A path specifying the name of the results table, saved as csv (default is sweeps/results)
+--workers:  How many cells to run at once, each in its own process pinned to its own CPU
+    (default is the number of CPUs)
+--cache-dir:  Where the results and trained agent of every finished cell are kept (default is sweeps/cache)
+
+The spec is a yml file with the keys:
+
+mode:  grid (every combination of the listed values) or random (num_samples cells drawn at random)
+num_samples:  How many cells a random sweep draws
+seed:  The seed of a random sweep
+parameters:  A dict mapping each swept config key to a list of values, or for random sweeps to a
+    distribution {distribution: uniform or log_uniform, low: ..., high: ...}
+config:  Optionally, config keys to override in every cell
+
+Every cell trains with the config of configs/config.yml overridden by its values, then evaluates
+the trained agent like evaluate.py --batched.  The cells run in worker processes, so they can't use
+vec_env subproc, and a sweep with such a cell is rejected before any cell runs.  Results are cached in the cache dir under a hash of
+the cell's config and of the source code, so running a sweep again only runs the cells that are
+missing, and any change to the code runs them all again.
+"""
+import sys
+sys.path.append('..')
+
+# Other utilities
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import pandas as pd
+import yaml
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The summary statistics of the evaluation that go in the results table
+RESULT_COLUMNS = [('damping_steps','mean'),('damping_steps','ci_low'),('damping_steps','ci_high'),
+                  ('damping_steps','p50'),('final_energy','mean'),('cumulative_reward','mean')]
+
+def expand_spec(spec):
+    """
+    Returns the config overrides of every cell of a sweep spec, see the module docstring
+    """
+    parameters = spec['parameters']
+    keys = sorted(parameters)
+    mode = spec.get('mode','grid')
+    if mode == 'grid':
+        for key in keys:
+            if not isinstance(parameters[key],list):
+                raise ValueError('Grid sweeps need a list of values for {}'.format(key))
+        return [dict(zip(keys,values)) for values in itertools.product(*[parameters[key] for key in keys])]
+    elif mode == 'random':
+        np_random = np.random.RandomState(spec.get('seed'))
+        cells = []
+        for sample in range(spec['num_samples']):
+            cell = {}
+            for key in keys:
+                cell[key] = sample_parameter(parameters[key],np_random)
+            cells.append(cell)
+        return cells
+    raise ValueError('Unknown sweep mode {}, must be grid or random'.format(mode))
+
+def sample_parameter(values,np_random):
+    """
+    Draws one value of a parameter of a random sweep, from a list of values or a distribution
+    """
+    if isinstance(values,list):
+        return values[np_random.randint(len(values))]
+    distribution = values.get('distribution','uniform')
+    low, high = float(values['low']), float(values['high'])
+    if distribution == 'uniform':
+        return float(np_random.uniform(low,high))
+    elif distribution == 'log_uniform':
+        return float(np.exp(np_random.uniform(np.log(low),np.log(high))))
+    raise ValueError('Unknown distribution {}, must be uniform or log_uniform'.format(distribution))
+
+def code_version():
+    """
+    Returns a short hash of the python source files the training and evaluation run
+    """
+    digest = hashlib.sha1()
+    for root,dirs,files in os.walk(SRC_DIR):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.endswith('.py'):
+                path = os.path.join(root,fname)
+                digest.update(os.path.relpath(path,SRC_DIR).encode('utf-8'))
+                with open(path,'rb') as source_file:
+                    digest.update(source_file.read())
+    return digest.hexdigest()[:16]
+
+def cell_hash(config,version):
+    """
+    Returns a short hash of the config of a cell and the code version, the key of its cache entry
+    """
+    key = json.dumps({'config':config,'code_version':version},sort_keys=True,default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def pin_worker(cpu_queue):
+    """
+    Pins a worker process to the next free CPU, on systems that support it
+    """
+    cpu = cpu_queue.get()
+    if hasattr(os,'sched_setaffinity'):
+        os.sched_setaffinity(0,{cpu})
+
+def run_cell(cell):
+    """
+    Trains and evaluates the agent of one cell, and caches the result
+
+    Inputs:
+        cell:  A dict with the overrides, the config, the hash and the cache_dir of the cell
+    Outputs:
+        result:  A dict with the overrides, the hash, the status (done or error), and for finished
+            cells the evaluation report and the training and evaluation times
+    """
+    # Only the workers need stable baselines and tensorflow
+    from train import train_agent
+    from evaluate import evaluate_agent
+    from evaluation_report import build_report
+
+    cell_dir = os.path.join(cell['cache_dir'],cell['hash'])
+    # Cells checkpoint into their own directory, so a killed sweep resumes its unfinished cells
+    cfg = dict(cell['config'])
+    cfg['checkpoint_dir'] = os.path.join(cell_dir,'checkpoints')
+    result = {'overrides':cell['overrides'],'hash':cell['hash']}
+    try:
+        if not os.path.isdir(cell_dir):
+            os.makedirs(cell_dir)
+        start = time.perf_counter()
+        # Each worker has one CPU, so tensorflow gets one thread
+        model = train_agent(cfg,cfg['num_envs'],cfg['vec_env'],cfg['learning_rate_val'],cfg['num_learning_steps'],
+                            model_name=os.path.join(cell_dir,'model'),n_cpu_tf_sess=1)
+        result['train_time'] = time.perf_counter() - start
+        start = time.perf_counter()
+        episodes = evaluate_agent(model,cfg,cfg['evaluation_reps'],cfg['num_rollout_steps'],cfg['threshold'],
+                                  cfg['evaluation_reps'],'batched')
+        result['evaluation_time'] = time.perf_counter() - start
+        result['report'] = build_report(episodes,cfg['threshold'])
+        result['status'] = 'done'
+    except Exception as error:
+        result['status'] = 'error'
+        result['error'] = repr(error)
+        return result
+    # Write to a temporary file first so a killed sweep never leaves a partial result
+    result_path = os.path.join(cell_dir,'result.json')
+    with open(result_path + '.tmp','w') as result_file:
+        json.dump(result,result_file,indent=2)
+    os.replace(result_path + '.tmp',result_path)
+    return result
+
+def load_cached_result(cell):
+    """
+    Returns the cached result of a cell, or None if it hasn't finished before
+    """
+    result_path = os.path.join(cell['cache_dir'],cell['hash'],'result.json')
+    if not os.path.isfile(result_path):
+        return None
+    with open(result_path,'r') as result_file:
+        return json.load(result_file)
+
+def results_table(results):
+    """
+    Builds a table with a row per cell: its overrides, hash, status, times and evaluation summary
+    """
+    rows = []
+    for result in results:
+        row = dict(result['overrides'])
+        row['hash'] = result['hash']
+        row['status'] = result['status']
+        if result['status'] == 'done':
+            row['fraction_reached'] = result['report']['fraction_reached']
+            for metric,statistic in RESULT_COLUMNS:
+                row['{}_{}'.format(metric,statistic)] = result['report'][metric][statistic]
+            row['train_time'] = result['train_time']
+            row['evaluation_time'] = result['evaluation_time']
+        else:
+            row['error'] = result['error']
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def run_sweep(spec,base_config,cache_dir='sweeps/cache',num_workers=None):
+    """
+    Runs every cell of a sweep that isn't cached yet
+
+    Inputs:
+        spec:  The sweep spec, see the module docstring
+        base_config:  The config the cells override
+        cache_dir:  Where the results and trained agents of the cells are kept
+        num_workers:  How many cells to run at once, the number of CPUs if None
+    Outputs:
+        table:  A pandas DataFrame of the results, one row per cell
+    """
+    version = code_version()
+    cells = []
+    for overrides in expand_spec(spec):
+        config = dict(base_config)
+        config.update(spec.get('config',{}))
+        config.update(overrides)
+        # Nothing is recorded while training and evaluating
+        config['record_mode'] = 'none'
+        # The pool's workers are daemonic, and daemonic processes can't start the workers of a subproc env
+        if config.get('vec_env') == 'subproc':
+            raise ValueError('Sweep cells run in worker processes, which cannot start subproc environments.  '
+                             'Use vec_env dummy or batched for the cell {}'.format(overrides))
+        cells.append({'overrides':overrides,'config':config,'hash':cell_hash(config,version),'cache_dir':cache_dir})
+
+    results = [load_cached_result(cell) for cell in cells]
+    missing = [index for index,result in enumerate(results) if result is None]
+    print('{} of {} cells are cached, running {}'.format(len(cells) - len(missing),len(cells),len(missing)))
+    if len(missing) > 0:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os,'sched_getaffinity') else list(range(os.cpu_count()))
+        if num_workers is None:
+            num_workers = len(cpus)
+        num_workers = min(num_workers,len(missing))
+        # Hand each worker its own CPU
+        cpu_queue = multiprocessing.Queue()
+        for worker in range(num_workers):
+            cpu_queue.put(cpus[worker % len(cpus)])
+        with multiprocessing.Pool(num_workers,initializer=pin_worker,initargs=(cpu_queue,)) as pool:
+            for index,result in zip(missing,pool.imap(run_cell,[cells[index] for index in missing])):
+                results[index] = result
+                print('Cell {} {}: {}'.format(result['hash'],result['overrides'],result['status']))
+    return results_table(results)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s',dest='spec_path',
+        help='Path to the sweep spec',default='configs/sweep.yml',type=str)
+    parser.add_argument('-f',dest='output_filename',
+        help='Name of the results table',default='sweeps/results',type=str)
+    parser.add_argument('--workers',dest='num_workers',
+        help='How many cells to run at once',default=None,type=int)
+    parser.add_argument('--cache-dir',dest='cache_dir',
+        help='Where the finished cells are kept',default='sweeps/cache',type=str)
+    args = parser.parse_args()
+
+    # Make sure we find where the config file is
+    CWD_PATH = os.getcwd()
+    config_path = os.path.join(CWD_PATH,'configs/config.yml')
+    with open(config_path, 'r') as ymlfile:
+        cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+    with open(args.spec_path, 'r') as ymlfile:
+        spec = yaml.load(ymlfile,Loader=yaml.FullLoader)
+
+    table = run_sweep(spec,cfg,args.cache_dir,args.num_workers)
+    output_dir = os.path.dirname(args.output_filename)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    table.to_csv(args.output_filename + '.csv',index=False)
+    print(table.to_string(index=False))
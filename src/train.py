@@ -3,13 +3,30 @@ This script is the main training script.
 
 Currently it takes in several command line arguments:
 
--tb:  A path where the tensorboard information will be saved (reward, etc)
+-tb:  A path where the tensorboard information will be saved (reward, etc), and with the profile config
+    key set the phase timings of the environments, in its profile subdirectory
 -n:  The number of timesteps to train for (default is set in config.yml)
 -i:  A path specifying a pretrained agent .pkl file to load and continue training
 -m:  A string that will form the filename of the saved file
 -lr:  A float representing the learning rate for the PPO2 algorithm (default is set in config.yml)
+--num-envs:  How many environments to collect experience from in parallel (default is set in config.yml)
+--vec-env:  How to run the parallel environments, one of dummy, subproc or batched (default is set in config.yml)
+--curriculum:  Train through the stages of the curriculum_stages key of config.yml instead of for -n steps
+    (default is the curriculum key of config.yml)
+
+--no-resume:  Start from scratch (or from -i) even if checkpoint_dir holds checkpoints of an earlier run
 
 It then builds the environment, policy network, trains the agent, and saves the trained model.
+
+With the checkpoint_every key of config.yml set, the agent is checkpointed to checkpoint_dir every
+checkpoint_every timesteps while it trains, keeping the newest keep_checkpoints checkpoints and the best
+one by evaluation score as best.pkl.  A killed run started again resumes from its newest checkpoint, with
+its number of timesteps and the random state of its environments, and trains for the steps that are left.
+
+In curriculum mode every stage overrides some config keys, typically training on a coarse lattice
+first and then on finer ones, and trains the same agent for the stage's num_learning_steps.  The
+observations must have the same shape in every stage, for instance with the resampled or modal
+observation_encoder.  The agent is also saved after each stage, to <model name>_stage<i>.
 """
 import sys
 sys.path.append('..')
@@ -17,15 +34,144 @@ import gym
 
 # Load the stable_baselines functions
 from stable_baselines.common.policies import MlpPolicy
-from stable_baselines.common.vec_env import DummyVecEnv
 from stable_baselines import PPO2
 
-from environments.active_damping_env import VibratingBridge
+from environments.parallel_envs import make_vec_env, VEC_ENV_TYPES
+from environments.simulators import make_simulator
+from evaluate import evaluate_agent
+from callbacks import make_profile_callback, make_checkpoint_callback, latest_checkpoint, set_rng_states
 
 # Other utilities
 import yaml
 import argparse
 import os
+import numpy as np
+
+def train_agent(cfg,num_envs,vec_env,learning_rate,steps_to_train,tensorboard_log_dir=None,
+	model_name=None,pretrained='',n_cpu_tf_sess=None,resume=True):
+	"""
+	Trains an agent on the vibrating bridge environment
+
+	Inputs:
+		cfg:  A dict containing the parameters of the environment and of training
+		num_envs:  How many environments to collect experience from in parallel
+		vec_env:  How to run the parallel environments, one of VEC_ENV_TYPES
+		learning_rate:  The learning rate of PPO2
+		steps_to_train:  The number of timesteps to train for
+		tensorboard_log_dir:  Where the tensorboard information is saved, None for nowhere
+		model_name:  Where the trained model is saved, None to not save it
+		pretrained:  A path to a pretrained agent .pkl file to continue training, or ''
+		n_cpu_tf_sess:  How many threads tensorflow uses, all the CPUs if None
+		resume:  Whether to resume from the newest checkpoint in the checkpoint_dir key of cfg, if
+			checkpointing and there is one.  The run then trains for what is left of steps_to_train
+	Outputs:
+		model:  The trained agent
+	"""
+	# Setup the environment
+	env=make_vec_env(cfg,num_envs,vec_env)
+	checkpoint = None
+	if cfg.get('checkpoint_every',0) > 0 and resume:
+		checkpoint = latest_checkpoint(cfg.get('checkpoint_dir','checkpoints'))
+	if checkpoint is not None:
+		# Pick up the run where its newest checkpoint left off
+		print('Resuming from {} at {} timesteps'.format(checkpoint['path'],checkpoint['num_timesteps']))
+		model = make_model(env,learning_rate,tensorboard_log_dir,checkpoint['path'],n_cpu_tf_sess)
+		model.num_timesteps = checkpoint['num_timesteps']
+		set_rng_states(env,checkpoint['rng_states'])
+		steps_to_train = max(steps_to_train - checkpoint['num_timesteps'],0)
+	else:
+		model = make_model(env,learning_rate,tensorboard_log_dir,pretrained,n_cpu_tf_sess)
+
+	# Writes the phase timings of the environments to tensorboard if profiling, and checkpoints
+	# the agent if checkpointing
+	callback = [callback for callback in [make_callback(cfg,tensorboard_log_dir),
+		make_checkpoint_callback(cfg,make_score_function(cfg),checkpoint is not None)] if callback is not None]
+	model.learn(total_timesteps=steps_to_train,callback=callback or None,
+		reset_num_timesteps=checkpoint is None) # Train the model
+	if model_name is not None:
+		model.save(model_name) # Save the model
+	env.close()
+	return model
+
+def make_model(env,learning_rate,tensorboard_log_dir=None,pretrained='',n_cpu_tf_sess=None):
+	"""
+	Builds a new PPO2 agent for env, or loads the pretrained one, see train_agent
+	"""
+	# If we're using pretrained model make sure it's in the right format
+	if pretrained !='':
+		assert pretrained.endswith('.pkl') and os.path.isfile(pretrained), "The pretrained agent must be a valid path to a .pkl file"
+		return PPO2.load(pretrained,env=env,verbose=1,tensorboard_log=tensorboard_log_dir,n_cpu_tf_sess=n_cpu_tf_sess)
+	return PPO2(MlpPolicy, env=env, verbose=0,tensorboard_log=tensorboard_log_dir,learning_rate=learning_rate,
+		n_cpu_tf_sess=n_cpu_tf_sess)
+
+def make_callback(cfg,tensorboard_log_dir):
+	"""
+	Returns the callback of model.learn, None if there is nothing to log
+	"""
+	if tensorboard_log_dir is None:
+		return None
+	return make_profile_callback(cfg,tensorboard_log_dir)
+
+def make_score_function(cfg):
+	"""
+	Returns the function scoring checkpoints, the mean cumulative reward of checkpoint_eval_reps
+	batched evaluation repeats, or None if checkpoint_eval_reps is 0
+	"""
+	evaluation_repeats = cfg.get('checkpoint_eval_reps',0)
+	if evaluation_repeats <= 0:
+		return None
+	def score_function(model):
+		episodes = evaluate_agent(model,cfg,evaluation_repeats,cfg['num_rollout_steps'],cfg['threshold'],
+			evaluation_repeats,'batched')
+		return np.mean(episodes['cumulative_reward'])
+	return score_function
+
+def stage_config(cfg,stage):
+	"""
+	Returns the config of a curriculum stage, cfg overridden by the keys of the stage
+	"""
+	stage_cfg = dict(cfg)
+	stage_cfg.update({key:value for key,value in stage.items() if key != 'num_learning_steps'})
+	return stage_cfg
+
+def train_curriculum(cfg,stages,num_envs,vec_env,learning_rate,tensorboard_log_dir=None,
+	model_name=None,pretrained='',n_cpu_tf_sess=None):
+	"""
+	Trains one agent through a curriculum of environments, usually of increasingly fine lattices
+
+	Inputs:
+		cfg:  A dict containing the parameters of the environment and of training
+		stages:  A list of dicts, each with the num_learning_steps of the stage and the config
+			keys it overrides, such as num_lattice_points
+		model_name:  Where the trained model is saved, None to not save it.  The model is also
+			saved after each stage, to model_name + '_stage<i>'
+		The other inputs are those of train_agent
+	Outputs:
+		model:  The trained agent
+	"""
+	# The agent carries over from stage to stage, so the observations must have the same shape in
+	# every stage.  Check them all before spending any time on training
+	stage_cfgs = [stage_config(cfg,stage) for stage in stages]
+	shapes = [make_simulator(stage_cfg).observation_shape for stage_cfg in stage_cfgs]
+	if len(set(shapes)) > 1:
+		raise ValueError('The curriculum stages have observations of shapes {}, use an observation_encoder '
+			'that doesn\'t depend on num_lattice_points, such as resampled'.format(shapes))
+	model = None
+	for index,(stage,stage_cfg) in enumerate(zip(stages,stage_cfgs)):
+		env=make_vec_env(stage_cfg,num_envs,vec_env)
+		if model is None:
+			model = make_model(env,learning_rate,tensorboard_log_dir,pretrained,n_cpu_tf_sess)
+		else:
+			model.set_env(env)
+		# Keep counting timesteps across stages, so they form one run in tensorboard
+		model.learn(total_timesteps=stage['num_learning_steps'],callback=make_callback(stage_cfg,tensorboard_log_dir),
+			reset_num_timesteps=index == 0 and pretrained == '')
+		if model_name is not None:
+			model.save('{}_stage{}'.format(model_name,index))
+		env.close()
+	if model_name is not None:
+		model.save(model_name) # Save the model
+	return model
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
@@ -39,6 +185,14 @@ if __name__ == '__main__':
 		help='Save the trained model here',default='trained_agents/trained_model',type=str)
 	parser.add_argument('-lr',dest='learning_rate_val',
 		help='Overwrite the learning rate',default=-1.0,type=float)
+	parser.add_argument('--num-envs',dest='num_envs',
+		help='Overwrite the number of parallel environments',default=-1,type=int)
+	parser.add_argument('--vec-env',dest='vec_env',choices=VEC_ENV_TYPES,
+		help='Overwrite how the parallel environments are run',default=None,type=str)
+	parser.add_argument('--curriculum',dest='curriculum',action='store_true',
+		help='Train through the stages of the curriculum in config.yml')
+	parser.add_argument('--no-resume',dest='resume',action='store_false',
+		help='Start training from scratch even if there are checkpoints to resume from')
 	args = parser.parse_args()
 
 	# Make sure we find where the config file is
@@ -47,32 +201,31 @@ if __name__ == '__main__':
 	with open(config_path, 'r') as ymlfile:
 		cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
 
-	# Setup the environment
-	env=DummyVecEnv([lambda: VibratingBridge(cfg)])
+	# Do we overwrite the number of parallel environments
+	if args.num_envs >0:
+		num_envs = args.num_envs
+	else:
+		num_envs = cfg['num_envs']
+	# Do we overwrite how the parallel environments are run
+	if args.vec_env is not None:
+		vec_env = args.vec_env
+	else:
+		vec_env = cfg['vec_env']
+
 	# Do we overwrite the learning rate
 	if args.learning_rate_val >0:
 		learning_rate = args.learning_rate_val
 	else:
 		learning_rate = cfg['learning_rate_val']
 
-	# If we're using pretrained model make sure it's in the right format
-	if args.pretrained !='':
-		assert args.pretrained.endswith('.pkl') and os.path.isfile(args.pretrained), "The pretrained agent must be a valid path to a .pkl file"
-		if args.pretrained.endswith('.pkl') and os.path.isfile(args.pretrained):
-			model = PPO2.load(args.pretrained,env=env,verbose=1,tensorboard_log=args.tensorboard_log_dir)
-	else:
-		model = PPO2(MlpPolicy, env=env, verbose=0,tensorboard_log=args.tensorboard_log_dir,learning_rate=learning_rate)
-
 	# Set the number of training steps
 	if args.num_learning_steps >0:
 		steps_to_train = args.num_learning_steps
 	else:
 		steps_to_train = cfg['num_learning_steps']
-	model.learn(total_timesteps=steps_to_train) # Train the model
-	model.save(args.model_name) # Save the model
-
-
-
-
-
-
+	if args.curriculum or cfg.get('curriculum',False):
+		train_curriculum(cfg,cfg['curriculum_stages'],num_envs,vec_env,learning_rate,args.tensorboard_log_dir,
+			args.model_name,args.pretrained)
+	else:
+		train_agent(cfg,num_envs,vec_env,learning_rate,steps_to_train,args.tensorboard_log_dir,
+			args.model_name,args.pretrained,resume=args.resume)
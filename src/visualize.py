@@ -3,121 +3,193 @@ This script visualizes a rollout of an agent
 
 Currently it takes in several command line arguments:
 
--i:  A path to the npz file recording the rollout
+-i:  A path to the npz file (or streamed rollout directory) recording the rollout
 -f:  A path specifying the filenames of the visualization files
-
-It produces a gif animating the bridge and applied forces, and a plot of the energy value over time.
+--format:  The format of the animation, gif or mp4 (mp4 needs the imageio-ffmpeg package, default is gif)
+--stride:  Only animate every stride-th step of the rollout, for long rollouts (default is 1)
+--fps:  The frames per second of the animation (default is 10)
+--workers:  How many processes render the frames (default is the number of CPUs)
+
+It produces a gif (or mp4) animating the bridge and applied forces, and a plot of the energy value over time.
+The frames are rendered in chunks by a pool of worker processes, each drawing into one reused figure, and
+are streamed to the animation file as they come in rather than held in memory.
 """
 import sys
 sys.path.append('..')
 import numpy as np
-from scipy.integrate import simps
 import matplotlib.pyplot as plt
-from matplotlib import animation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import seaborn as sns
-import yaml
+import imageio
 import argparse
+import collections
+import multiprocessing
 import os
+from environments.rollout_storage import RolloutReader
 sns.set_style('white')
 
+# The phases of an episode, by the code recorded for each step, and how they are drawn
+PHASES = [(0,'warmup','r','warmup'),
+          (1,'equilibriate','g','equilibriate'),
+          (2,'dampen','b','dampen')]
+PHASE_NAMES = {code:name for code,name,color,label in PHASES}
+
+class FrameRenderer:
+    """
+    Draws frames of the bridge animation into a single figure whose artists are reused for
+    every frame.  The static parts of the figure (axes, labels and the zero line) are rasterized
+    once, and each frame only redraws the bridge, the impulse, the legend and the title over them.
+    """
+
+    def __init__(self,rollout_file,y_limits,dpi=100):
+        """
+        Inputs:
+            rollout_file:  The npz file or streamed rollout directory of the rollout
+            y_limits:  The (min,max) of the height axis, shared by every frame
+            dpi:  The resolution of the frames
+        """
+        self.data = RolloutReader(rollout_file)
+        self.u_array = self.data['height_array']
+        self.impulse_array = self.data['impulse_array']
+        self.code_array = self.data['code_array']
+        x_mesh = self.data['x_mesh']
+
+        # The layout follows the FuncAnimation version of this script
+        self.fig = Figure(dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax1 = self.fig.add_subplot(1,1,1,xlim=(x_mesh[0],x_mesh[-1]),ylim=y_limits)
+        ax1.set_xlabel('Bridge Position',fontsize=15)
+        ax1.set_ylabel('Height',fontsize=15)
+        zeros = np.zeros_like(x_mesh)
+        self.bridge_line = ax1.plot(x_mesh,zeros,lw=2,color='red',label='bridge')[0]
+        ax1.plot(x_mesh,zeros,lw=2,color='black')
+        self.impulse_line = ax1.plot(x_mesh,zeros,lw=2,color='green',label='impulse')[0]
+        self.legend = ax1.legend(loc='upper left')
+        self.title = ax1.set_title('',fontsize=15)
+        self.animated = [self.bridge_line,self.impulse_line,self.legend,self.title]
+        for artist in self.animated:
+            artist.set_animated(True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self,start,stop,stride):
+        """
+        Returns the frames of the steps start to stop (exclusive) taking every stride-th step, as
+        an array of RGB images of shape (num_frames,height,width,3)
+        """
+        steps = np.arange(start,stop,stride)
+        # Load the chunk of the rollout at once, streamed rollouts only read the chunks they need
+        u_frames = self.u_array[:,start:stop:stride]
+        impulse_frames = self.impulse_array[:,start:stop:stride]
+        width, height = self.canvas.get_width_height()
+        frames = np.empty((len(steps),height,width,3),dtype=np.uint8)
+        for index,step in enumerate(steps):
+            self.bridge_line.set_ydata(u_frames[:,index])
+            self.impulse_line.set_ydata(impulse_frames[:,index])
+            self.title.set_text('Step {} ({})'.format(int(step),PHASE_NAMES[int(self.code_array[step])]))
+            self.canvas.restore_region(self.background)
+            for artist in self.animated:
+                self.fig.draw_artist(artist)
+            frames[index] = np.asarray(self.canvas.buffer_rgba())[:,:,:3]
+        return frames
+
+# The FrameRenderer of a worker process
+renderer = None
+
+def init_renderer(rollout_file,y_limits,dpi):
+    """
+    Builds the FrameRenderer of a worker process
+    """
+    global renderer
+    renderer = FrameRenderer(rollout_file,y_limits,dpi)
+
+def render_chunk(chunk):
+    """
+    Renders a (start,stop,stride) chunk of steps with the FrameRenderer of this process
+    """
+    return renderer.render(*chunk)
+
+def render_animation(rollout_file,outname,stride=1,fps=10,num_workers=None,chunk_size=32,dpi=100):
+    """
+    Renders the animation of a rollout and streams its frames to a gif or mp4 file
+
+    Inputs:
+        rollout_file:  The npz file or streamed rollout directory of the rollout
+        outname:  The animation file, its extension sets the format
+        stride:  (int > 0) only every stride-th step of the rollout is animated
+        fps:  The frames per second of the animation
+        num_workers:  How many processes render the frames, all the CPUs if None
+        chunk_size:  How many frames a worker renders at a time
+        dpi:  The resolution of the frames
+    """
+    data = RolloutReader(rollout_file)
+    u_array = data['height_array']
+    impulse_array = data['impulse_array']
+    y_limits = (min([np.min(u_array),np.min(impulse_array)]),max([np.max(u_array),np.max(impulse_array)]))
+    frame_num = data.num_frames
+    data.close()
+    chunks = [(start,min(start + chunk_size*stride,frame_num),stride)
+              for start in range(0,frame_num,chunk_size*stride)]
+    if num_workers is None:
+        num_workers = os.cpu_count()
+
+    with imageio.get_writer(outname,fps=fps) as writer:
+        if num_workers <= 1:
+            init_renderer(rollout_file,y_limits,dpi)
+            for chunk in chunks:
+                for frame in render_chunk(chunk):
+                    writer.append_data(frame)
+            return
+        with multiprocessing.Pool(num_workers,initializer=init_renderer,
+                                  initargs=(rollout_file,y_limits,dpi)) as pool:
+            # Only keep a couple of chunks per worker in flight, so the rendered frames
+            # waiting to be written never hold more than a small part of the animation
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(render_chunk,(chunk,)))
+                if len(pending) >= 2*num_workers:
+                    for frame in pending.popleft().get():
+                        writer.append_data(frame)
+            while pending:
+                for frame in pending.popleft().get():
+                    writer.append_data(frame)
+
+def plot_energy(energy_array,code_array,outname):
+    """
+    Plots the energy over the episode, colored by phase
+    """
+    plt.figure()
+    for code,name,color,label in PHASES:
+        steps = np.flatnonzero(code_array == code)
+        plt.plot(steps,energy_array[steps],color,label=label)
+    plt.legend(loc='best')
+    plt.xlabel('step',fontsize=15)
+    plt.ylabel('energy',fontsize=15)
+    plt.savefig(outname)
+    plt.close()
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', dest='rollout_file',
         help='Path to the npz outputfile of a rollout',default='', type=str)
     parser.add_argument('-f',dest='output_prefix',
         help='Output visualization filenames start with this',default='rollouts/output',type=str)
+    parser.add_argument('--format',dest='animation_format',choices=['gif','mp4'],
+        help='The format of the animation',default='gif',type=str)
+    parser.add_argument('--stride',dest='stride',
+        help='Only animate every stride-th step',default=1,type=int)
+    parser.add_argument('--fps',dest='fps',
+        help='Frames per second of the animation',default=10,type=int)
+    parser.add_argument('--workers',dest='num_workers',
+        help='How many processes render the frames',default=None,type=int)
     args = parser.parse_args()
 
-    # Load in the numpy data
-    data = np.load(args.rollout_file)
-
-    # Unpack the data
-    u_array = data['height_array']
-    impulse_array = data['impulse_array']
-    energy_array = data['energy_array']
-    x_mesh = data['x_mesh']
-    code_array = data['code_array']
-
     # Animation of demo
-    # This animation method follows https://matplotlib.org/3.1.0/api/animation_api.html
-    x_min = x_mesh[0]
-    x_max = x_mesh[-1]
-
-    y_min = min([np.min(u_array),np.min(impulse_array)])
-    y_max = max([np.max(u_array),np.max(impulse_array)])
-    frame_num = np.shape(u_array)[1]
-
-    fig = plt.figure()
-    ax1 = plt.axes(xlim=(x_min, x_max), ylim=(y_min,y_max))
-    line, = ax1.plot([], [], lw=2)
-    plt.xlabel('Bridge Position',fontsize=15)
-    plt.ylabel('Height',fontsize=15)
-
-    plotlays, plotcols = [3], ["red","black","green"]
-    plotlegends = ['bridge','','impulse']
-    lines = []
-    for index in range(3):
-        lobj = ax1.plot([],[],lw=2,color=plotcols[index],label=plotlegends[index])[0]
-        lines.append(lobj)
-    ax1.legend(loc='upper left')
-
-    def init():
-        for line in lines:
-            line.set_data([],[])
-        return lines
-
-    def animate(i):
-
-        xlist = [x_mesh, x_mesh,x_mesh]
-        ylist = [u_array[:,i], np.zeros_like(u_array[:,i]),impulse_array[:,i]]
-        if code_array[i]==0:
-            plt.title('Step {} (warmup)'.format(int(i)),fontsize=15)
-        elif code_array[i]==1:
-            plt.title('Step {} (equilibriate)'.format(int(i)),fontsize=15)
-        elif code_array[i]==2:
-            plt.title('Step {} (dampen)'.format(int(i)),fontsize=15)
-        #for index in range(0,1):
-        for lnum,line in enumerate(lines):
-            line.set_data(xlist[lnum], ylist[lnum]) # set data for each line separately.
-
-        return lines
-
-    # Call the animator.  blit=True means only re-draw the parts that have changed.
-    anim = animation.FuncAnimation(fig, animate, init_func=init,
-                                   frames=frame_num,interval=100, blit=True)
-
-    Writer = animation.writers['pillow']
-    writer = Writer(fps=10, metadata=dict(artist='Me'), bitrate=1800)
-    anim_outname = args.output_prefix + '.gif'
-    anim.save(anim_outname, writer=writer)
-    plt.clf()
-    # Plot a graph of the energy over the episode
-
-    warmup_energy = []
-    warmup_step = []
-
-    equi_energy = []
-    equi_step= []
-
-    dampen_energy = []
-    dampen_step = []
-
-    for i in range(len(energy_array)):
-        if code_array[i]==0:
-            warmup_energy.append(energy_array[i])
-            warmup_step.append(i)
-        if code_array[i]==1:
-            equi_energy.append(energy_array[i])
-            equi_step.append(i)
-        if code_array[i]==2:
-            dampen_energy.append(energy_array[i])
-            dampen_step.append(i)
-
-    plt.plot(warmup_step,warmup_energy,'r',label='warmup')
-    plt.plot(equi_step,equi_energy,'g',label='equilibriate')
-    plt.plot(dampen_step,dampen_energy,'b',label='dampen')
-    plt.legend(loc='best')
-    plt.xlabel('step',fontsize=15)
-    plt.ylabel('energy',fontsize=15)
+    anim_outname = args.output_prefix + '.' + args.animation_format
+    render_animation(args.rollout_file,anim_outname,args.stride,args.fps,args.num_workers)
+
+    # Plot a graph of the energy over the episode, streamed rollouts load these fields in full
+    data = RolloutReader(args.rollout_file)
     trend_outname = args.output_prefix + '.png'
-    plt.savefig(trend_outname)
+    plot_energy(np.asarray(data['energy_array']),np.asarray(data['code_array']),trend_outname)
@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import importlib.util
+import shutil
+import tempfile
+import unittest
+import yaml
+import numpy as np
+
+from environments.simulators import SIMULATORS, make_simulator
+from environments.active_damping_env import VibratingBridge
+
+# The batched environment is a stable baselines VecEnv
+HAVE_STABLE_BASELINES = importlib.util.find_spec('stable_baselines') is not None
+
+class BatchedTestCase(unittest.TestCase):
+    """
+    This test suite checks that every batched simulator, and the batched environment, reproduce
+    independent single simulators and environments
+    """
+
+    def setUp(self):
+        CWD_PATH = os.getcwd()
+        config_path = os.path.join(CWD_PATH,'configs/config.yml')
+        with open(config_path, 'r') as ymlfile:
+            cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        cfg['backend'] = 'numpy'
+        cfg['dtype'] = 'float64'
+        cfg['energy_dtype'] = 'float64'
+        cfg['record_mode'] = 'none'
+        self.cfg = cfg
+        self.batch_size = 3
+        # The action of every bridge at every step, different for each bridge
+        self.actions = np.random.RandomState(0).uniform(cfg['min_force'],cfg['max_force'],
+                                                        size=(25,self.batch_size,cfg['num_force_points']))
+
+    def test_batched_simulators(self):
+        """
+        Tests that a batch of every simulator evolves like that many single simulators
+        """
+        for name in sorted(SIMULATORS):
+            with self.subTest(simulator=name):
+                config = dict(self.cfg,simulator=name)
+                batch = make_simulator(config,self.batch_size)
+                singles = [make_simulator(config) for _ in range(self.batch_size)]
+                for actions in self.actions:
+                    batch.take_in_action(actions)
+                    batch.run_substeps(2)
+                    for single,action in zip(singles,actions):
+                        single.take_in_action(action)
+                        single.run_substeps(2)
+                    np.testing.assert_allclose(batch.get_state(),np.stack([single.get_state() for single in singles],axis=1),
+                                               rtol=1e-9,atol=1e-12)
+                    np.testing.assert_allclose(batch.energy(),[single.energy() for single in singles],rtol=1e-9)
+
+    @unittest.skipUnless(HAVE_STABLE_BASELINES,'The batched environment needs stable_baselines')
+    def test_batched_environment(self):
+        """
+        Tests that the batched environment steps, and resets at the end of episodes, like that many
+        single environments.  Resets draw from a bank of a single state so they match
+        """
+        from environments.batched_damping_env import BatchedVibratingBridge
+        bank_dir = tempfile.mkdtemp()
+        try:
+            for name in sorted(SIMULATORS):
+                with self.subTest(simulator=name):
+                    config = dict(self.cfg,simulator=name,reset_bank_size=1,reset_bank_dir=bank_dir,max_steps=10)
+                    batch = BatchedVibratingBridge(config,self.batch_size)
+                    singles = [VibratingBridge(config) for _ in range(self.batch_size)]
+                    observations = batch.reset()
+                    np.testing.assert_allclose(observations,[single.reset() for single in singles],rtol=1e-6,atol=1e-6)
+                    for actions in self.actions.astype(np.float32):
+                        observations,rewards,dones,infos = batch.step(actions)
+                        for index,(single,action) in enumerate(zip(singles,actions)):
+                            observation,reward,done,info = single.step(action)
+                            self.assertEqual(dones[index],done)
+                            self.assertAlmostEqual(float(rewards[index]),reward,places=5)
+                            if done:
+                                np.testing.assert_allclose(infos[index]['terminal_observation'],observation,
+                                                           rtol=1e-6,atol=1e-6)
+                                observation = single.reset()
+                            np.testing.assert_allclose(observations[index],observation,rtol=1e-6,atol=1e-6)
+        finally:
+            shutil.rmtree(bank_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import importlib.util
+import pickle
+import shutil
+import tempfile
+import unittest
+
+# The callbacks are stable baselines callbacks that log to tensorflow
+HAVE_STABLE_BASELINES = all(importlib.util.find_spec(name) is not None for name in ['stable_baselines','tensorflow'])
+
+@unittest.skipUnless(HAVE_STABLE_BASELINES,'The checkpoint callback needs stable_baselines and tensorflow')
+class CheckpointTestCase(unittest.TestCase):
+    """
+    This test suite checks that the checkpoint index of a run only ever points at that run's checkpoints
+    """
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir)
+
+    def run_checkpoints(self,checkpoints,resume,keep_checkpoints=2):
+        """
+        Writes the (num_timesteps,score,model_bytes) checkpoints the way a training run does, resuming
+        from the checkpoints already in checkpoint_dir if resume is set
+        """
+        from callbacks import CheckpointCallback
+        callback = CheckpointCallback(self.checkpoint_dir,100,keep_checkpoints,resume=resume)
+        callback._on_training_start()
+        for num_timesteps,score,model_bytes in checkpoints:
+            callback.write_queue.put((num_timesteps,score,model_bytes,pickle.dumps([num_timesteps])))
+        callback._on_training_end()
+        return callback.index
+
+    def read(self,fname):
+        with open(os.path.join(self.checkpoint_dir,fname),'rb') as in_file:
+            return in_file.read()
+
+    def test_fresh_run(self):
+        """
+        Tests that a run that doesn't resume, in a directory holding an earlier run's checkpoints of the
+        same names, keeps its own checkpoints and best
+        """
+        from callbacks import latest_checkpoint
+        self.run_checkpoints([(100,5.0,b'old 100'),(200,5.0,b'old 200')],resume=True)
+        index = self.run_checkpoints([(100,1.0,b'new 100')],resume=False,keep_checkpoints=1)
+        self.assertEqual([checkpoint['num_timesteps'] for checkpoint in index['checkpoints']],[100])
+        self.assertEqual(index['best']['score'],1.0)
+        self.assertEqual(self.read('best.pkl'),b'new 100')
+        checkpoint = latest_checkpoint(self.checkpoint_dir)
+        self.assertEqual(checkpoint['num_timesteps'],100)
+        self.assertEqual(checkpoint['rng_states'],[100])
+        with open(checkpoint['path'],'rb') as model_file:
+            self.assertEqual(model_file.read(),b'new 100')
+
+    def test_fresh_run_before_first_checkpoint(self):
+        """
+        Tests that once a run that doesn't resume has started, the earlier run's checkpoints aren't resumed from
+        """
+        from callbacks import latest_checkpoint
+        self.run_checkpoints([(100,None,b'old 100')],resume=True)
+        self.run_checkpoints([],resume=False)
+        self.assertIsNone(latest_checkpoint(self.checkpoint_dir))
+
+    def test_resumed_run(self):
+        """
+        Tests that a resumed run carries on the index, and that rewriting a checkpoint replaces its entry
+        """
+        from callbacks import latest_checkpoint
+        self.run_checkpoints([(100,None,b'first 100'),(200,None,b'first 200')],resume=True)
+        index = self.run_checkpoints([(200,None,b'second 200'),(300,None,b'second 300')],resume=True)
+        self.assertEqual([checkpoint['num_timesteps'] for checkpoint in index['checkpoints']],[200,300])
+        self.assertEqual(self.read('checkpoint_200.pkl'),b'second 200')
+        self.assertFalse(os.path.exists(os.path.join(self.checkpoint_dir,'checkpoint_100.pkl')))
+        self.assertEqual(latest_checkpoint(self.checkpoint_dir)['num_timesteps'],300)
+
+if __name__ == '__main__':
+    unittest.main()
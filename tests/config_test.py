@@ -30,6 +30,22 @@ class ConfigFileTestCase(unittest.TestCase):
             'Number of rollout steps must be an integer')
         self.assertTrue(self.cfg['num_rollout_steps']>0,'Number of learning steps must be greater than zero')
         self.assertTrue(self.cfg['learning_rate_val']>0,'Learning rate must be > 0')
+        self.assertTrue(0<self.cfg['threshold']<1,'The evaluation threshold must be between 0 and 1')
+        self.assertIsInstance(self.cfg['track_threshold'],bool,'track_threshold must be True or False')
+        self.assertIsInstance(self.cfg['num_envs'],int,
+            'Number of parallel environments must be an integer')
+        self.assertTrue(self.cfg['num_envs']>0,'Number of parallel environments must be greater than zero')
+        self.assertIn(self.cfg['vec_env'],['dummy','subproc','batched'],
+            'vec_env must be one of dummy, subproc or batched')
+        self.assertIsInstance(self.cfg['profile'],bool,'profile must be True or False')
+        self.assertTrue(self.cfg['seed'] is None or isinstance(self.cfg['seed'],int),'seed must be null or an integer')
+        self.assertIsInstance(self.cfg['checkpoint_every'],int,'checkpoint_every must be an integer')
+        self.assertTrue(self.cfg['checkpoint_every']>=0,'checkpoint_every must be >= 0')
+        self.assertIsInstance(self.cfg['checkpoint_dir'],str,'checkpoint_dir must be a path')
+        self.assertIsInstance(self.cfg['keep_checkpoints'],int,'keep_checkpoints must be an integer')
+        self.assertTrue(self.cfg['keep_checkpoints']>0,'keep_checkpoints must be greater than zero')
+        self.assertIsInstance(self.cfg['checkpoint_eval_reps'],int,'checkpoint_eval_reps must be an integer')
+        self.assertTrue(self.cfg['checkpoint_eval_reps']>=0,'checkpoint_eval_reps must be >= 0')
 
     def test_environment_parameters(self):
         """
@@ -47,12 +63,99 @@ class ConfigFileTestCase(unittest.TestCase):
         for param in negative_param_list:
             error_string = '{} must be < 0'.format(param)
             self.assertTrue(self.cfg[param]<0,error_string)
+        # The explicit scheme is only stable up to a courant number of 1
+        if self.cfg['simulator'] == 'finite_difference':
+            dx = self.cfg['system_length']/self.cfg['num_lattice_points']
+            self.assertTrue(self.cfg['wave_speed']*self.cfg['time_interval']<=dx,
+                'The finite difference scheme needs wave_speed*time_interval <= the lattice spacing')
         # Test for params that must be integers
         int_param_list = ['num_lattice_points','num_warmup_steps','num_equi_steps',
         'timepoints_per_step','max_steps','num_force_points']
         for param in int_param_list:
             error_string = '{} must be an integer'.format(param)
             self.assertIsInstance(self.cfg[param],int,error_string)
+        self.assertIn(self.cfg['simulator'],['finite_difference','modal','implicit'],
+            'simulator must be finite_difference, modal or implicit')
+        for param in ['dtype','energy_dtype']:
+            self.assertIn(self.cfg[param],['float32','float64'],'{} must be float32 or float64'.format(param))
+        self.assertIn(self.cfg['backend'],['numpy','numba'],'backend must be numpy or numba')
+
+    def test_observation_parameters(self):
+        """
+        Tests to make sure the observation parameters are valid
+        """
+        self.assertIn(self.cfg['observation_mode'],['full','height_velocity'],
+            'observation_mode must be full or height_velocity')
+        self.assertIn(self.cfg['observation_encoder'],['lattice','sensors','modal','pooled','resampled'],
+            'observation_encoder must be one of lattice, sensors, modal, pooled or resampled')
+        self.assertIsInstance(self.cfg['num_sensors'],int,'num_sensors must be an integer')
+        self.assertTrue(0<=self.cfg['num_sensors']<self.cfg['num_lattice_points'],
+            'num_sensors must be >= 0 and less than num_lattice_points')
+        if self.cfg['observation_encoder'] == 'sensors':
+            self.assertTrue(self.cfg['num_sensors']>0,'The sensors encoder needs num_sensors > 0')
+        self.assertIsInstance(self.cfg['num_observed_modes'],int,'num_observed_modes must be an integer')
+        self.assertTrue(0<self.cfg['num_observed_modes']<self.cfg['num_lattice_points'],
+            'num_observed_modes must be > 0 and less than num_lattice_points')
+        self.assertIsInstance(self.cfg['pool_size'],int,'pool_size must be an integer')
+        self.assertTrue(0<self.cfg['pool_size']<=self.cfg['num_lattice_points'],
+            'pool_size must be > 0 and at most num_lattice_points')
+        self.assertIsInstance(self.cfg['num_observed_points'],int,'num_observed_points must be an integer')
+        self.assertTrue(self.cfg['num_observed_points']>=2,'num_observed_points must be >= 2')
+
+    def test_curriculum_parameters(self):
+        """
+        Tests to make sure every stage of the curriculum has a step budget, only overrides config
+        keys and keeps the finite difference scheme stable
+        """
+        self.assertIsInstance(self.cfg['curriculum'],bool,'curriculum must be True or False')
+        self.assertTrue(len(self.cfg['curriculum_stages'])>0,'The curriculum needs at least one stage')
+        for index,stage in enumerate(self.cfg['curriculum_stages']):
+            self.assertIsInstance(stage['num_learning_steps'],int,
+                'The num_learning_steps of stage {} must be an integer'.format(index))
+            self.assertTrue(stage['num_learning_steps']>0,
+                'The num_learning_steps of stage {} must be > 0'.format(index))
+            for key in stage:
+                self.assertIn(key,self.cfg,'Stage {} sets {}, which is not a config key'.format(index,key))
+            stage_cfg = dict(self.cfg)
+            stage_cfg.update(stage)
+            if stage_cfg['simulator'] == 'finite_difference':
+                dx = stage_cfg['system_length']/stage_cfg['num_lattice_points']
+                self.assertTrue(stage_cfg['wave_speed']*stage_cfg['time_interval']<=dx,
+                    'Stage {} violates the courant condition of the finite difference scheme'.format(index))
+
+    def test_recording_parameters(self):
+        """
+        Tests to make sure the trajectory recording parameters are valid
+        """
+        self.assertIn(self.cfg['record_mode'],['none','ring','full','stream'],
+            'record_mode must be one of none, ring, full or stream')
+        self.assertIsInstance(self.cfg['record_buffer_size'],int,
+            'record_buffer_size must be an integer')
+        self.assertTrue(self.cfg['record_buffer_size']>0,'record_buffer_size must be > 0')
+        self.assertIsInstance(self.cfg['record_every'],int,'record_every must be an integer')
+        self.assertTrue(self.cfg['record_every']>0,'record_every must be > 0')
+        self.assertIsInstance(self.cfg['stream_chunk_size'],int,'stream_chunk_size must be an integer')
+        self.assertTrue(self.cfg['stream_chunk_size']>0,'stream_chunk_size must be > 0')
+        self.assertIsInstance(self.cfg['stream_compress'],bool,'stream_compress must be True or False')
+
+    def test_reset_bank_parameters(self):
+        """
+        Tests to make sure the reset bank parameters are valid
+        """
+        self.assertIsInstance(self.cfg['reset_bank_size'],int,'reset_bank_size must be an integer')
+        self.assertTrue(self.cfg['reset_bank_size']>=0,'reset_bank_size must be >= 0')
+        self.assertIsInstance(self.cfg['reset_bank_dir'],str,'reset_bank_dir must be a string')
+
+    def test_sweep_spec(self):
+        """
+        Tests to make sure the example sweep spec only sweeps over keys of the config
+        """
+        spec_path = os.path.join(os.getcwd(),'configs/sweep.yml')
+        with open(spec_path, 'r') as ymlfile:
+            spec = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        self.assertIn(spec['mode'],['grid','random'],'The sweep mode must be grid or random')
+        for key in list(spec['parameters']) + list(spec.get('config',{})):
+            self.assertIn(key,self.cfg,'The sweep spec sets {}, which is not a config key'.format(key))
 
 
         
@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import unittest
+import yaml
+import numpy as np
+
+from environments.simulators import make_simulator
+from environments.observation_encoders import OBSERVATION_ENCODERS, OBSERVATION_MODES
+
+class ObservationEncoderTestCase(unittest.TestCase):
+    """
+    This test suite checks the shapes and values of the observations of every encoder
+    """
+
+    def setUp(self):
+        CWD_PATH = os.getcwd()
+        config_path = os.path.join(CWD_PATH,'configs/config.yml')
+        with open(config_path, 'r') as ymlfile:
+            cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        cfg['simulator'] = 'finite_difference'
+        cfg['dtype'] = 'float64'
+        cfg['num_sensors'] = 4
+        cfg['num_observed_modes'] = 5
+        cfg['pool_size'] = 4
+        cfg['num_observed_points'] = 11
+        self.cfg = cfg
+
+    def simulator_with_state(self,config,current,previous):
+        """
+        Returns a simulator of config whose current and previous time levels are set to functions
+        of the lattice position x, from 0 to 1
+        """
+        simulator = make_simulator(config)
+        x = np.arange(simulator.Nx + 1)/simulator.Nx
+        simulator.set_state(np.stack([current(x),previous(x)]))
+        return simulator
+
+    def test_shapes(self):
+        """
+        Tests that every encoder declares the shape of the observations it writes, in every mode and for batches
+        """
+        expected_features = {'lattice':self.cfg['num_lattice_points'] + 1,'sensors':4,'modal':5,
+                             'pooled':int(np.ceil((self.cfg['num_lattice_points'] + 1)/4)),'resampled':11}
+        for name in sorted(OBSERVATION_ENCODERS):
+            for mode in OBSERVATION_MODES:
+                with self.subTest(encoder=name,mode=mode):
+                    config = dict(self.cfg,observation_encoder=name,observation_mode=mode)
+                    simulator = make_simulator(config)
+                    num_channels = 3 if mode == 'full' else 2
+                    self.assertEqual(simulator.observation_shape,(1,expected_features[name],num_channels))
+                    self.assertEqual(simulator.get_observation().shape,simulator.observation_shape)
+                    batch = make_simulator(config,2)
+                    out = np.zeros((2,) + batch.observation_shape,dtype=np.float32)
+                    self.assertIs(batch.get_observation(out),out)
+
+    def test_values(self):
+        """
+        Tests the features of each encoder on known height profiles
+        """
+        Nx = self.cfg['num_lattice_points']
+        profile = lambda x: 0.3*np.sin(np.pi*x) - 0.2*np.sin(3*np.pi*x)
+        previous = lambda x: 0.5*profile(x)
+
+        simulator = self.simulator_with_state(dict(self.cfg,observation_encoder='lattice'),profile,previous)
+        observation = simulator.get_observation()
+        np.testing.assert_allclose(observation[0,:,0],simulator.height_n)
+        np.testing.assert_allclose(observation[0,:,1],simulator.height_n)
+        np.testing.assert_allclose(observation[0,:,2],simulator.height_nm1)
+
+        simulator = self.simulator_with_state(dict(self.cfg,observation_encoder='sensors'),profile,previous)
+        sensor_points = simulator.observation_encoder.sensor_points
+        self.assertTrue(np.all((sensor_points > 0) & (sensor_points < Nx)),'The sensors must be interior points')
+        np.testing.assert_allclose(simulator.get_observation()[0,:,0],simulator.height_n[sensor_points])
+
+        # The modal features are the amplitudes of the sine modes
+        simulator = self.simulator_with_state(dict(self.cfg,observation_encoder='modal'),profile,previous)
+        np.testing.assert_allclose(simulator.get_observation()[0,:,0],[0.3,0.0,-0.2,0.0,0.0],atol=1e-12)
+
+        simulator = self.simulator_with_state(dict(self.cfg,observation_encoder='pooled'),profile,previous)
+        windows = [simulator.height_n[start:start + 4] for start in range(0,Nx + 1,4)]
+        np.testing.assert_allclose(simulator.get_observation()[0,:,0],[np.mean(window) for window in windows])
+
+        # The resampled features of a linear profile are exact, and the same for every lattice
+        linear = lambda x: np.minimum(x,1.0 - x)
+        features = []
+        for num_lattice_points in [10,20,40]:
+            config = dict(self.cfg,observation_encoder='resampled',num_lattice_points=num_lattice_points)
+            features.append(self.simulator_with_state(config,linear,linear).get_observation()[0,:,0])
+        for feature in features:
+            np.testing.assert_allclose(feature,linear(np.linspace(0,1,11)),atol=1e-12)
+
+    def test_velocity(self):
+        """
+        Tests that height_velocity observations hold the encoded velocity for every encoder
+        """
+        profile = lambda x: np.sin(np.pi*x)
+        previous = lambda x: 0.9*np.sin(np.pi*x)
+        for name in sorted(OBSERVATION_ENCODERS):
+            with self.subTest(encoder=name):
+                config = dict(self.cfg,observation_encoder=name,observation_mode='height_velocity')
+                simulator = self.simulator_with_state(config,profile,previous)
+                observation = simulator.get_observation()
+                velocity = simulator.observation_encoder.encode(
+                    self.simulator_with_state(dict(config,observation_mode='full'),
+                                              lambda x: (profile(x) - previous(x))/simulator.dt,lambda x: 0*x))
+                np.testing.assert_allclose(observation[0,:,1],velocity[0,:,0],rtol=1e-9,atol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
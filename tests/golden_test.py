@@ -0,0 +1,49 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import unittest
+import yaml
+import numpy as np
+
+from golden_trajectories import VARIANTS, QUANTITIES, variant_config, run_trajectory, check_variant
+
+class GoldenTrajectoryTestCase(unittest.TestCase):
+    """
+    This test suite checks that seeded environments are reproducible, and that the alternative
+    backends and precisions of the simulation reproduce the reference trajectories
+    """
+
+    def setUp(self):
+        CWD_PATH = os.getcwd()
+        config_path = os.path.join(CWD_PATH,'configs/config.yml')
+        with open(config_path, 'r') as ymlfile:
+            cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        self.cfg = cfg
+        self.num_steps = min(20,cfg['max_steps'] - 1)
+
+    def test_seeded_trajectories(self):
+        """
+        Tests that the same seed gives the same trajectory and that different seeds don't
+        """
+        config = variant_config(self.cfg)
+        first = run_trajectory(config,0,self.num_steps)
+        again = run_trajectory(config,0,self.num_steps)
+        other = run_trajectory(config,1,self.num_steps)
+        for quantity in QUANTITIES:
+            np.testing.assert_array_equal(first[quantity],again[quantity],
+                '{} must be the same for the same seed'.format(quantity))
+        self.assertFalse(np.allclose(first['heights'],other['heights']),'Different seeds must give different episodes')
+
+    def test_variants(self):
+        """
+        Tests that the numba backend, the float32 simulation and the modal and implicit simulators match
+        the reference within tolerance.  Without numba the numba variant falls back to the reference backend
+        """
+        for name in ['numba','float32','modal','implicit']:
+            with self.subTest(variant=name):
+                overrides,tolerances,refinement = VARIANTS[name]
+                errors,passed = check_variant(self.cfg,overrides,tolerances,[0,1],self.num_steps,refinement=refinement)
+                self.assertTrue(passed,'The {} variant is out of tolerance: {}'.format(name,errors))
+
+if __name__ == '__main__':
+    unittest.main()
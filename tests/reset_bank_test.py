@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import shutil
+import tempfile
+import unittest
+import yaml
+import numpy as np
+
+from environments.reset_bank import (physics_hash, bank_seed, bank_path, simulate_warmup,
+                                     generate_reset_bank, load_reset_bank)
+
+class ResetBankTestCase(unittest.TestCase):
+    """
+    This test suite checks that reset banks are keyed by the physics, reused and regenerated reproducibly
+    """
+
+    def setUp(self):
+        CWD_PATH = os.getcwd()
+        config_path = os.path.join(CWD_PATH,'configs/config.yml')
+        with open(config_path, 'r') as ymlfile:
+            cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        self.bank_dir = tempfile.mkdtemp()
+        cfg['reset_bank_size'] = 6
+        cfg['reset_bank_dir'] = self.bank_dir
+        self.cfg = cfg
+
+    def tearDown(self):
+        shutil.rmtree(self.bank_dir)
+
+    def test_physics_hash(self):
+        """
+        Tests that the bank is keyed by the physics parameters and the size only
+        """
+        self.assertEqual(physics_hash(self.cfg),physics_hash(dict(self.cfg,max_steps=self.cfg['max_steps'] + 1,seed=3)))
+        self.assertEqual(bank_path(self.cfg),bank_path(dict(self.cfg,learning_rate_val=1.0)))
+        for key,value in [('wave_speed',0.5*self.cfg['wave_speed']),('energy_dtype','float32'),
+                          ('simulator','modal'),('num_equi_steps',self.cfg['num_equi_steps'] + 1)]:
+            with self.subTest(key=key):
+                self.assertNotEqual(physics_hash(self.cfg),physics_hash(dict(self.cfg,**{key:value})))
+        self.assertNotEqual(bank_path(self.cfg),bank_path(dict(self.cfg,reset_bank_size=7)))
+
+    def test_generation(self):
+        """
+        Tests that a new bank holds the states simulate_warmup gives with the seed of its physics
+        """
+        bank = load_reset_bank(self.cfg)
+        self.assertEqual(os.listdir(self.bank_dir),[os.path.basename(bank_path(self.cfg))])
+        self.assertEqual(len(bank),6)
+        state, equi_energy = simulate_warmup(self.cfg,6,np.random.RandomState(bank_seed(self.cfg)))
+        np.testing.assert_array_equal(bank.states,np.swapaxes(state,0,1))
+        np.testing.assert_array_equal(bank.equi_energy,equi_energy)
+        state, energy = bank.sample(np.random.RandomState(0),4)
+        self.assertEqual(state.shape,(2,4,self.cfg['num_lattice_points'] + 1))
+        self.assertEqual(energy.shape,(4,))
+        self.assertIsNone(load_reset_bank(dict(self.cfg,reset_bank_size=0)))
+
+    def test_reuse_and_regeneration(self):
+        """
+        Tests that an existing bank is loaded rather than generated again, and that regenerating it,
+        here or on another machine, gives the same bank
+        """
+        bank = load_reset_bank(self.cfg)
+        path = bank_path(self.cfg)
+        modified = os.stat(path).st_mtime_ns
+        again = load_reset_bank(self.cfg)
+        self.assertEqual(os.stat(path).st_mtime_ns,modified,'An existing bank must not be regenerated')
+        np.testing.assert_array_equal(again.states,bank.states)
+
+        other_dir = os.path.join(self.bank_dir,'other')
+        other = load_reset_bank(dict(self.cfg,reset_bank_dir=other_dir))
+        np.testing.assert_array_equal(other.states,bank.states)
+        np.testing.assert_array_equal(other.equi_energy,bank.equi_energy)
+
+        # A bank of other physics is generated in its own file
+        changed = dict(self.cfg,wave_speed=0.5*self.cfg['wave_speed'])
+        self.assertFalse(np.allclose(load_reset_bank(changed).equi_energy,bank.equi_energy))
+        self.assertTrue(os.path.isfile(path))
+
+        # Regenerating replaces the file as a whole
+        generate_reset_bank(self.cfg,seed=1)
+        regenerated = load_reset_bank(self.cfg)
+        state, equi_energy = simulate_warmup(self.cfg,6,np.random.RandomState(1))
+        np.testing.assert_array_equal(regenerated.states,np.swapaxes(state,0,1))
+        np.testing.assert_array_equal(regenerated.equi_energy,equi_energy)
+        self.assertFalse(any(fname.endswith('.tmp') for fname in os.listdir(self.bank_dir)))
+
+if __name__ == '__main__':
+    unittest.main()
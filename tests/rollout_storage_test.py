@@ -0,0 +1,102 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from environments.rollout_storage import RolloutWriter, RolloutReader, MANIFEST_NAME
+
+class RolloutStorageTestCase(unittest.TestCase):
+    """
+    This test suite checks that streamed rollouts read back the steps that were written to them
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.num_points = 5
+        self.num_frames = 23
+        random = np.random.RandomState(0)
+        self.height = random.normal(size=(self.num_frames,self.num_points))
+        self.impulse = random.normal(size=(self.num_frames,self.num_points))
+        self.energy = random.uniform(1.0,2.0,size=self.num_frames)
+        self.code = random.randint(0,3,size=self.num_frames)
+        self.x_mesh = np.linspace(0,1,self.num_points)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_rollout(self,path,compress,chunk_size=10,equi_energy=None):
+        """
+        Streams the steps of setUp to path, normalizing the energy by equi_energy if given
+        """
+        writer = RolloutWriter(path,self.num_points,chunk_size,compress)
+        writer.open(self.x_mesh)
+        for step in range(self.num_frames):
+            writer.append(self.height[step],self.impulse[step],self.energy[step],self.code[step])
+        if equi_energy is not None:
+            writer.normalize_energy(equi_energy)
+        writer.flush()
+        return writer
+
+    def test_round_trip(self):
+        """
+        Tests that compressed and uncompressed rollouts, with a partially filled last chunk, read back
+        like the arrays saved by VibratingBridge.render
+        """
+        for compress in [False,True]:
+            with self.subTest(compress=compress):
+                path = os.path.join(self.path,'compressed' if compress else 'uncompressed')
+                writer = self.write_rollout(path,compress,equi_energy=2.0)
+                self.assertEqual(writer.num_frames,self.num_frames)
+                reader = RolloutReader(path,cache_size=1)
+                self.assertEqual(reader.num_frames,self.num_frames)
+                height_array = reader['height_array']
+                self.assertEqual(height_array.shape,(self.num_points,self.num_frames))
+                np.testing.assert_array_equal(np.asarray(height_array),self.height.T)
+                np.testing.assert_array_equal(np.asarray(reader['impulse_array']),self.impulse.T)
+                np.testing.assert_allclose(reader['energy_array'],self.energy/2.0)
+                np.testing.assert_array_equal(reader['code_array'],self.code)
+                np.testing.assert_array_equal(reader['x_mesh'],self.x_mesh)
+                # Slices across chunk boundaries, with strides, and single steps
+                np.testing.assert_array_equal(height_array[:,5:21:3],self.height.T[:,5:21:3])
+                np.testing.assert_array_equal(height_array[2,8:12],self.height.T[2,8:12])
+                np.testing.assert_array_equal(height_array[:,-1],self.height[-1])
+                np.testing.assert_array_equal(height_array[:,15],self.height[15])
+                with self.assertRaises(IndexError):
+                    height_array[:,self.num_frames]
+                reader.close()
+
+    def test_reductions(self):
+        """
+        Tests that min and max reduce over the whole field and along either axis like numpy does
+        """
+        self.write_rollout(self.path,False,chunk_size=4)
+        height_array = RolloutReader(self.path)['height_array']
+        self.assertEqual(height_array.min(),self.height.min())
+        self.assertEqual(np.max(height_array),self.height.max())
+        for axis in [0,1,-1]:
+            with self.subTest(axis=axis):
+                np.testing.assert_array_equal(height_array.min(axis=axis),self.height.T.min(axis=axis))
+                np.testing.assert_array_equal(np.max(height_array,axis=axis),self.height.T.max(axis=axis))
+        with self.assertRaises(ValueError):
+            height_array.min(axis=2)
+        with self.assertRaises(ValueError):
+            height_array.max(out=np.zeros(self.num_frames))
+
+    def test_open_truncates(self):
+        """
+        Tests that constructing a writer leaves an existing rollout alone, and that open removes it
+        """
+        self.write_rollout(self.path,False)
+        writer = RolloutWriter(self.path,self.num_points)
+        np.testing.assert_array_equal(RolloutReader(self.path)['code_array'],self.code)
+        with self.assertRaises(ValueError):
+            writer.append(self.height[0],self.impulse[0],self.energy[0],self.code[0])
+        writer.open()
+        self.assertFalse(os.path.exists(os.path.join(self.path,MANIFEST_NAME)))
+        self.assertEqual(os.listdir(self.path),['x_mesh.npy'])
+
+if __name__ == '__main__':
+    unittest.main()
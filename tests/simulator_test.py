@@ -0,0 +1,157 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import unittest
+import yaml
+import numpy as np
+
+from environments.simulators import make_simulator
+
+class SimulatorTestCase(unittest.TestCase):
+    """
+    This test suite checks that the simulators advance the bridge consistently, whatever the
+    backend and however the steps are taken
+    """
+
+    def setUp(self):
+        CWD_PATH = os.getcwd()
+        config_path = os.path.join(CWD_PATH,'configs/config.yml')
+        with open(config_path, 'r') as ymlfile:
+            cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        cfg['simulator'] = 'finite_difference'
+        cfg['dtype'] = 'float64'
+        cfg['energy_dtype'] = 'float64'
+        self.cfg = cfg
+        self.action = np.linspace(-1.0,1.0,cfg['num_force_points'])
+
+    def driven_simulator(self,config,batch_size=None):
+        """
+        Returns a simulator of config with a fixed action applied, a different one for every bridge of a batch
+        """
+        simulator = make_simulator(config,batch_size)
+        if batch_size is None:
+            simulator.take_in_action(self.action)
+        else:
+            simulator.take_in_action(np.outer(np.arange(1,batch_size + 1),self.action))
+        return simulator
+
+    def test_advance_no_steps(self):
+        """
+        Tests that advancing by no steps while recording the energy leaves the state alone on both backends
+        """
+        for backend in ['numpy','numba']:
+            for batch_size in [None,3]:
+                simulator = self.driven_simulator(dict(self.cfg,backend=backend),batch_size)
+                simulator.advance(5)
+                state = simulator.get_state()
+                records = simulator.advance(0,1,('energy',))
+                self.assertEqual(len(records['energy']),0,'advance(0) must record nothing')
+                np.testing.assert_array_equal(simulator.get_state(),state,'advance(0) must not change the state')
+
+    def test_advance_strides(self):
+        """
+        Tests that advance records the same heights and energies as stepping one step at a time
+        """
+        for backend in ['numpy','numba']:
+            reference = self.driven_simulator(self.cfg)
+            heights, energies = [], []
+            for step in range(1,13):
+                reference.single_step()
+                if step % 3 == 0:
+                    heights.append(reference.height.copy())
+                    energies.append(reference.energy())
+            simulator = self.driven_simulator(dict(self.cfg,backend=backend))
+            records = simulator.advance(12,3,('height','energy'))
+            np.testing.assert_array_equal(records['step'],[3,6,9,12])
+            np.testing.assert_allclose(records['height'],heights,rtol=1e-10,atol=1e-12)
+            np.testing.assert_allclose(records['energy'],energies,rtol=1e-10)
+            np.testing.assert_allclose(simulator.get_state(),reference.get_state(),rtol=1e-10,atol=1e-12)
+
+    def test_modal_batch_set_state(self):
+        """
+        Tests that setting the state of some bridges of a driven modal batch evolves them like single
+        simulators started from that state, as the batched environment does when it resets bridges
+        """
+        config = dict(self.cfg,simulator='modal')
+        source = self.driven_simulator(config)
+        source.advance(7)
+        source.take_in_action(np.zeros_like(self.action))
+        source.advance(5)
+        state = source.get_state()
+
+        batch = self.driven_simulator(config,3)
+        batch.advance(4)
+        batch.set_state(state[:,np.newaxis],[1])
+        single = make_simulator(config)
+        single.set_state(state)
+        actions = np.outer(np.arange(1,4),self.action)
+        for step in range(10):
+            batch.take_in_action(actions)
+            single.take_in_action(actions[1])
+            batch.single_step()
+            single.single_step()
+            np.testing.assert_allclose(batch.get_state()[:,1],single.get_state(),rtol=1e-9,atol=1e-12)
+
+    def standing_wave(self,simulator):
+        """
+        Returns the two time levels of a standing wave of two sine modes of simulator, at time 0 and one
+        time interval before, from the exact frequencies of the lattice
+        """
+        modal = make_simulator(dict(self.cfg,simulator='modal',time_interval=simulator.dt,
+                                    num_lattice_points=simulator.Nx))
+        state = np.zeros((2,simulator.Nx + 1))
+        for mode,amplitude in [(1,1.0),(3,0.5)]:
+            shape = amplitude*np.sin(mode*np.pi*np.arange(simulator.Nx + 1)/simulator.Nx)
+            state[0] += shape
+            state[1] += shape*np.cos(modal.frequencies[mode - 1]*simulator.dt)
+        return state
+
+    def test_modal_converges_to_finite_difference(self):
+        """
+        Tests that the finite difference scheme converges to the exact modal dynamics of the same lattice
+        at second order in the time interval, from a standing wave of two sine modes
+        """
+        errors = []
+        for refinement in [2,4,8]:
+            config = dict(self.cfg,time_interval=self.cfg['time_interval']/refinement)
+            finite_difference = make_simulator(config)
+            modal = make_simulator(dict(config,simulator='modal'))
+            state = self.standing_wave(modal)
+            finite_difference.set_state(state)
+            modal.set_state(state)
+            finite_difference.advance(20*refinement)
+            modal.advance(20*refinement)
+            errors.append(np.max(np.abs(finite_difference.height - modal.height)))
+        self.assertTrue(errors[0] > 0,'The schemes must differ at a finite time interval')
+        for coarse,fine in zip(errors[:-1],errors[1:]):
+            self.assertTrue(3.0 < coarse/fine < 5.0,'The error must fall as time_interval**2, got {}'.format(errors))
+
+    def test_implicit_large_time_interval(self):
+        """
+        Tests that the implicit simulator stays bounded far beyond the courant limit of the explicit
+        scheme, and that it converges to the modal dynamics at second order in the time interval
+        """
+        config = dict(self.cfg,simulator='implicit',num_lattice_points=100,time_interval=1.0)
+        simulator = make_simulator(config)
+        self.assertTrue(simulator.C > 10,'The test needs a courant number well above 1')
+        simulator.set_state(self.standing_wave(simulator))
+        records = simulator.advance(1000,1,('height',))
+        amplitude = np.max(np.abs(records['height']),axis=-1)
+        self.assertTrue(np.max(amplitude[500:]) <= 1.01*np.max(amplitude[:500]),'The implicit scheme must not grow')
+
+        errors = []
+        for refinement in [2,4,8]:
+            config = dict(self.cfg,simulator='implicit',time_interval=self.cfg['time_interval']/refinement)
+            implicit = make_simulator(config)
+            modal = make_simulator(dict(config,simulator='modal'))
+            state = self.standing_wave(implicit)
+            implicit.set_state(state)
+            modal.set_state(state)
+            implicit.advance(20*refinement)
+            modal.advance(20*refinement)
+            errors.append(np.max(np.abs(implicit.height - modal.height)))
+        for coarse,fine in zip(errors[:-1],errors[1:]):
+            self.assertTrue(3.0 < coarse/fine < 5.0,'The error must fall as time_interval**2, got {}'.format(errors))
+
+if __name__ == '__main__':
+    unittest.main()
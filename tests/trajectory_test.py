@@ -0,0 +1,116 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+import shutil
+import tempfile
+import unittest
+import yaml
+import numpy as np
+
+from environments.trajectory import (make_recorder, TrajectoryRecorder, FullTrajectoryRecorder,
+                                     RingTrajectoryRecorder, StreamingTrajectoryRecorder)
+from environments.rollout_storage import RolloutReader
+
+class TrajectoryRecorderTestCase(unittest.TestCase):
+    """
+    This test suite checks that every record_mode keeps the dynamics steps it is meant to
+    """
+
+    def setUp(self):
+        CWD_PATH = os.getcwd()
+        config_path = os.path.join(CWD_PATH,'configs/config.yml')
+        with open(config_path, 'r') as ymlfile:
+            cfg = yaml.load(ymlfile,Loader=yaml.FullLoader)
+        cfg['num_lattice_points'] = 4
+        cfg['record_buffer_size'] = 8
+        cfg['stream_chunk_size'] = 6
+        self.cfg = cfg
+        self.path = tempfile.mkdtemp()
+        self.num_steps = 20
+        num_points = cfg['num_lattice_points'] + 1
+        # Every quantity of step i holds i, so the kept steps can be read off the arrays
+        self.steps = np.arange(self.num_steps)
+        self.height = np.repeat(self.steps[:,np.newaxis],num_points,axis=1).astype(float)
+        self.impulse = -self.height
+        self.energy = self.steps + 1.0
+        self.x_mesh = np.linspace(0,1,num_points)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def record_episode(self,recorder):
+        """
+        Records an episode of the steps of setUp, the first half one step at a time and the second
+        half as arrays, then normalizes the energy by 2
+        """
+        recorder.clear()
+        half = self.num_steps//2
+        for step in range(half):
+            recorder.record_step(step,self.height[step],self.impulse[step],self.energy[step],1)
+        recorder.record_steps(self.steps[half:],self.height[half:],self.impulse[half:],self.energy[half:],2)
+        recorder.normalize_energy(2.0)
+
+    def check_arrays(self,arrays,kept):
+        """
+        Checks that the recorded arrays hold exactly the steps kept, in order
+        """
+        np.testing.assert_array_equal(arrays['height_array'],self.height[kept].T)
+        np.testing.assert_array_equal(arrays['impulse_array'],self.impulse[kept].T)
+        np.testing.assert_allclose(arrays['energy_array'],self.energy[kept]/2.0)
+        np.testing.assert_array_equal(arrays['code_array'],np.where(kept < self.num_steps//2,1,2))
+
+    def test_record_modes(self):
+        """
+        Tests that make_recorder builds the recorder of each record_mode, and that each keeps the steps
+        it should for every record_every
+        """
+        expected_types = {'none':TrajectoryRecorder,'full':FullTrajectoryRecorder,
+                          'ring':RingTrajectoryRecorder,'stream':StreamingTrajectoryRecorder}
+        for record_every in [1,3]:
+            kept = self.steps[self.steps % record_every == 0]
+            for record_mode in sorted(expected_types):
+                with self.subTest(record_mode=record_mode,record_every=record_every):
+                    config = dict(self.cfg,record_mode=record_mode,record_every=record_every,
+                                  record_path=os.path.join(self.path,'stream'))
+                    recorder = make_recorder(config,self.x_mesh)
+                    self.assertIs(type(recorder),expected_types[record_mode])
+                    self.record_episode(recorder)
+                    if record_mode == 'none':
+                        self.assertFalse(recorder.active)
+                        with self.assertRaises(ValueError):
+                            recorder.get_arrays()
+                        continue
+                    self.assertEqual(recorder.record_every,record_every)
+                    if record_mode == 'stream':
+                        with self.assertRaises(ValueError):
+                            recorder.get_arrays()
+                        recorder.save(config['record_path'],self.x_mesh)
+                        reader = RolloutReader(config['record_path'])
+                        self.check_arrays({key:np.asarray(reader[key]) for key in
+                                           ['height_array','impulse_array','energy_array','code_array']},kept)
+                        np.testing.assert_array_equal(reader['x_mesh'],self.x_mesh)
+                        reader.close()
+                    elif record_mode == 'ring':
+                        # Only the most recent steps are kept once the ring wraps
+                        self.check_arrays(recorder.get_arrays(),kept[-self.cfg['record_buffer_size']:])
+                    else:
+                        self.check_arrays(recorder.get_arrays(),kept)
+
+    def test_full_grows(self):
+        """
+        Tests that the full recorder grows past its capacity and that clear forgets the previous episode
+        """
+        recorder = FullTrajectoryRecorder(self.cfg['num_lattice_points'] + 1,3)
+        self.record_episode(recorder)
+        self.record_episode(recorder)
+        self.check_arrays(recorder.get_arrays(),self.steps)
+
+    def test_invalid_record_mode(self):
+        """
+        Tests that an unknown record_mode is rejected
+        """
+        with self.assertRaises(ValueError):
+            make_recorder(dict(self.cfg,record_mode='everything'))
+
+if __name__ == '__main__':
+    unittest.main()